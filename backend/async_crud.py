@@ -0,0 +1,191 @@
+"""Async counterparts of the crud functions used on the request hot paths.
+
+Same names, arguments and caching as in crud, but taking an AsyncSession.
+"""
+from datetime import datetime
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import crud, events, models, schemas
+from .cache import MISSING
+
+
+# Student CRUD
+async def get_student(db: AsyncSession, student_id: int):
+    return await db.get(models.Student, student_id)
+
+async def get_student_by_email(db: AsyncSession, email: str):
+    return await db.scalar(select(models.Student).where(models.Student.email == email).limit(1))
+
+async def get_student_by_student_id(db: AsyncSession, student_id: str):
+    return await db.scalar(select(models.Student).where(models.Student.student_id == student_id).limit(1))
+
+async def create_student(db: AsyncSession, student: schemas.StudentCreate, hashed_password: str):
+    # the caller hashes the password on the hashing executor
+    db_student = models.Student(
+        student_id=student.student_id,
+        name=student.name,
+        email=student.email,
+        hashed_password=hashed_password,
+    )
+    db.add(db_student)
+    await db.commit()
+    await db.refresh(db_student)
+    return db_student
+
+async def update_student_password_hash(db: AsyncSession, student_id: int, hashed_password: str) -> None:
+    await db.execute(
+        update(models.Student).where(models.Student.id == student_id).values(hashed_password=hashed_password)
+    )
+    await db.commit()
+
+# Desktop CRUD
+async def get_desktops(db: AsyncSession, skip: int = 0, limit: int | None = 100):
+    result = await db.scalars(select(models.Desktop).order_by(models.Desktop.id).offset(skip).limit(limit))
+    return result.all()
+
+async def get_desktops_by_ids(db: AsyncSession, desktop_ids: list[int]):
+    if not desktop_ids:
+        return []
+    result = await db.scalars(select(models.Desktop).where(models.Desktop.id.in_(desktop_ids)))
+    return result.all()
+
+async def get_desktop(db: AsyncSession, desktop_id: int):
+    cached = crud.desktop_cache.get(("id", desktop_id))
+    if cached is not MISSING:
+        return cached
+    since = crud.desktop_cache.generation()
+    desktop = await db.get(models.Desktop, desktop_id)
+    return crud.cache_desktop(desktop, since) if desktop else None
+
+async def get_desktop_by_desktop_id(db: AsyncSession, desktop_id: str):
+    pk = crud.desktop_cache.get(("code", desktop_id))
+    if pk is not MISSING:
+        cached = crud.desktop_cache.get(("id", pk))
+        if cached is not MISSING:
+            return cached
+    since = crud.desktop_cache.generation()
+    desktop = await db.scalar(select(models.Desktop).where(models.Desktop.desktop_id == desktop_id).limit(1))
+    return crud.cache_desktop(desktop, since) if desktop else None
+
+async def update_desktop_status(db: AsyncSession, desktop_id: int, status: str):
+    desktop = await db.get(models.Desktop, desktop_id)
+    if desktop:
+        previous = desktop.status
+        desktop.status = status
+        desktop.last_heartbeat = datetime.utcnow()
+        await db.commit()
+        crud.invalidate_desktop(desktop_id)
+        await db.refresh(desktop)
+        events.publish(events.DESKTOP_STATUS, desktop_id=desktop_id, status=status, previous=previous)
+    return desktop
+
+# Session CRUD
+async def get_active_session_by_student(db: AsyncSession, student_id: int):
+    session = await db.scalar(
+        select(models.Session).where(
+            models.Session.student_id == student_id,
+            models.Session.is_active == True,
+        ).limit(1)
+    )
+    if session and crud.is_session_expired(session):
+        return None
+    return session
+
+async def get_active_sessions(db: AsyncSession):
+    result = await db.scalars(select(models.Session).where(models.Session.is_active == True))
+    return [session for session in result.all() if not crud.is_session_expired(session)]
+
+async def start_session(db: AsyncSession, session: schemas.SessionCreate):
+    now = datetime.utcnow()
+    if await db.scalar(crud.claim_desktop(session.desktop_id, session.student_id, now)) is None:
+        await db.rollback()
+        return None
+    await db.execute(crud.fulfil_reservation(session.student_id, session.desktop_id))
+    db_session = models.Session(**session.model_dump(), start_time=now, is_active=True)
+    db.add(db_session)
+    await db.commit()
+    crud.session_claimed(db_session)
+    return db_session
+
+async def is_desktop_held(db: AsyncSession, desktop_id: int, student_id: int) -> bool:
+    return await db.scalar(
+        select(models.Reservation.id).where(
+            models.Reservation.desktop_id == desktop_id,
+            models.Reservation.status == "offered",
+            models.Reservation.hold_expires_at > datetime.utcnow(),
+            models.Reservation.student_id != student_id,
+        ).limit(1)
+    ) is not None
+
+async def end_session(db: AsyncSession, session_id: int):
+    now = datetime.utcnow()
+    ended = (await db.execute(crud.close_session(session_id, now))).first()
+    freed = False
+    if ended is not None and ended.desktop_id is not None:
+        freed = await db.scalar(crud.release_desktop(ended.desktop_id, now)) is not None
+    await db.commit()
+    if ended is not None:
+        crud.session_released(session_id, ended.desktop_id, freed)
+    return await db.get(models.Session, session_id, populate_existing=True)
+
+async def get_session(db: AsyncSession, session_id: int):
+    return await db.get(models.Session, session_id)
+
+# Analytics
+async def get_session_totals(db: AsyncSession):
+    total, active = (await db.execute(
+        select(
+            func.count(models.Session.id),
+            func.coalesce(func.sum(case((models.Session.is_active == True, 1), else_=0)), 0),
+        )
+    )).one()
+    return {"total": total, "active": active}
+
+async def get_desktop_stats(db: AsyncSession):
+    stats = {"total": 0, "available": 0, "busy": 0, "offline": 0, "maintenance": 0}
+    rows = await db.execute(
+        select(models.Desktop.status, func.count(models.Desktop.id)).group_by(models.Desktop.status)
+    )
+    for status, count in rows:
+        stats[status] = stats.get(status, 0) + count
+        stats["total"] += count
+    return stats
+
+# Desktop Pairing
+async def get_pairing_by_device_uuid(db: AsyncSession, device_uuid: str):
+    cached = crud.pairing_cache.get(("device", device_uuid))
+    if cached is not MISSING:
+        return cached
+    since = crud.pairing_cache.generation()
+    pairing = await db.scalar(
+        select(models.DesktopPairing).where(models.DesktopPairing.device_uuid == device_uuid).limit(1)
+    )
+    return crud.cache_pairing(("device", device_uuid), pairing, since) if pairing else None
+
+async def get_pairing_by_desktop_id(db: AsyncSession, desktop_id: int):
+    cached = crud.pairing_cache.get(("desktop", desktop_id))
+    if cached is not MISSING:
+        return cached
+    since = crud.pairing_cache.generation()
+    pairing = await db.scalar(
+        select(models.DesktopPairing).where(models.DesktopPairing.desktop_id == desktop_id).limit(1)
+    )
+    return crud.cache_pairing(("desktop", desktop_id), pairing, since) if pairing else None
+
+async def upsert_pairing(db: AsyncSession, device_uuid: str, desktop_id: int):
+    pairing = await db.scalar(
+        select(models.DesktopPairing).where(models.DesktopPairing.device_uuid == device_uuid).limit(1)
+    )
+    if pairing:
+        crud.invalidate_pairing(desktop_id=pairing.desktop_id)
+        pairing.desktop_id = desktop_id
+        pairing.paired_at = datetime.utcnow()
+    else:
+        pairing = models.DesktopPairing(device_uuid=device_uuid, desktop_id=desktop_id)
+        db.add(pairing)
+    await db.commit()
+    crud.invalidate_pairing(device_uuid=device_uuid, desktop_id=desktop_id)
+    await db.refresh(pairing)
+    return pairing
@@ -1,26 +1,23 @@
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
+import os
+import time
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from . import crud, models, schemas, database
+from . import async_crud, events, database
+from .cache import MISSING, TTLCache
 
 # Secret key (should be in env file)
 SECRET_KEY = "supersecretkey" # TODO: Move to .env
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "2048"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -31,20 +28,64 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated student, detached from any database session."""
+    id: int
+    student_id: str
+    name: str
+    email: str
+    is_admin: bool
+
+# token -> student primary key, and student primary key -> Principal; the two
+# levels let a student's entry be dropped without knowing their tokens
+token_cache = TTLCache(PRINCIPAL_CACHE_MAX_ENTRIES, PRINCIPAL_CACHE_TTL_SECONDS)
+principal_cache = TTLCache(PRINCIPAL_CACHE_MAX_ENTRIES, PRINCIPAL_CACHE_TTL_SECONDS)
+
+def invalidate_principal(student_id: int) -> None:
+    principal_cache.pop(student_id)
+
+async def load_principal(student_id: int) -> Principal | None:
+    principal = principal_cache.get(student_id)
+    if principal is not MISSING:
+        return principal
+    # an admin flag changed while we read must not be cached over
+    since = principal_cache.generation()
+    async with database.AsyncSessionLocal() as db:
+        user = await async_crud.get_student(db, student_id=student_id)
+    if user is None:
+        return None
+    principal = Principal(
+        id=user.id, student_id=user.student_id, name=user.name, email=user.email, is_admin=bool(user.is_admin)
+    )
+    principal_cache.set(student_id, principal, since=since)
+    return principal
+
+def principal_cache_stats() -> dict:
+    return {"tokens": token_cache.stats(), "principals": principal_cache.stats()}
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+    student_id = token_cache.get(token)
+    if student_id is MISSING:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    user = crud.get_student(db, student_id=int(username)) # Assuming sub is student ID (PK)
+        student_id = int(username) # Assuming sub is student ID (PK)
+        # never keep a token past its own expiry
+        lifetime = payload.get("exp", 0) - time.time()
+        token_cache.set(token, student_id, ttl_seconds=min(PRINCIPAL_CACHE_TTL_SECONDS, lifetime))
+    user = await load_principal(student_id)
     if user is None:
         raise credentials_exception
     return user
+
+events.subscribe(events.STUDENT_UPDATED, invalidate_principal)
@@ -0,0 +1,81 @@
+from collections import OrderedDict
+import threading
+import time
+
+MISSING = object()
+# pop() stamps one of these slots per key, so remembering invalidations takes
+# fixed memory; keys sharing a slot only cost each other a skipped set()
+INVALIDATION_SLOTS = 4096
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ``ttl_seconds``.
+
+    A read-through caller takes ``generation()`` before querying and passes it
+    to ``set(..., since=)``, which then skips the write if the key was popped
+    in between, so a row read before an invalidation is not cached after it.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.stale_sets = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._generation = 0
+        self._popped_at = [0] * INVALIDATION_SLOTS
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def generation(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def set(self, key, value, ttl_seconds: float | None = None, since: int | None = None) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        if self.max_entries <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            if since is not None and self._popped_at[hash(key) % INVALIDATION_SLOTS] > since:
+                self.stale_sets += 1
+                return
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key) -> None:
+        with self._lock:
+            self._generation += 1
+            self._popped_at[hash(key) % INVALIDATION_SLOTS] = self._generation
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._popped_at = [self._generation] * INVALIDATION_SLOTS
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        return {
+            "size": size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_sets": self.stale_sets,
+        }
@@ -1,15 +1,16 @@
+from sqlalchemy import exists, update
 from sqlalchemy.orm import Session
-from . import models, schemas
+from . import events, models, passwords, schemas
+from .cache import MISSING, TTLCache
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
-
-pwd_context = CryptContext(schemes=["sha256_crypt"], deprecated="auto")
+import os
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return passwords.hash_password(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return passwords.verify_password(plain_password, hashed_password)
 
 # Student CRUD
 def get_student(db: Session, student_id: int):
@@ -34,136 +35,297 @@ def create_student(db: Session, student: schemas.StudentCreate):
     db.refresh(db_student)
     return db_student
 
+def update_student_password_hash(db: Session, student_id: int, hashed_password: str) -> None:
+    db.query(models.Student).filter(models.Student.id == student_id).update(
+        {models.Student.hashed_password: hashed_password}, synchronize_session=False
+    )
+    db.commit()
+
+def set_student_admin(db: Session, student_id: int, is_admin: bool):
+    student = get_student(db, student_id)
+    if student:
+        student.is_admin = is_admin
+        db.commit()
+        db.refresh(student)
+        events.publish(events.STUDENT_UPDATED, student_id=student.id)
+    return student
+
+# Read-through caches for the point lookups on the session and pairing paths.
+# Entries are frozen copies, never ORM objects, and are dropped on every write;
+# the TTL bounds staleness from writers in other processes.
+LOOKUP_CACHE_MAX_ENTRIES = int(os.getenv("LOOKUP_CACHE_MAX_ENTRIES", "4096"))
+LOOKUP_CACHE_TTL_SECONDS = float(os.getenv("LOOKUP_CACHE_TTL_SECONDS", "30"))
+
+@dataclass(frozen=True)
+class CachedDesktop:
+    id: int
+    desktop_id: str
+    ip_address: str | None
+    mac_address: str | None
+    status: str | None
+    last_heartbeat: datetime | None
+
+@dataclass(frozen=True)
+class CachedPairing:
+    id: int
+    device_uuid: str
+    desktop_id: int
+    paired_at: datetime | None
+
+desktop_cache = TTLCache(LOOKUP_CACHE_MAX_ENTRIES, LOOKUP_CACHE_TTL_SECONDS)  # ("id", pk) / ("code", desktop code) -> pk
+pairing_cache = TTLCache(LOOKUP_CACHE_MAX_ENTRIES, LOOKUP_CACHE_TTL_SECONDS)  # ("device", uuid) / ("desktop", pk)
+
+# since is desktop_cache.generation() from before the row was read
+def cache_desktop(desktop: models.Desktop, since: int | None = None) -> CachedDesktop:
+    cached = CachedDesktop(
+        id=desktop.id,
+        desktop_id=desktop.desktop_id,
+        ip_address=desktop.ip_address,
+        mac_address=desktop.mac_address,
+        status=desktop.status,
+        last_heartbeat=desktop.last_heartbeat,
+    )
+    desktop_cache.set(("id", desktop.id), cached, since=since)
+    desktop_cache.set(("code", desktop.desktop_id), desktop.id, since=since)
+    return cached
+
+def cache_pairing(key, pairing: models.DesktopPairing, since: int | None = None) -> CachedPairing:
+    cached = CachedPairing(
+        id=pairing.id,
+        device_uuid=pairing.device_uuid,
+        desktop_id=pairing.desktop_id,
+        paired_at=pairing.paired_at,
+    )
+    pairing_cache.set(key, cached, since=since)
+    return cached
+
+def invalidate_desktop(desktop_id: int, **_) -> None:
+    # ("code", ...) entries only hold the primary key and resolve through ("id", ...)
+    desktop_cache.pop(("id", desktop_id))
+
+def invalidate_pairing(device_uuid: str | None = None, desktop_id: int | None = None) -> None:
+    if device_uuid is not None:
+        pairing_cache.pop(("device", device_uuid))
+    if desktop_id is not None:
+        pairing_cache.pop(("desktop", desktop_id))
+
+def lookup_cache_stats() -> dict:
+    return {"desktops": desktop_cache.stats(), "pairings": pairing_cache.stats()}
+
 # Desktop CRUD
 def get_desktops(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Desktop).offset(skip).limit(limit).all()
 
+def get_desktops_by_ids(db: Session, desktop_ids: list[int]):
+    if not desktop_ids:
+        return []
+    return db.query(models.Desktop).filter(models.Desktop.id.in_(desktop_ids)).all()
+
 def get_desktop(db: Session, desktop_id: int):
-    return db.query(models.Desktop).filter(models.Desktop.id == desktop_id).first()
+    cached = desktop_cache.get(("id", desktop_id))
+    if cached is not MISSING:
+        return cached
+    since = desktop_cache.generation()
+    desktop = db.query(models.Desktop).filter(models.Desktop.id == desktop_id).first()
+    return cache_desktop(desktop, since) if desktop else None
 
 def get_desktop_by_desktop_id(db: Session, desktop_id: str):
-    return db.query(models.Desktop).filter(models.Desktop.desktop_id == desktop_id).first()
+    pk = desktop_cache.get(("code", desktop_id))
+    if pk is not MISSING:
+        cached = desktop_cache.get(("id", pk))
+        if cached is not MISSING:
+            return cached
+    since = desktop_cache.generation()
+    desktop = db.query(models.Desktop).filter(models.Desktop.desktop_id == desktop_id).first()
+    return cache_desktop(desktop, since) if desktop else None
 
 def create_desktop(db: Session, desktop: schemas.DesktopCreate):
     db_desktop = models.Desktop(**desktop.model_dump())
     db.add(db_desktop)
     db.commit()
     db.refresh(db_desktop)
+    events.publish(events.DESKTOP_CREATED, desktop=db_desktop)
     return db_desktop
 
 def delete_desktop(db: Session, desktop_id: int):
     desktop = db.query(models.Desktop).filter(models.Desktop.id == desktop_id).first()
     if desktop:
+        code = desktop.desktop_id
         db.delete(desktop)
         db.commit()
+        invalidate_desktop(desktop_id)
+        desktop_cache.pop(("code", code))
+        invalidate_pairing(desktop_id=desktop_id)
+        events.publish(events.DESKTOP_DELETED, desktop_id=desktop_id)
         return True
     return False
 
 def update_desktop_status(db: Session, desktop_id: int, status: str):
     desktop = db.query(models.Desktop).filter(models.Desktop.id == desktop_id).first()
     if desktop:
+        previous = desktop.status
         desktop.status = status
         desktop.last_heartbeat = datetime.utcnow()
         db.commit()
+        invalidate_desktop(desktop_id)
         db.refresh(desktop)
+        events.publish(events.DESKTOP_STATUS, desktop_id=desktop_id, status=status, previous=previous)
     return desktop
 
-def update_desktop_heartbeat(db: Session, desktop_id: int):
-    desktop = db.query(models.Desktop).filter(models.Desktop.id == desktop_id).first()
-    if desktop:
-        desktop.last_heartbeat = datetime.utcnow()
-        db.commit()
-    return desktop
+def session_deadline(session: models.Session) -> datetime:
+    return session.start_time + timedelta(minutes=session.duration_minutes or 60)
 
-def _is_session_expired(session: models.Session) -> bool:
+def is_session_expired(session: models.Session) -> bool:
     if not session or not session.start_time:
         return False
     if not session.is_active:
         return False
-    duration = session.duration_minutes or 60
-    return datetime.utcnow() >= (session.start_time + timedelta(minutes=duration))
-
-def _expire_session(db: Session, session: models.Session) -> None:
-    session.end_time = datetime.utcnow()
-    session.is_active = False
-    update_desktop_status(db, session.desktop_id, "available")
-    db.commit()
-    db.refresh(session)
+    return datetime.utcnow() >= session_deadline(session)
 
 # Session CRUD
+# Expiry is written by the expiry scheduler; reads only hide sessions whose
+# deadline passed before the scheduler got to them.
 def get_active_session_by_student(db: Session, student_id: int):
     session = db.query(models.Session).filter(
         models.Session.student_id == student_id, 
         models.Session.is_active == True
     ).first()
-    if session and _is_session_expired(session):
-        _expire_session(db, session)
+    if session and is_session_expired(session):
         return None
     return session
 
 def get_active_sessions(db: Session):
     sessions = db.query(models.Session).filter(models.Session.is_active == True).all()
-    active = []
-    for session in sessions:
-        if _is_session_expired(session):
-            _expire_session(db, session)
-        else:
-            active.append(session)
-    return active
+    return [session for session in sessions if not is_session_expired(session)]
+
+def claim_desktop(desktop_id: int, student_id: int, now: datetime):
+    # the status condition makes the claim and the availability check one
+    # statement, so of two concurrent starts only one gets the row back; a
+    # desktop held for a queued student can only be claimed by that student
+    desktops = models.Desktop.__table__
+    reservations = models.Reservation.__table__
+    held_for_other = exists().where(
+        reservations.c.desktop_id == desktop_id,
+        reservations.c.status == "offered",
+        reservations.c.hold_expires_at > now,
+        reservations.c.student_id != student_id,
+    )
+    return (
+        update(desktops)
+        .where(desktops.c.id == desktop_id, desktops.c.status == "available", ~held_for_other)
+        .values(status="busy", last_heartbeat=now)
+        .returning(desktops.c.id)
+    )
 
+def fulfil_reservation(student_id: int, desktop_id: int):
+    # starting any session takes the student out of the waitlist
+    reservations = models.Reservation.__table__
+    return (
+        update(reservations)
+        .where(reservations.c.student_id == student_id, reservations.c.status.in_(("waiting", "offered")))
+        .values(status="fulfilled", desktop_id=desktop_id)
+    )
+
+def session_claimed(db_session: models.Session) -> None:
+    invalidate_desktop(db_session.desktop_id)
+    events.publish(events.DESKTOP_STATUS, desktop_id=db_session.desktop_id, status="busy", previous="available")
+    events.publish(events.SESSION_STARTED, session=db_session)
+
+# Returns None when the desktop was not available to claim.
 def start_session(db: Session, session: schemas.SessionCreate):
-    db_session = models.Session(**session.model_dump(), start_time=datetime.utcnow(), is_active=True)
+    now = datetime.utcnow()
+    if db.scalar(claim_desktop(session.desktop_id, session.student_id, now)) is None:
+        db.rollback()
+        return None
+    db.execute(fulfil_reservation(session.student_id, session.desktop_id))
+    db_session = models.Session(**session.model_dump(), start_time=now, is_active=True)
     db.add(db_session)
-    # Update desktop status to busy
-    update_desktop_status(db, session.desktop_id, "busy")
     db.commit()
-    db.refresh(db_session)
+    session_claimed(db_session)
     return db_session
 
+def close_sessions(session_ids: list[int], now: datetime):
+    # only the call that actually ends an active session gets its desktop back
+    sessions = models.Session.__table__
+    return (
+        update(sessions)
+        .where(sessions.c.id.in_(session_ids), sessions.c.is_active == True)
+        .values(is_active=False, end_time=now)
+        .returning(sessions.c.id, sessions.c.desktop_id)
+    )
+
+def close_session(session_id: int, now: datetime):
+    return close_sessions([session_id], now)
+
+def release_desktops(desktop_ids: list[int], now: datetime):
+    # leave desktops an admin moved to maintenance alone
+    desktops = models.Desktop.__table__
+    return (
+        update(desktops)
+        .where(desktops.c.id.in_(desktop_ids), desktops.c.status == "busy")
+        .values(status="available", last_heartbeat=now)
+        .returning(desktops.c.id)
+    )
+
+def release_desktop(desktop_id: int, now: datetime):
+    return release_desktops([desktop_id], now)
+
+def session_released(session_id: int, desktop_id: int | None, freed: bool) -> None:
+    if freed:
+        invalidate_desktop(desktop_id)
+        events.publish(events.DESKTOP_STATUS, desktop_id=desktop_id, status="available", previous="busy")
+    events.publish(events.SESSION_ENDED, session_id=session_id, desktop_id=desktop_id)
+
+# Ending an already ended session changes nothing and returns it as it is.
 def end_session(db: Session, session_id: int):
-    session = db.query(models.Session).filter(models.Session.id == session_id).first()
-    if session:
-        session.end_time = datetime.utcnow()
-        session.is_active = False
-        # Update desktop status to available
-        update_desktop_status(db, session.desktop_id, "available")
-        db.commit()
-        db.refresh(session)
-    return session
+    now = datetime.utcnow()
+    ended = db.execute(close_session(session_id, now)).first()
+    freed = False
+    if ended is not None and ended.desktop_id is not None:
+        freed = db.scalar(release_desktop(ended.desktop_id, now)) is not None
+    db.commit()
+    if ended is not None:
+        session_released(session_id, ended.desktop_id, freed)
+    return db.get(models.Session, session_id, populate_existing=True)
 
 def get_session(db: Session, session_id: int):
     return db.query(models.Session).filter(models.Session.id == session_id).first()
 
-# Analytics
-def get_session_count(db: Session):
-    return db.query(models.Session).count()
-
-def get_active_session_count(db: Session):
-    return len(get_active_sessions(db))
-
-def get_desktop_stats(db: Session):
-    total = db.query(models.Desktop).count()
-    available = db.query(models.Desktop).filter(models.Desktop.status == "available").count()
-    busy = db.query(models.Desktop).filter(models.Desktop.status == "busy").count()
-    offline = db.query(models.Desktop).filter(models.Desktop.status == "offline").count()
-    return {"total": total, "available": available, "busy": busy, "offline": offline}
+def get_desktop_sessions(db: Session, desktop_id: int, skip: int = 0, limit: int = 50):
+    return db.query(models.Session).filter(
+        models.Session.desktop_id == desktop_id
+    ).order_by(models.Session.start_time.desc()).offset(skip).limit(limit).all()
 
 # Desktop Pairing
 def get_pairing_by_device_uuid(db: Session, device_uuid: str):
-    return db.query(models.DesktopPairing).filter(models.DesktopPairing.device_uuid == device_uuid).first()
+    cached = pairing_cache.get(("device", device_uuid))
+    if cached is not MISSING:
+        return cached
+    since = pairing_cache.generation()
+    pairing = db.query(models.DesktopPairing).filter(models.DesktopPairing.device_uuid == device_uuid).first()
+    return cache_pairing(("device", device_uuid), pairing, since) if pairing else None
 
 def get_pairing_by_desktop_id(db: Session, desktop_id: int):
-    return db.query(models.DesktopPairing).filter(models.DesktopPairing.desktop_id == desktop_id).first()
+    cached = pairing_cache.get(("desktop", desktop_id))
+    if cached is not MISSING:
+        return cached
+    since = pairing_cache.generation()
+    pairing = db.query(models.DesktopPairing).filter(models.DesktopPairing.desktop_id == desktop_id).first()
+    return cache_pairing(("desktop", desktop_id), pairing, since) if pairing else None
 
 def upsert_pairing(db: Session, device_uuid: str, desktop_id: int):
-    pairing = get_pairing_by_device_uuid(db, device_uuid)
+    pairing = db.query(models.DesktopPairing).filter(models.DesktopPairing.device_uuid == device_uuid).first()
     if pairing:
+        invalidate_pairing(desktop_id=pairing.desktop_id)
         pairing.desktop_id = desktop_id
         pairing.paired_at = datetime.utcnow()
     else:
         pairing = models.DesktopPairing(device_uuid=device_uuid, desktop_id=desktop_id)
         db.add(pairing)
     db.commit()
+    invalidate_pairing(device_uuid=device_uuid, desktop_id=desktop_id)
     db.refresh(pairing)
     return pairing
 
+# status changes written outside crud (heartbeat flush, sweeper, expiry) arrive as events
+events.subscribe(events.DESKTOP_STATUS, invalidate_desktop)
@@ -1,30 +1,159 @@
-from sqlalchemy import create_engine
+from dataclasses import dataclass
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-import sqlite3
-from pathlib import Path
+import os
 
-SQLITE_DATABASE_URL = "sqlite:///./sql_app.db"
+# Any SQLAlchemy URL; a server database lets several API nodes share one store.
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sql_app.db")
+# Drivers the async engine uses for each sync URL scheme, unless
+# ASYNC_DATABASE_URL names one explicitly.
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+psycopg",
+    "postgresql+psycopg2": "postgresql+psycopg",
+}
 
-engine = create_engine(
-    SQLITE_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+
+def _optional_env(name: str, default: str | None) -> str | None:
+    # an empty value means "leave the SQLite default alone"
+    value = os.getenv(name, default)
+    return value or None
+
+
+@dataclass(frozen=True)
+class SqliteSettings:
+    """Connection PRAGMAs and pool sizing; None leaves SQLite's own default."""
+    journal_mode: str | None = "WAL"
+    synchronous: str | None = "NORMAL"
+    busy_timeout_ms: int | None = 5000
+    mmap_size: int | None = 64 * 1024 * 1024
+    cache_size: int | None = -16000  # negative is KiB, so about 16 MB per connection
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30
+
+    @classmethod
+    def from_env(cls) -> "SqliteSettings":
+        def number(name, default, kind=int):
+            value = _optional_env(name, None if default is None else str(default))
+            return None if value is None else kind(value)
+
+        return cls(
+            journal_mode=_optional_env("SQLITE_JOURNAL_MODE", cls.journal_mode),
+            synchronous=_optional_env("SQLITE_SYNCHRONOUS", cls.synchronous),
+            busy_timeout_ms=number("SQLITE_BUSY_TIMEOUT_MS", cls.busy_timeout_ms),
+            mmap_size=number("SQLITE_MMAP_SIZE", cls.mmap_size),
+            cache_size=number("SQLITE_CACHE_SIZE", cls.cache_size),
+            pool_size=number("DB_POOL_SIZE", cls.pool_size),
+            max_overflow=number("DB_MAX_OVERFLOW", cls.max_overflow),
+            pool_timeout=number("DB_POOL_TIMEOUT", cls.pool_timeout, float),
+        )
+
+    def pragmas(self) -> list[str]:
+        statements = []
+        if self.busy_timeout_ms is not None:
+            # first, so the journal_mode switch below already waits on locks
+            statements.append(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        if self.journal_mode:
+            statements.append(f"PRAGMA journal_mode = {self.journal_mode}")
+        if self.synchronous:
+            statements.append(f"PRAGMA synchronous = {self.synchronous}")
+        if self.mmap_size is not None:
+            statements.append(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        if self.cache_size is not None:
+            statements.append(f"PRAGMA cache_size = {int(self.cache_size)}")
+        return statements
+
+
+def _install_pragmas(sync_engine, settings: SqliteSettings) -> None:
+    statements = settings.pragmas()
+
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+
+def create_sqlite_engine(url: str, settings: SqliteSettings):
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+        pool_timeout=settings.pool_timeout,
+    )
+    _install_pragmas(engine, settings)
+    return engine
+
+
+def create_async_sqlite_engine(url: str, settings: SqliteSettings):
+    engine = create_async_engine(
+        url,
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+        pool_timeout=settings.pool_timeout,
+    )
+    _install_pragmas(engine.sync_engine, settings)
+    return engine
+
+
+def is_sqlite(url) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def async_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.drivername)
+    if driver is None:
+        # already an async driver, e.g. postgresql+asyncpg
+        return url
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def create_db_engine(url: str, settings: SqliteSettings):
+    if is_sqlite(url):
+        return create_sqlite_engine(url, settings)
+    return create_engine(
+        url,
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+        pool_timeout=settings.pool_timeout,
+        pool_pre_ping=True,
+    )
+
+
+def create_async_db_engine(url: str, settings: SqliteSettings):
+    if is_sqlite(url):
+        return create_async_sqlite_engine(url, settings)
+    return create_async_engine(
+        url,
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+        pool_timeout=settings.pool_timeout,
+        pool_pre_ping=True,
+    )
+
+
+settings = SqliteSettings.from_env()
+
+engine = create_db_engine(DATABASE_URL, settings)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-Base = declarative_base()
+# Same database through an async driver for the async endpoints; objects stay
+# usable after commit because handlers serialise them once the session is gone.
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_url(DATABASE_URL)
 
-def ensure_schema():
-    db_path = Path("./sql_app.db")
-    if not db_path.exists():
-        return
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    cur.execute("PRAGMA table_info(sessions)")
-    columns = {row[1] for row in cur.fetchall()}
-    if "duration_minutes" not in columns:
-        cur.execute("ALTER TABLE sessions ADD COLUMN duration_minutes INTEGER DEFAULT 60")
-        conn.commit()
-    conn.close()
+async_engine = create_async_db_engine(ASYNC_DATABASE_URL, settings)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+Base = declarative_base()
 
 def get_db():
     db = SessionLocal()
@@ -32,3 +161,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
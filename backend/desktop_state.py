@@ -0,0 +1,109 @@
+from dataclasses import dataclass
+import os
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+from . import events, models
+
+# How often an unchanged, alive desktop still gets last_heartbeat written
+DESKTOP_CHECKPOINT_SECONDS = float(os.getenv("DESKTOP_CHECKPOINT_SECONDS", "60"))
+
+# Heartbeats only move desktops between these two states; busy and
+# maintenance are owned by sessions and admins.
+HEARTBEAT_TRANSITIONS = {
+    ("offline", True): "available",
+    ("available", False): "offline",
+}
+
+
+@dataclass
+class DesktopState:
+    status: str
+    last_checkpoint: float | None = None
+
+
+class DesktopStateTracker:
+    """In-memory status and liveness of every desktop, used to skip no-op heartbeat writes."""
+
+    def __init__(self, checkpoint_interval: float):
+        self.checkpoint_interval = checkpoint_interval
+        self._states: dict[int, DesktopState] = {}
+        self._lock = threading.Lock()
+        self.heartbeats = 0
+        self.status_writes = 0
+        self.checkpoint_writes = 0
+        self.unknown_heartbeats = 0
+
+    def load(self, db: Session) -> None:
+        rows = db.query(models.Desktop.id, models.Desktop.status).all()
+        with self._lock:
+            self._states = {desktop_id: DesktopState(status=status) for desktop_id, status in rows}
+
+    def observe(self, desktop_id: int, status: str, **_) -> None:
+        with self._lock:
+            state = self._states.get(desktop_id)
+            if state is None:
+                self._states[desktop_id] = DesktopState(status=status)
+            else:
+                state.status = status
+
+    def forget(self, desktop_id: int) -> None:
+        with self._lock:
+            self._states.pop(desktop_id, None)
+
+    def is_tracked(self, desktop_id: int) -> bool:
+        with self._lock:
+            return desktop_id in self._states
+
+    def heartbeat(self, desktop_id: int, connected: bool) -> tuple[str, str | None] | None:
+        """Apply a heartbeat and return ``(status, previous)`` if it needs to be written.
+
+        ``previous`` is set when the status changed and None for a plain
+        liveness checkpoint. Raises KeyError for a desktop that is not tracked.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.heartbeats += 1
+            state = self._states.get(desktop_id)
+            if state is None:
+                # never start tracking from a heartbeat: callers observe()
+                # desktops they have looked up, so arbitrary ids add nothing
+                self.unknown_heartbeats += 1
+                raise KeyError(desktop_id)
+
+            new_status = HEARTBEAT_TRANSITIONS.get((state.status, connected))
+            if new_status:
+                previous = state.status
+                state.status = new_status
+                state.last_checkpoint = now
+                self.status_writes += 1
+                return new_status, previous
+            if connected and (
+                state.last_checkpoint is None or now - state.last_checkpoint >= self.checkpoint_interval
+            ):
+                state.last_checkpoint = now
+                self.checkpoint_writes += 1
+                return state.status, None
+            return None
+
+    def metrics(self) -> dict:
+        with self._lock:
+            tracked = len(self._states)
+        written = self.status_writes + self.checkpoint_writes
+        return {
+            "tracked_desktops": tracked,
+            "heartbeats": self.heartbeats,
+            "status_writes": self.status_writes,
+            "checkpoint_writes": self.checkpoint_writes,
+            "skipped_writes": self.heartbeats - written - self.unknown_heartbeats,
+            "unknown_heartbeats": self.unknown_heartbeats,
+            "checkpoint_interval_seconds": self.checkpoint_interval,
+        }
+
+
+desktop_tracker = DesktopStateTracker(DESKTOP_CHECKPOINT_SECONDS)
+events.subscribe(events.DESKTOP_STATUS, desktop_tracker.observe)
+events.subscribe(events.DESKTOP_CREATED, lambda desktop: desktop_tracker.observe(desktop.id, desktop.status))
+events.subscribe(events.DESKTOP_DELETED, desktop_tracker.forget)
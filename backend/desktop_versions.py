@@ -0,0 +1,103 @@
+import os
+
+from sqlalchemy import func, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+
+# Changes remembered for since= queries; older cursors get the full list.
+# Baked into the triggers, so a new value only applies once they are recreated.
+DESKTOP_VERSION_LOG_SIZE = int(os.getenv("DESKTOP_VERSION_LOG_SIZE", "4096"))
+# pg_advisory_xact_lock key that makes desktop changes commit in version order
+DESKTOP_VERSION_LOCK_KEY = 5_031_408
+
+SQLITE_TRIGGERS = {
+    "desktop_changes_insert": "AFTER INSERT ON desktops",
+    "desktop_changes_status": "AFTER UPDATE OF status ON desktops WHEN OLD.status IS NOT NEW.status",
+    "desktop_changes_delete": "AFTER DELETE ON desktops",
+}
+POSTGRES_TRIGGERS = {
+    "desktop_changes_insert": "AFTER INSERT ON desktops FOR EACH ROW",
+    "desktop_changes_status": (
+        "AFTER UPDATE OF status ON desktops FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status)"
+    ),
+    "desktop_changes_delete": "AFTER DELETE ON desktops FOR EACH ROW",
+}
+
+
+class DesktopVersionLog:
+    """Change version for the desktops table, shared by every process using the database.
+
+    Triggers on ``desktops`` append to ``desktop_changes`` in the same
+    transaction as each create, delete and status change, so the version moves
+    whoever made the write: another API worker, a sweeper or a manual UPDATE.
+    Tokens are the latest version; the table keeps the last ``max_entries``
+    changes for since= queries.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+
+    def create_triggers(self, conn: Connection) -> None:
+        if conn.dialect.name == "sqlite":
+            for name, timing in SQLITE_TRIGGERS.items():
+                desktop = "OLD" if name.endswith("_delete") else "NEW"
+                conn.execute(text(
+                    f"CREATE TRIGGER IF NOT EXISTS {name} {timing} BEGIN "
+                    f"INSERT INTO desktop_changes (desktop_id, deleted) "
+                    f"VALUES ({desktop}.id, {int(desktop == 'OLD')}); "
+                    f"DELETE FROM desktop_changes WHERE version <= "
+                    f"(SELECT max(version) FROM desktop_changes) - {int(self.max_entries)}; "
+                    f"END"
+                ))
+        elif conn.dialect.name == "postgresql":
+            conn.execute(text(f"""
+                CREATE OR REPLACE FUNCTION log_desktop_change() RETURNS trigger AS $$
+                BEGIN
+                    -- taken before the version is drawn and held to commit, so a
+                    -- reader never sees version n + 1 before n
+                    PERFORM pg_advisory_xact_lock({DESKTOP_VERSION_LOCK_KEY});
+                    IF TG_OP = 'DELETE' THEN
+                        INSERT INTO desktop_changes (desktop_id, deleted) VALUES (OLD.id, true);
+                    ELSE
+                        INSERT INTO desktop_changes (desktop_id, deleted) VALUES (NEW.id, false);
+                    END IF;
+                    DELETE FROM desktop_changes
+                    WHERE version <= (SELECT max(version) FROM desktop_changes) - {int(self.max_entries)};
+                    RETURN NULL;
+                END $$ LANGUAGE plpgsql
+            """))
+            for name, timing in POSTGRES_TRIGGERS.items():
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {name} ON desktops"))
+                conn.execute(text(f"CREATE TRIGGER {name} {timing} EXECUTE FUNCTION log_desktop_change()"))
+        else:
+            raise NotImplementedError(f"no desktop change triggers for {conn.dialect.name}")
+
+    async def token(self, db: AsyncSession) -> str:
+        changes = models.DesktopChange.__table__
+        return str(await db.scalar(select(func.coalesce(func.max(changes.c.version), 0))))
+
+    async def changes_since(self, db: AsyncSession, token: str) -> tuple[str, list[int], list[int]] | None:
+        """Return ``(current token, changed ids, deleted ids)``, or None if a full resync is needed."""
+        if not token.isdigit():
+            return None
+        since = int(token)
+        changes = models.DesktopChange.__table__
+        oldest, latest = (await db.execute(select(func.min(changes.c.version), func.max(changes.c.version)))).one()
+        latest = latest or 0
+        if since > latest or (oldest is not None and since < oldest - 1):
+            return None
+        rows = await db.execute(
+            select(changes.c.desktop_id, changes.c.deleted)
+            .where(changes.c.version > since, changes.c.version <= latest)
+            .order_by(changes.c.version)
+        )
+        # the last change to each desktop decides which list it goes in
+        last = {desktop_id: deleted for desktop_id, deleted in rows.all()}
+        changed = [desktop_id for desktop_id, deleted in last.items() if not deleted]
+        deleted = [desktop_id for desktop_id, deleted in last.items() if deleted]
+        return str(latest), changed, deleted
+
+
+desktop_versions = DesktopVersionLog(DESKTOP_VERSION_LOG_SIZE)
@@ -0,0 +1,31 @@
+from collections import defaultdict
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Topics published after the corresponding change has been committed
+DESKTOP_CREATED = "desktop_created"  # desktop
+DESKTOP_DELETED = "desktop_deleted"  # desktop_id
+DESKTOP_STATUS = "desktop_status"  # desktop_id, status, previous
+STUDENT_UPDATED = "student_updated"  # student_id (primary key)
+SESSION_STARTED = "session_started"  # session
+SESSION_ENDED = "session_ended"  # session_id, desktop_id
+
+_subscribers = defaultdict(list)
+
+
+def subscribe(topic: str, callback) -> None:
+    _subscribers[topic].append(callback)
+
+
+def unsubscribe(topic: str, callback) -> None:
+    if callback in _subscribers[topic]:
+        _subscribers[topic].remove(callback)
+
+
+def publish(topic: str, **payload) -> None:
+    for callback in list(_subscribers[topic]):
+        try:
+            callback(**payload)
+        except Exception:
+            logger.exception("Subscriber %r failed for %s", callback, topic)
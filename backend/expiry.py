@@ -0,0 +1,191 @@
+from datetime import datetime
+import heapq
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+from . import crud, database, events, models
+
+logger = logging.getLogger(__name__)
+
+# Sessions started by other workers are only seen by the periodic resync
+SESSION_EXPIRY_RESYNC_SECONDS = float(os.getenv("SESSION_EXPIRY_RESYNC_SECONDS", "300"))
+SESSION_EXPIRY_BATCH_SIZE = int(os.getenv("SESSION_EXPIRY_BATCH_SIZE", "500"))
+
+
+class SessionExpiryScheduler:
+    """Ends sessions when ``start_time + duration_minutes`` passes.
+
+    Deadlines live in a min-heap keyed by time; everything that is due when
+    the thread wakes up is ended in one transaction together with freeing its
+    desktops.
+    """
+
+    def __init__(self, session_factory, resync_interval: float, batch_size: int):
+        self.session_factory = session_factory
+        self.resync_interval = resync_interval
+        self.batch_size = batch_size
+        self._heap: list[tuple[datetime, int]] = []
+        # session id -> (deadline, desktop id); heap entries not matching it are stale
+        self._scheduled: dict[int, tuple[datetime, int]] = {}
+        self._wakeup = threading.Condition()
+        self._stopping = False
+        self._thread: threading.Thread | None = None
+        self.expired = 0
+        self.batches = 0
+        self.last_batch_size = 0
+        self.last_batch_seconds = 0.0
+        self.last_lag = 0.0
+
+    def load(self, db: Session) -> None:
+        # merged into the heap rather than replacing it: a session scheduled
+        # while the query runs may not be in its result
+        with self._wakeup:
+            known = set(self._scheduled)
+        sessions = db.query(models.Session).filter(models.Session.is_active == True).all()
+        with self._wakeup:
+            active = set()
+            for session in sessions:
+                if session.start_time is None:
+                    continue
+                active.add(session.id)
+                deadline = crud.session_deadline(session)
+                if self._scheduled.get(session.id) != (deadline, session.desktop_id):
+                    self._push(session.id, deadline, session.desktop_id)
+            # scheduled before the query and no longer active: ended elsewhere
+            for session_id in known - active:
+                self._scheduled.pop(session_id, None)
+            self._wakeup.notify()
+
+    def schedule(self, session: models.Session) -> None:
+        if not session.is_active or session.start_time is None:
+            return
+        with self._wakeup:
+            self._push(session.id, crud.session_deadline(session), session.desktop_id)
+            self._wakeup.notify()
+
+    def cancel(self, session_id: int, **_) -> None:
+        with self._wakeup:
+            self._scheduled.pop(session_id, None)
+
+    def _push(self, session_id: int, deadline: datetime, desktop_id: int) -> None:
+        self._scheduled[session_id] = (deadline, desktop_id)
+        heapq.heappush(self._heap, (deadline, session_id))
+
+    def _pop_due(self, now: datetime) -> dict[int, tuple[datetime, int]]:
+        due = {}
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            deadline, session_id = heapq.heappop(self._heap)
+            entry = self._scheduled.get(session_id)
+            if entry is not None and entry[0] == deadline:
+                due[session_id] = self._scheduled.pop(session_id)
+        return due
+
+    def expire_due(self, now: datetime | None = None) -> int:
+        now = now or datetime.utcnow()
+        with self._wakeup:
+            due = self._pop_due(now)
+        if not due:
+            return 0
+
+        started = time.monotonic()
+        db = self.session_factory()
+        try:
+            ended = db.execute(crud.close_sessions(list(due), now)).all()
+            desktop_ids = sorted({desktop_id for _, desktop_id in ended if desktop_id is not None})
+            freed = set()
+            if desktop_ids:
+                freed = set(db.execute(crud.release_desktops(desktop_ids, now)).scalars().all())
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._wakeup:
+                for session_id, (deadline, desktop_id) in due.items():
+                    self._scheduled.setdefault(session_id, (deadline, desktop_id))
+                    heapq.heappush(self._heap, (deadline, session_id))
+            raise
+        finally:
+            db.close()
+
+        self.batches += 1
+        self.expired += len(ended)
+        self.last_batch_size = len(ended)
+        self.last_batch_seconds = time.monotonic() - started
+        self.last_lag = (now - min(deadline for deadline, _ in due.values())).total_seconds()
+        for session_id, desktop_id in ended:
+            crud.session_released(session_id, desktop_id, desktop_id in freed)
+            # a desktop is only freed once, even if it had several expired sessions
+            freed.discard(desktop_id)
+        return len(ended)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="session-expiry", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify()
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def _run(self) -> None:
+        next_resync = time.monotonic() + self.resync_interval
+        while True:
+            with self._wakeup:
+                if self._stopping:
+                    return
+                timeout = next_resync - time.monotonic()
+                if self._heap:
+                    until_due = (self._heap[0][0] - datetime.utcnow()).total_seconds()
+                    timeout = min(timeout, until_due)
+                if timeout > 0:
+                    self._wakeup.wait(timeout)
+                if self._stopping:
+                    return
+            try:
+                if time.monotonic() >= next_resync:
+                    next_resync = time.monotonic() + self.resync_interval
+                    db = self.session_factory()
+                    try:
+                        self.load(db)
+                    finally:
+                        db.close()
+                while self.expire_due():
+                    pass
+            except Exception:
+                logger.exception("Session expiry failed")
+                # back off instead of spinning on a failing database
+                with self._wakeup:
+                    self._wakeup.wait(1)
+
+    def metrics(self) -> dict:
+        with self._wakeup:
+            scheduled = len(self._scheduled)
+            next_deadline = self._heap[0][0] if self._heap else None
+        return {
+            "scheduled": scheduled,
+            "next_deadline": next_deadline,
+            "expired": self.expired,
+            "batches": self.batches,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_seconds": round(self.last_batch_seconds, 4),
+            "last_lag_seconds": round(self.last_lag, 3),
+        }
+
+
+session_expiry = SessionExpiryScheduler(
+    database.SessionLocal,
+    resync_interval=SESSION_EXPIRY_RESYNC_SECONDS,
+    batch_size=SESSION_EXPIRY_BATCH_SIZE,
+)
+events.subscribe(events.SESSION_STARTED, lambda session: session_expiry.schedule(session))
+events.subscribe(events.SESSION_ENDED, session_expiry.cancel)
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+
+from . import events, schemas
+
+logger = logging.getLogger(__name__)
+
+# Deltas buffered per subscriber before it is sent a fresh snapshot instead
+FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", "256"))
+FEED_KEEPALIVE_SECONDS = float(os.getenv("FEED_KEEPALIVE_SECONDS", "15"))
+
+
+class FeedSubscriber:
+    def __init__(self, size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+        self.overflowed = False
+
+
+class DesktopFeed:
+    """Fans desktop change events out to every connected stream.
+
+    Events are published from request threads and background workers; they
+    are numbered once here and handed to the event loop, which copies them
+    into each subscriber's bounded queue.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._subscribers: set[FeedSubscriber] = set()
+        self._lock = threading.Lock()
+        self.sequence = 0
+        self.published = 0
+        self.overflows = 0
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    def detach(self) -> None:
+        self._loop = None
+
+    def subscribe(self) -> FeedSubscriber:
+        subscriber = FeedSubscriber(self.queue_size)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: FeedSubscriber) -> None:
+        self._subscribers.discard(subscriber)
+
+    def publish(self, delta: dict) -> None:
+        with self._lock:
+            self.sequence += 1
+            message = dict(delta, seq=self.sequence)
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(self._fan_out, message)
+        except RuntimeError:
+            # loop shut down between the check and the call
+            pass
+
+    def _fan_out(self, message: dict) -> None:
+        self.published += 1
+        for subscriber in list(self._subscribers):
+            if subscriber.overflowed:
+                continue
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # too far behind to catch up with deltas; resync with a snapshot
+                subscriber.overflowed = True
+                self.overflows += 1
+
+    def on_desktop_status(self, desktop_id: int, status: str, previous: str | None) -> None:
+        if status != previous:
+            self.publish({"type": "status", "desktop_id": desktop_id, "status": status, "previous": previous})
+
+    def on_desktop_created(self, desktop) -> None:
+        self.publish({
+            "type": "created",
+            "desktop": schemas.Desktop.model_validate(desktop).model_dump(mode="json"),
+        })
+
+    def on_desktop_deleted(self, desktop_id: int) -> None:
+        self.publish({"type": "deleted", "desktop_id": desktop_id})
+
+    def metrics(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "sequence": self.sequence,
+            "published": self.published,
+            "overflows": self.overflows,
+        }
+
+
+def format_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+desktop_feed = DesktopFeed(FEED_QUEUE_SIZE)
+events.subscribe(events.DESKTOP_STATUS, desktop_feed.on_desktop_status)
+events.subscribe(events.DESKTOP_CREATED, desktop_feed.on_desktop_created)
+events.subscribe(events.DESKTOP_DELETED, desktop_feed.on_desktop_deleted)
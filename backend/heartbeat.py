@@ -0,0 +1,180 @@
+from dataclasses import dataclass
+from datetime import datetime
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import bindparam, update
+
+from . import database, events, models
+from .desktop_state import desktop_tracker
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_FLUSH_INTERVAL_SECONDS = float(os.getenv("HEARTBEAT_FLUSH_INTERVAL_SECONDS", "2"))
+
+
+@dataclass
+class PendingHeartbeat:
+    status: str
+    received_at: datetime
+    buffered_at: float
+    previous: str | None = None  # status before this batch, if it changed
+
+
+class HeartbeatBuffer:
+    """Coalesces agent heartbeats in memory and writes them in batched transactions.
+
+    Only the latest heartbeat per desktop is kept between flushes, so a busy
+    lab costs one UPDATE per desktop per interval instead of one transaction
+    per request.
+    """
+
+    def __init__(self, session_factory, interval: float):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._pending: dict[int, PendingHeartbeat] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.received = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+        self.rejected_changes = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.last_flush_lag = 0.0
+        self.last_flush_seconds = 0.0
+        self.last_flush_at: datetime | None = None
+
+    def record(self, desktop_id: int, status: str, previous: str | None = None) -> None:
+        heartbeat = PendingHeartbeat(
+            status=status, received_at=datetime.utcnow(), buffered_at=time.monotonic(), previous=previous
+        )
+        with self._lock:
+            earlier = self._pending.get(desktop_id)
+            if earlier is not None:
+                # last write wins, but the lag is measured from the oldest unflushed
+                # beat and a change is reported against the oldest known status
+                heartbeat.buffered_at = earlier.buffered_at
+                if earlier.previous is not None:
+                    heartbeat.previous = earlier.previous
+            self._pending[desktop_id] = heartbeat
+            self.received += 1
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+
+            started = time.monotonic()
+            table = models.Desktop.__table__
+            rows = [
+                {"b_id": desktop_id, "b_last_heartbeat": beat.received_at}
+                for desktop_id, beat in batch.items()
+            ]
+            changes = {
+                desktop_id: beat
+                for desktop_id, beat in batch.items()
+                if beat.previous is not None and beat.previous != beat.status
+            }
+            changed: list[int] = []
+            db = self.session_factory()
+            try:
+                db.execute(
+                    update(table)
+                    .where(table.c.id == bindparam("b_id"))
+                    .values(last_heartbeat=bindparam("b_last_heartbeat")),
+                    rows,
+                )
+                for desktop_id, beat in changes.items():
+                    # a session, an admin or the sweeper may have moved the desktop since the beat
+                    updated = db.execute(
+                        update(table)
+                        .where(table.c.id == desktop_id, table.c.status == beat.previous)
+                        .values(status=beat.status)
+                        .returning(table.c.id)
+                    ).scalar()
+                    if updated is not None:
+                        changed.append(desktop_id)
+                db.commit()
+            except Exception:
+                db.rollback()
+                self.failed_flushes += 1
+                # put the batch back unless a newer heartbeat arrived meanwhile
+                with self._lock:
+                    for desktop_id, beat in batch.items():
+                        self._pending.setdefault(desktop_id, beat)
+                raise
+            finally:
+                db.close()
+
+            finished = time.monotonic()
+            self.flushes += 1
+            self.flushed_rows += len(rows)
+            self.last_batch_size = len(rows)
+            self.max_batch_size = max(self.max_batch_size, len(rows))
+            self.last_flush_lag = finished - min(beat.buffered_at for beat in batch.values())
+            self.last_flush_seconds = finished - started
+            self.last_flush_at = datetime.utcnow()
+            for desktop_id in changed:
+                beat = changes[desktop_id]
+                events.publish(
+                    events.DESKTOP_STATUS, desktop_id=desktop_id, status=beat.status, previous=beat.previous
+                )
+            for desktop_id in changes.keys() - set(changed):
+                # the tracker applied the beat optimistically; make the next beat look the row up
+                desktop_tracker.forget(desktop_id)
+                self.rejected_changes += 1
+            return len(rows)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="heartbeat-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=self.interval + 5)
+            self._thread = None
+        # graceful shutdown: whatever is still buffered is the latest known state
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Final heartbeat flush failed")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Heartbeat flush failed")
+
+    def metrics(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "received": self.received,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "flushed_rows": self.flushed_rows,
+            "rejected_changes": self.rejected_changes,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size": self.max_batch_size,
+            "last_flush_lag_seconds": round(self.last_flush_lag, 3),
+            "last_flush_seconds": round(self.last_flush_seconds, 4),
+            "last_flush_at": self.last_flush_at,
+            "flush_interval_seconds": self.interval,
+        }
+
+
+heartbeat_buffer = HeartbeatBuffer(database.SessionLocal, HEARTBEAT_FLUSH_INTERVAL_SECONDS)
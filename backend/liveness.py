@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import or_, update
+
+from . import database, events, models
+from .heartbeat import heartbeat_buffer
+
+logger = logging.getLogger(__name__)
+
+LIVENESS_SWEEP_INTERVAL_SECONDS = float(os.getenv("LIVENESS_SWEEP_INTERVAL_SECONDS", "30"))
+# Must stay above DESKTOP_CHECKPOINT_SECONDS plus the heartbeat flush interval,
+# otherwise healthy desktops whose checkpoint is not due yet look silent.
+LIVENESS_STALE_SECONDS = float(os.getenv("LIVENESS_STALE_SECONDS", "180"))
+
+
+class LivenessSweeper:
+    """Marks available desktops offline once their last heartbeat is too old."""
+
+    def __init__(self, session_factory, interval: float, stale_after: float):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.stale_after = stale_after
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.sweeps = 0
+        self.total_flipped = 0
+        self.last_flipped = 0
+        self.last_sweep_seconds = 0.0
+        self.last_sweep_at: datetime | None = None
+
+    def sweep(self) -> list[int]:
+        started = time.monotonic()
+        # land buffered checkpoints first so they count as signs of life
+        heartbeat_buffer.flush()
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        desktops = models.Desktop.__table__
+        db = self.session_factory()
+        try:
+            # one statement, so only desktops it actually flipped get an event
+            desktop_ids = db.execute(
+                update(desktops)
+                .where(
+                    desktops.c.status == "available",
+                    or_(desktops.c.last_heartbeat < cutoff, desktops.c.last_heartbeat.is_(None)),
+                )
+                .values(status="offline")
+                .returning(desktops.c.id)
+            ).scalars().all()
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        for desktop_id in desktop_ids:
+            events.publish(events.DESKTOP_STATUS, desktop_id=desktop_id, status="offline", previous="available")
+        self.sweeps += 1
+        self.last_flipped = len(desktop_ids)
+        self.total_flipped += len(desktop_ids)
+        self.last_sweep_seconds = time.monotonic() - started
+        self.last_sweep_at = datetime.utcnow()
+        if desktop_ids:
+            logger.info("Marked %d silent desktops offline in %.3fs", len(desktop_ids), self.last_sweep_seconds)
+        return desktop_ids
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="liveness-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Liveness sweep failed")
+
+    def metrics(self) -> dict:
+        return {
+            "sweeps": self.sweeps,
+            "last_flipped": self.last_flipped,
+            "total_flipped": self.total_flipped,
+            "last_sweep_seconds": round(self.last_sweep_seconds, 4),
+            "last_sweep_at": self.last_sweep_at,
+            "interval_seconds": self.interval,
+            "stale_after_seconds": self.stale_after,
+        }
+
+
+liveness_sweeper = LivenessSweeper(
+    database.SessionLocal,
+    interval=LIVENESS_SWEEP_INTERVAL_SECONDS,
+    stale_after=LIVENESS_STALE_SECONDS,
+)
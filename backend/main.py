@@ -1,26 +1,71 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Header, UploadFile, File, Form
+from fastapi import FastAPI, Depends, HTTPException, status, Header, UploadFile, File, Form, Request
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
-from . import crud, models, schemas, database, auth
+from typing import List, Union
+from . import async_crud, crud, models, schemas, database, auth, migrations, ocr, ocr_jobs, occupancy, passwords, reservations, telemetry
+from .cache import MISSING
+from .desktop_state import desktop_tracker
+from .desktop_versions import desktop_versions
+from .expiry import session_expiry
+from .feed import FEED_KEEPALIVE_SECONDS, desktop_feed, format_event
+from .heartbeat import heartbeat_buffer
+from .liveness import liveness_sweeper
+from .occupancy import occupancy_rollup
+from .stats import stats_snapshot
+from .telemetry import telemetry_store
+from .ocr_cache import image_digest, ocr_cache
+from .passwords import hashing_executor
+from .reservations import reservation_queue
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
-from datetime import timedelta
-from io import BytesIO
-import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+import asyncio
 import re
-import shutil
 
-import pytesseract
-from PIL import Image, ImageOps, ImageFilter
-
-models.Base.metadata.create_all(bind=database.engine)
-database.ensure_schema()
-
-app = FastAPI(title="SDPMS API", description="Smart AI Desktop Pooling & Usage Management System")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    migrations.ensure_current(database.engine)
+    db = database.SessionLocal()
+    try:
+        desktop_tracker.load(db)
+        session_expiry.load(db)
+    finally:
+        db.close()
+    desktop_feed.attach(asyncio.get_running_loop())
+    ocr.start()
+    verification_queue.start()
+    heartbeat_buffer.start()
+    telemetry_store.start()
+    liveness_sweeper.start()
+    session_expiry.start()
+    reservation_queue.start()
+    occupancy_rollup.start()
+    yield
+    occupancy_rollup.stop()
+    reservation_queue.stop()
+    session_expiry.stop()
+    liveness_sweeper.stop()
+    telemetry_store.stop()
+    heartbeat_buffer.stop()
+    verification_queue.stop()
+    ocr.shutdown_pool()
+    hashing_executor.shutdown()
+    desktop_feed.detach()
+    await database.async_engine.dispose()
+
+app = FastAPI(
+    title="SDPMS API",
+    description="Smart AI Desktop Pooling & Usage Management System",
+    lifespan=lifespan,
+)
 
 ALLOWED_DESKTOP_STATUSES = {"offline", "available", "busy", "maintenance"}
 STUDENT_ID_PATTERN = re.compile(r"^ugr/\d{4,6}/\d{2}$", re.IGNORECASE)
-OCR_WHITELIST = "UGRugr0123456789/"
+OCR_UNAVAILABLE_DETAIL = "OCR engine not available"
+OCR_REGISTRATION_WAIT_SECONDS = 60
 
 # CORS
 app.add_middleware(
@@ -42,6 +87,7 @@ app.add_middleware(
 
 # Dependency
 get_db = database.get_db
+get_async_db = database.get_async_db
 
 # ========== AUTH ENDPOINTS ==========
 
@@ -50,61 +96,91 @@ def read_root():
     return {"message": "Welcome to SDPMS API - Smart Desktop Pooling Management System"}
 
 @app.post("/token", response_model=dict)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login_for_access_token(
+    form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)
+):
     # Try to find user by email first, then by student_id
-    user = crud.get_student_by_email(db, form_data.username)
+    user = await async_crud.get_student_by_email(db, form_data.username)
     if not user:
-        user = crud.get_student_by_student_id(db, form_data.username)
-    
+        user = await async_crud.get_student_by_student_id(db, form_data.username)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    # Verify password
-    if not crud.verify_password(form_data.password, user.hashed_password):
+    user_id, hashed_password = user.id, user.hashed_password
+
+    # Verify password on the hashing executor, upgrading outdated hashes
+    try:
+        valid, new_hash = await hashing_executor.run(
+            passwords.verify_and_update, form_data.password, hashed_password
+        )
+    except passwords.HashingBusyError as exc:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many logins in progress, try again shortly",
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        await async_crud.update_student_password_hash(db, user_id, new_hash)
     
     access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
-        data={"sub": str(user.id)}, expires_delta=access_token_expires
+        data={"sub": str(user_id)}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/me", response_model=schemas.Student)
-async def get_current_user_info(current_user: models.Student = Depends(auth.get_current_user)):
+async def get_current_user_info(current_user: auth.Principal = Depends(auth.get_current_user)):
     return current_user
 
 # ========== STUDENT ENDPOINTS ==========
 
 @app.post("/students/", response_model=schemas.Student)
-def create_student(
+async def create_student(
     student_id: str = Form(...),
     name: str = Form(...),
     email: str = Form(...),
     password: str = Form(...),
-    id_image: UploadFile = File(...),
-    db: Session = Depends(get_db),
+    id_image: UploadFile | None = File(default=None),
+    verification_job_id: str | None = Form(default=None),
+    db: AsyncSession = Depends(get_async_db),
 ):
     if not STUDENT_ID_PATTERN.match(student_id.strip()):
         raise HTTPException(status_code=400, detail="Invalid student ID format")
-    extracted_id = extract_id_from_image(id_image)
-    if not extracted_id:
-        raise HTTPException(status_code=400, detail="University ID not found in image")
-    if extracted_id.lower() != student_id.strip().lower():
+    if verification_job_id:
+        # Reuse a finished /students/verify-id job instead of running OCR again
+        job = await run_in_threadpool(verification_queue.get, verification_job_id)
+        if not job or job.student_id.lower() != student_id.strip().lower():
+            raise HTTPException(status_code=400, detail="Unknown verification job")
+        if not job.done.done():
+            raise HTTPException(status_code=409, detail="ID verification is still running")
+    elif id_image is not None:
+        job = await run_in_threadpool(submit_verification_job, student_id.strip(), await id_image.read())
+        try:
+            # shielded: timing out here must not cancel the job's own future
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job.done)), OCR_REGISTRATION_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="ID verification timed out")
+    else:
+        raise HTTPException(status_code=400, detail="University ID image required")
+    if job.status != "completed":
+        raise HTTPException(status_code=job_error_status(job), detail=job.detail)
+    if not job.matches:
         raise HTTPException(status_code=400, detail="Student ID does not match uploaded ID")
     # Check if email already exists
-    db_student = crud.get_student_by_email(db, email=email)
+    db_student = await async_crud.get_student_by_email(db, email=email)
     if db_student:
         raise HTTPException(status_code=400, detail="Email already registered")
     # Check if student_id already exists
-    db_student = crud.get_student_by_student_id(db, student_id=student_id)
+    db_student = await async_crud.get_student_by_student_id(db, student_id=student_id)
     if db_student:
         raise HTTPException(status_code=400, detail="Student ID already registered")
     student = schemas.StudentCreate(
@@ -113,117 +189,90 @@ def create_student(
         email=email,
         password=password,
     )
-    return crud.create_student(db=db, student=student)
+    try:
+        hashed_password = await hashing_executor.run(passwords.hash_password, password)
+    except passwords.HashingBusyError as exc:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many sign-ups in progress, try again shortly",
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+    return await async_crud.create_student(db, student, hashed_password)
 
-@app.post("/students/verify-id")
+@app.post("/students/verify-id", response_model=schemas.VerificationJob, status_code=202)
 def verify_student_id(
     student_id: str = Form(...),
     id_image: UploadFile = File(...),
 ):
     if not STUDENT_ID_PATTERN.match(student_id.strip()):
         raise HTTPException(status_code=400, detail="Invalid student ID format")
-    extracted_id = extract_id_from_image(id_image)
-    if not extracted_id:
-        raise HTTPException(status_code=400, detail="University ID not found in image")
-    match = extracted_id.lower() == student_id.strip().lower()
-    return {
-        "extracted_id": extracted_id,
-        "matches": match,
-    }
+    job = submit_verification_job(student_id.strip(), id_image.file.read())
+    return verification_job_response(job)
+
+@app.get("/students/verify-id/{job_id}", response_model=schemas.VerificationJob)
+def get_verification_job(job_id: str):
+    job = verification_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Verification job not found")
+    return verification_job_response(job)
+
+def submit_verification_job(student_id: str, contents: bytes) -> ocr_jobs.VerificationJob:
+    try:
+        return verification_queue.submit(student_id, contents)
+    except ocr_jobs.QueueFullError as exc:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many ID verifications in progress, try again shortly",
+            headers={"Retry-After": str(exc.retry_after)},
+        )
 
-def extract_id_from_image(upload: UploadFile) -> str | None:
-    contents = upload.file.read()
+def job_error_status(job: ocr_jobs.VerificationJob) -> int:
+    return 503 if job.detail == OCR_UNAVAILABLE_DETAIL else 400
+
+def verification_job_response(job: ocr_jobs.VerificationJob) -> schemas.VerificationJob:
+    finished = job.status == "completed"
+    return schemas.VerificationJob(
+        job_id=job.id,
+        status=job.status,
+        student_id=job.student_id,
+        extracted_id=job.extracted_id,
+        matches=job.matches if finished else None,
+        detail=job.detail,
+    )
+
+def extract_id_from_bytes(contents: bytes) -> str | None:
     if not contents:
         return None
+    digest = image_digest(contents, ocr.pipeline_tag())
+    cached = ocr_cache.get(digest)
+    if cached is not MISSING:
+        return cached
     try:
-        image = Image.open(BytesIO(contents))
-        image = ImageOps.exif_transpose(image)
-        if image.mode not in ("RGB", "L"):
-            image = image.convert("RGB")
+        image = ocr.load_id_image(contents)
     except Exception:
         return None
 
-    tesseract_cmd = resolve_tesseract_cmd()
-    if tesseract_cmd:
-        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
-    else:
-        raise HTTPException(status_code=503, detail="OCR engine not available")
-
-    ocr_configs = [
-        f"--oem 3 --psm 6 -c tessedit_char_whitelist={OCR_WHITELIST}",
-        f"--oem 3 --psm 7 -c tessedit_char_whitelist={OCR_WHITELIST}",
-        f"--oem 3 --psm 11 -c tessedit_char_whitelist={OCR_WHITELIST}",
-        f"--oem 3 --psm 12 -c tessedit_char_whitelist={OCR_WHITELIST}",
-    ]
-    candidates = []
-
     try:
-        variants = generate_image_variants(image)
-        for variant in variants:
-            for config in ocr_configs:
-                candidates.append(
-                    pytesseract.image_to_string(variant, config=config)
-                )
+        result = ocr.extract_student_id(image)
+    except ocr.OcrUnavailableError:
+        raise ocr_jobs.VerificationError(OCR_UNAVAILABLE_DETAIL)
     except Exception:
         return None
-
-    for text in candidates:
-        normalized = normalize_ocr_text(text)
-        match = re.search(r"ugr/\d{4,6}/\d{2}", normalized)
-        if match:
-            return match.group(0)
-    return None
-
-def preprocess_id_image(image: Image.Image) -> Image.Image:
-    gray = ImageOps.grayscale(image)
-    gray = ImageOps.autocontrast(gray)
-    gray = gray.filter(ImageFilter.MedianFilter(size=3))
-    gray = gray.filter(ImageFilter.UnsharpMask(radius=2, percent=150, threshold=3))
-    gray = gray.resize((gray.width * 2, gray.height * 2), Image.LANCZOS)
-    gray = gray.point(lambda x: 0 if x < 160 else 255, mode="1")
-    return gray
-
-def generate_image_variants(image: Image.Image) -> list[Image.Image]:
-    variants = []
-    for angle in (0, 90, 180, 270):
-        rotated = image.rotate(angle, expand=True)
-        variants.append(rotated)
-        variants.append(preprocess_id_image(rotated))
-    return variants
-
-def normalize_ocr_text(text: str) -> str:
-    cleaned = text.lower()
-    cleaned = cleaned.replace(" ", "")
-    cleaned = cleaned.replace("\n", "")
-    cleaned = cleaned.replace("\r", "")
-    cleaned = cleaned.replace("-", "/")
-    cleaned = cleaned.replace("\\", "/")
-    cleaned = cleaned.replace("|", "")
-    return cleaned
-
-def resolve_tesseract_cmd() -> str | None:
-    env_cmd = os.getenv("TESSERACT_CMD")
-    if env_cmd:
-        return env_cmd
-
-    path_cmd = shutil.which("tesseract")
-    if path_cmd:
-        return path_cmd
-
-    if os.name != "nt":
-        return None
-
-    candidates = [
-        r"C:\Program Files\Tesseract-OCR\tesseract.exe",
-        r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
-    ]
-    for candidate in candidates:
-        if os.path.exists(candidate):
-            return candidate
-    return None
+    if result.student_id or result.complete:
+        # a miss caused by failed attempts may read fine on the next try
+        ocr_cache.set(digest, result.student_id)
+    return result.student_id
+
+verification_queue = ocr_jobs.VerificationQueue(
+    database.SessionLocal,
+    extract=extract_id_from_bytes,
+    workers=ocr_jobs.OCR_QUEUE_WORKERS,
+    max_pending=ocr_jobs.OCR_QUEUE_MAX_PENDING,
+    job_ttl=ocr_jobs.OCR_JOB_TTL_SECONDS,
+)
 
 @app.get("/students/", response_model=List[schemas.Student])
-def read_students(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: models.Student = Depends(auth.get_current_user)):
+def read_students(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_user)):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     students = db.query(models.Student).offset(skip).limit(limit).all()
@@ -231,35 +280,100 @@ def read_students(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)
 
 # ========== DESKTOP ENDPOINTS ==========
 
-@app.get("/desktops/", response_model=List[schemas.Desktop])
-def read_desktops(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    desktops = crud.get_desktops(db, skip=skip, limit=limit)
-    return desktops
+@app.get("/desktops/", response_model=Union[List[schemas.Desktop], schemas.DesktopChanges])
+async def read_desktops(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    since: str | None = None,
+    if_none_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # read the version before the rows: a change racing the query is sent again next time
+    token = await desktop_versions.token(db)
+    response.headers["X-Desktops-Version"] = token
+    if since is not None:
+        changes = await desktop_versions.changes_since(db, since)
+        if changes is None:
+            return {"version": token, "full": True, "changed": await async_crud.get_desktops(db, limit=None), "deleted": []}
+        token, changed, deleted = changes
+        response.headers["X-Desktops-Version"] = token
+        return {"version": token, "full": False, "changed": await async_crud.get_desktops_by_ids(db, changed), "deleted": deleted}
+
+    etag = f'W/"{token}-{skip}-{limit}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag, "X-Desktops-Version": token})
+    response.headers["ETag"] = etag
+    return await async_crud.get_desktops(db, skip=skip, limit=limit)
+
+async def load_desktop_snapshot() -> list[dict]:
+    async with database.AsyncSessionLocal() as db:
+        return [
+            schemas.Desktop.model_validate(desktop).model_dump(mode="json")
+            for desktop in await async_crud.get_desktops(db, limit=None)
+        ]
+
+@app.get("/desktops/stream")
+async def stream_desktops(request: Request):
+    """Server-sent events: one ``snapshot`` of all desktops, then ``delta`` events."""
+    subscriber = desktop_feed.subscribe()
+
+    async def events():
+        try:
+            send_snapshot = True
+            while True:
+                if subscriber.overflowed:
+                    while not subscriber.queue.empty():
+                        subscriber.queue.get_nowait()
+                    subscriber.overflowed = False
+                    send_snapshot = True
+                if send_snapshot:
+                    # subscribed first, so nothing committed after this read is missed
+                    sequence = desktop_feed.sequence
+                    desktops = await load_desktop_snapshot()
+                    yield format_event("snapshot", {"seq": sequence, "desktops": desktops})
+                    send_snapshot = False
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), FEED_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_event("delta", message)
+        finally:
+            desktop_feed.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.post("/desktops/", response_model=schemas.Desktop)
-def create_desktop(desktop: schemas.DesktopCreate, db: Session = Depends(get_db), current_user: models.Student = Depends(auth.get_current_user)):
+def create_desktop(desktop: schemas.DesktopCreate, db: Session = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_user)):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     return crud.create_desktop(db=db, desktop=desktop)
 
 @app.patch("/desktops/{desktop_id}/status", response_model=schemas.Desktop)
-def update_desktop_status_endpoint(
+async def update_desktop_status_endpoint(
     desktop_id: int,
     payload: schemas.DesktopStatusUpdate,
-    db: Session = Depends(get_db),
-    current_user: models.Student = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
 ):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     if payload.status not in ALLOWED_DESKTOP_STATUSES:
         raise HTTPException(status_code=400, detail="Invalid status")
-    desktop = crud.update_desktop_status(db, desktop_id, payload.status)
+    desktop = await async_crud.update_desktop_status(db, desktop_id, payload.status)
     if not desktop:
         raise HTTPException(status_code=404, detail="Desktop not found")
     return desktop
 
 @app.delete("/desktops/{desktop_id}")
-def delete_desktop(desktop_id: int, db: Session = Depends(get_db), current_user: models.Student = Depends(auth.get_current_user)):
+def delete_desktop(desktop_id: int, db: Session = Depends(get_db), current_user: auth.Principal = Depends(auth.get_current_user)):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     success = crud.delete_desktop(db, desktop_id)
@@ -267,46 +381,90 @@ def delete_desktop(desktop_id: int, db: Session = Depends(get_db), current_user:
         raise HTTPException(status_code=404, detail="Desktop not found")
     return {"message": "Desktop deleted successfully"}
 
+@app.get("/desktops/{desktop_id}/health", response_model=schemas.HealthHistory)
+def read_desktop_health(
+    desktop_id: int,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    resolution: str = "auto",
+    db: Session = Depends(get_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(hours=1)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    resolutions = {"raw": 0, "1m": telemetry.MINUTE, "1h": telemetry.HOUR}
+    if resolution == "auto":
+        resolution_seconds = telemetry.pick_resolution(start, end)
+    elif resolution in resolutions:
+        resolution_seconds = resolutions[resolution]
+    else:
+        raise HTTPException(status_code=400, detail="resolution must be auto, raw, 1m or 1h")
+    if not crud.get_desktop(db, desktop_id):
+        raise HTTPException(status_code=404, detail="Desktop not found")
+    return {
+        "desktop_id": desktop_id,
+        "resolution_seconds": resolution_seconds,
+        "start": start,
+        "end": end,
+        "points": telemetry.query_history(db, desktop_id, start, end, resolution_seconds),
+    }
+
+@app.get("/desktops/{desktop_id}/sessions", response_model=List[schemas.Session])
+def read_desktop_sessions(
+    desktop_id: int,
+    skip: int = 0,
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if not crud.get_desktop(db, desktop_id):
+        raise HTTPException(status_code=404, detail="Desktop not found")
+    return crud.get_desktop_sessions(db, desktop_id, skip=skip, limit=min(limit, 500))
+
 # ========== SESSION ENDPOINTS ==========
 
 @app.get("/sessions/me", response_model=schemas.Session)
-def get_my_active_session(db: Session = Depends(get_db), current_user: models.Student = Depends(auth.get_current_user)):
-    session = crud.get_active_session_by_student(db, current_user.id)
+async def get_my_active_session(db: AsyncSession = Depends(get_async_db), current_user: auth.Principal = Depends(auth.get_current_user)):
+    session = await async_crud.get_active_session_by_student(db, current_user.id)
     if not session:
         raise HTTPException(status_code=404, detail="No active session")
     return session
 
 @app.get("/sessions/active", response_model=List[schemas.Session])
-def get_active_sessions(db: Session = Depends(get_db), current_user: models.Student = Depends(auth.get_current_user)):
+async def get_active_sessions(db: AsyncSession = Depends(get_async_db), current_user: auth.Principal = Depends(auth.get_current_user)):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
-    return crud.get_active_sessions(db)
+    return await async_crud.get_active_sessions(db)
 
 @app.post("/sessions/start", response_model=schemas.Session)
-def start_session_endpoint(
+async def start_session_endpoint(
     desktop_id: int,
     duration_minutes: int = 60,
-    db: Session = Depends(get_db),
-    current_user: models.Student = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
     device_id: str | None = Header(default=None, alias="X-Device-Id")
 ):
     # Check if user already has an active session
-    existing_session = crud.get_active_session_by_student(db, current_user.id)
+    existing_session = await async_crud.get_active_session_by_student(db, current_user.id)
     if existing_session:
         raise HTTPException(status_code=400, detail="You already have an active session")
     
     # Check if desktop is available
-    desktop = crud.get_desktop(db, desktop_id)
+    desktop = await async_crud.get_desktop(db, desktop_id)
     if not desktop:
         raise HTTPException(status_code=404, detail="Desktop not found")
     if not current_user.is_admin:
         if not device_id:
             raise HTTPException(status_code=400, detail="Device ID required")
-        pairing = crud.get_pairing_by_device_uuid(db, device_id)
+        pairing = await async_crud.get_pairing_by_device_uuid(db, device_id)
         if not pairing or pairing.desktop_id != desktop.id:
             raise HTTPException(status_code=403, detail="Desktop not paired to this device")
-    if desktop.status != "available":
-        raise HTTPException(status_code=400, detail="Desktop is not available")
     
     if duration_minutes < 15 or duration_minutes > 240:
         raise HTTPException(status_code=400, detail="Duration must be between 15 and 240 minutes")
@@ -316,21 +474,27 @@ def start_session_endpoint(
         desktop_id=desktop_id,
         duration_minutes=duration_minutes
     )
-    return crud.start_session(db=db, session=session_data)
+    # availability is checked by the claim itself, not by the read above
+    session = await async_crud.start_session(db=db, session=session_data)
+    if session is None:
+        if await async_crud.is_desktop_held(db, desktop_id, current_user.id):
+            raise HTTPException(status_code=400, detail="Desktop is held for the next student in the queue")
+        raise HTTPException(status_code=400, detail="Desktop is not available")
+    return session
 
 # ========== PAIRING ENDPOINTS ==========
 
 @app.post("/pairings/register", response_model=schemas.DesktopPairing)
-def register_pairing(payload: schemas.DesktopPairingCreate, db: Session = Depends(get_db)):
-    desktop = crud.get_desktop_by_desktop_id(db, payload.desktop_id)
+async def register_pairing(payload: schemas.DesktopPairingCreate, db: AsyncSession = Depends(get_async_db)):
+    desktop = await async_crud.get_desktop_by_desktop_id(db, payload.desktop_id)
     if not desktop:
         raise HTTPException(status_code=404, detail="Desktop ID not found")
 
-    existing_by_desktop = crud.get_pairing_by_desktop_id(db, desktop.id)
+    existing_by_desktop = await async_crud.get_pairing_by_desktop_id(db, desktop.id)
     if existing_by_desktop and existing_by_desktop.device_uuid != payload.device_uuid:
         raise HTTPException(status_code=409, detail="Desktop already paired")
 
-    pairing = crud.upsert_pairing(db, payload.device_uuid, desktop.id)
+    pairing = await async_crud.upsert_pairing(db, payload.device_uuid, desktop.id)
     return schemas.DesktopPairing(
         id=pairing.id,
         device_uuid=pairing.device_uuid,
@@ -340,38 +504,177 @@ def register_pairing(payload: schemas.DesktopPairingCreate, db: Session = Depend
     )
 
 @app.post("/sessions/{session_id}/end", response_model=schemas.Session)
-def end_session_endpoint(session_id: int, db: Session = Depends(get_db), current_user: models.Student = Depends(auth.get_current_user)):
-    session = crud.get_session(db, session_id)
+async def end_session_endpoint(session_id: int, db: AsyncSession = Depends(get_async_db), current_user: auth.Principal = Depends(auth.get_current_user)):
+    session = await async_crud.get_session(db, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     if session.student_id != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized to end this session")
-    return crud.end_session(db, session_id)
+    return await async_crud.end_session(db, session_id)
+
+# ========== RESERVATION ENDPOINTS ==========
+
+@app.post("/reservations", response_model=schemas.ReservationStatus)
+async def join_reservation_queue(
+    payload: schemas.ReservationCreate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    if await async_crud.get_active_session_by_student(db, current_user.id):
+        raise HTTPException(status_code=400, detail="You already have an active session")
+    if not await reservations.lab_desktops(db, payload.lab):
+        raise HTTPException(status_code=404, detail="Lab not found")
+    reservation = await reservations.join_queue(db, current_user.id, payload.lab)
+    return await reservations.queue_status(db, reservation)
+
+@app.get("/reservations/me", response_model=schemas.ReservationStatus)
+async def get_my_reservation(db: AsyncSession = Depends(get_async_db), current_user: auth.Principal = Depends(auth.get_current_user)):
+    reservation = await reservations.get_open_reservation(db, current_user.id)
+    if not reservation:
+        raise HTTPException(status_code=404, detail="Not in a queue")
+    return await reservations.queue_status(db, reservation)
+
+@app.delete("/reservations/me")
+async def leave_reservation_queue(db: AsyncSession = Depends(get_async_db), current_user: auth.Principal = Depends(auth.get_current_user)):
+    reservation = await reservations.get_open_reservation(db, current_user.id)
+    if not reservation or not await reservations.cancel_reservation(db, reservation.id):
+        raise HTTPException(status_code=404, detail="Not in a queue")
+    return {"message": "Left the queue"}
+
+@app.get("/reservations", response_model=List[schemas.Reservation])
+async def read_reservation_queue(
+    lab: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return await reservations.get_queue(db, lab)
+
+@app.patch("/reservations/{reservation_id}", response_model=schemas.Reservation)
+async def update_reservation(
+    reservation_id: int,
+    payload: schemas.ReservationUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    reservation = await reservations.set_priority(db, reservation_id, payload.priority)
+    if not reservation:
+        raise HTTPException(status_code=404, detail="Reservation not found")
+    return reservation
 
 # ========== ANALYTICS ENDPOINTS ==========
 
 @app.get("/analytics/stats")
-def get_stats(db: Session = Depends(get_db), current_user: models.Student = Depends(auth.get_current_user)):
+async def get_stats(db: AsyncSession = Depends(get_async_db), current_user: auth.Principal = Depends(auth.get_current_user)):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     
-    desktop_stats = crud.get_desktop_stats(db)
-    total_sessions = crud.get_session_count(db)
-    active_sessions = crud.get_active_session_count(db)
-    
+    return await stats_snapshot.get_async(db)
+
+@app.post("/analytics/stats/refresh")
+async def refresh_stats(db: AsyncSession = Depends(get_async_db), current_user: auth.Principal = Depends(auth.get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return await stats_snapshot.rebuild_async(db)
+
+def occupancy_range(start: datetime | None, end: datetime | None) -> tuple[datetime, datetime]:
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(days=7)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return start, end
+
+@app.get("/analytics/occupancy/hourly", response_model=schemas.OccupancyHistory)
+def read_hourly_occupancy(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    desktop_id: int | None = None,
+    db: Session = Depends(get_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    start, end = occupancy_range(start, end)
+    if desktop_id is not None and not crud.get_desktop(db, desktop_id):
+        raise HTTPException(status_code=404, detail="Desktop not found")
     return {
-        "desktops": desktop_stats,
-        "sessions": {
-            "total": total_sessions,
-            "active": active_sessions
-        }
+        "start": start,
+        "end": end,
+        "desktop_id": desktop_id,
+        "points": occupancy.hourly_occupancy(db, start, end, desktop_id),
     }
 
+@app.get("/analytics/occupancy/heatmap", response_model=schemas.OccupancyHeatmap)
+def read_occupancy_heatmap(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    db: Session = Depends(get_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    start, end = occupancy_range(start, end)
+    return {"start": start, "end": end, "cells": occupancy.occupancy_heatmap(db, start, end)}
+
+@app.get("/analytics/occupancy/desktops", response_model=schemas.UtilizationReport)
+def read_desktop_utilization(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    db: Session = Depends(get_db),
+    current_user: auth.Principal = Depends(auth.get_current_user),
+):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    start, end = occupancy_range(start, end)
+    return {"start": start, "end": end, "desktops": occupancy.desktop_utilization(db, start, end)}
+
 # ========== AGENT HEARTBEAT ==========
 
 @app.post("/agent/heartbeat")
-def agent_heartbeat(status_update: schemas.HealthLogCreate, db: Session = Depends(get_db)):
-    # Update desktop status
-    crud.update_desktop_status(db, status_update.desktop_id, "available" if status_update.network_status == "connected" else "offline")
+async def agent_heartbeat(status_update: schemas.HealthLogCreate, db: AsyncSession = Depends(get_async_db)):
+    desktop_id = status_update.desktop_id
+    if not desktop_tracker.is_tracked(desktop_id):
+        # possibly created by another worker
+        desktop = await async_crud.get_desktop(db, desktop_id)
+        if desktop is not None:
+            desktop_tracker.observe(desktop.id, desktop.status)
+    # Only status changes and periodic liveness checkpoints reach the database
+    try:
+        write = desktop_tracker.heartbeat(desktop_id, status_update.network_status == "connected")
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Desktop not found")
+    if write:
+        heartbeat_buffer.record(desktop_id, *write)
+    telemetry_store.record(status_update.model_dump())
     return {"status": "received"}
 
+@app.get("/agent/heartbeat/metrics")
+async def get_heartbeat_metrics(current_user: auth.Principal = Depends(auth.get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return {
+        "heartbeats": heartbeat_buffer.metrics(),
+        "desktop_state": desktop_tracker.metrics(),
+        "liveness": liveness_sweeper.metrics(),
+        "session_expiry": session_expiry.metrics(),
+        "reservations": reservation_queue.metrics(),
+        "feed": desktop_feed.metrics(),
+        "telemetry": telemetry_store.metrics(),
+    }
+
+@app.get("/cache/metrics")
+async def get_cache_metrics(current_user: auth.Principal = Depends(auth.get_current_user)):
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return {
+        **crud.lookup_cache_stats(),
+        **auth.principal_cache_stats(),
+        "ocr": ocr_cache.stats(),
+        # which (variant, config) jobs found IDs; they are submitted first
+        "ocr_job_hits": ocr.job_hit_counts(),
+        "stats": stats_snapshot.metrics(),
+        "password_hashing": hashing_executor.metrics(),
+    }
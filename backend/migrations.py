@@ -0,0 +1,195 @@
+"""Versioned schema migrations for SQLite and server databases.
+
+Startup only reads the recorded version; the steps below run when it is behind
+HEAD. A fresh database is created from the models and stamped at HEAD, a
+database from before versioning replays every step. Steps must therefore be
+idempotent and written with SQLAlchemy constructs so they run on any backend.
+
+    python -m backend.migrations current
+    python -m backend.migrations upgrade
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable
+import logging
+import os
+import sys
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from . import database, models
+from .desktop_versions import desktop_versions
+
+logger = logging.getLogger(__name__)
+
+# Apply pending migrations at startup; turn off when several nodes share a
+# server database and migrations are run once by the deploy instead.
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "1") == "1"
+# Arbitrary key for pg_advisory_xact_lock so concurrent runners queue up.
+MIGRATION_LOCK_KEY = 5_031_407
+
+schema_version = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class SchemaVersionError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+def _add_column(conn: Connection, table: str, ddl: str) -> None:
+    name = ddl.split()[0]
+    if name not in {column["name"] for column in inspect(conn).get_columns(table)}:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {ddl}"))
+
+
+def _create_index(conn: Connection, model, name: str) -> None:
+    # create_all() only adds indexes together with new tables
+    index = next(index for index in model.__table__.indexes if index.name == name)
+    index.create(conn, checkfirst=True)
+
+
+def _baseline(conn: Connection) -> None:
+    models.Base.metadata.create_all(conn)
+    # triggers are not part of the models
+    desktop_versions.create_triggers(conn)
+
+
+def _session_duration(conn: Connection) -> None:
+    _add_column(conn, "sessions", "duration_minutes INTEGER DEFAULT 60")
+
+
+def _health_log_index(conn: Connection) -> None:
+    _create_index(conn, models.HealthLog, "ix_health_logs_desktop_timestamp")
+
+
+def _liveness_and_rollup_indexes(conn: Connection) -> None:
+    _create_index(conn, models.Desktop, "ix_desktops_last_heartbeat")
+    _create_index(conn, models.Session, "ix_sessions_end_time")
+
+
+def _session_hot_path_indexes(conn: Connection) -> None:
+    for name in ("ix_sessions_student_active", "ix_sessions_active_desktop", "ix_sessions_desktop_start"):
+        _create_index(conn, models.Session, name)
+
+
+def _reservations(conn: Connection) -> None:
+    models.Reservation.__table__.create(conn, checkfirst=True)
+    for index in models.Reservation.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def _desktop_changes(conn: Connection) -> None:
+    models.DesktopChange.__table__.create(conn, checkfirst=True)
+    desktop_versions.create_triggers(conn)
+
+
+def _health_buckets(conn: Connection) -> None:
+    models.HealthBucket.__table__.create(conn, checkfirst=True)
+    for index in models.HealthBucket.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def _verification_jobs(conn: Connection) -> None:
+    models.VerificationJobState.__table__.create(conn, checkfirst=True)
+
+
+MIGRATIONS = [
+    Migration(1, "create tables", _baseline),
+    Migration(2, "sessions.duration_minutes", _session_duration),
+    Migration(3, "health_logs (desktop_id, timestamp) index", _health_log_index),
+    Migration(4, "desktops.last_heartbeat and sessions.end_time indexes", _liveness_and_rollup_indexes),
+    Migration(5, "session student, active and desktop history indexes", _session_hot_path_indexes),
+    Migration(6, "reservations", _reservations),
+    Migration(7, "desktop_changes and its triggers on desktops", _desktop_changes),
+    Migration(8, "health_buckets", _health_buckets),
+    Migration(9, "verification_jobs", _verification_jobs),
+]
+HEAD = MIGRATIONS[-1].version
+
+
+def _read_version(conn: Connection) -> int | None:
+    if not inspect(conn).has_table(schema_version.name):
+        return None
+    return conn.scalar(select(func.max(schema_version.c.version)))
+
+
+def current_version(engine: Engine) -> int | None:
+    with engine.connect() as conn:
+        return _read_version(conn)
+
+
+def _record(conn: Connection, migration: Migration) -> None:
+    conn.execute(
+        insert(schema_version).values(
+            version=migration.version, description=migration.description, applied_at=datetime.utcnow()
+        )
+    )
+
+
+def upgrade(engine: Engine, target: int = HEAD) -> int:
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        # read under the lock so a runner that waited sees the other's work
+        current = _read_version(conn)
+        if current is None:
+            fresh = not inspect(conn).has_table(models.Desktop.__tablename__)
+            schema_version.create(conn, checkfirst=True)
+            current = 0
+            if fresh:
+                # the models already are the HEAD schema
+                _baseline(conn)
+                for migration in MIGRATIONS:
+                    if migration.version <= target:
+                        _record(conn, migration)
+                logger.info("Created schema at version %s", target)
+                return target
+        for migration in MIGRATIONS:
+            if current < migration.version <= target:
+                logger.info("Applying migration %s: %s", migration.version, migration.description)
+                migration.upgrade(conn)
+                _record(conn, migration)
+                current = migration.version
+    return current
+
+
+def ensure_current(engine: Engine, auto_upgrade: bool = DB_AUTO_MIGRATE) -> int:
+    current = current_version(engine)
+    if current == HEAD:
+        return current
+    if current is not None and current > HEAD:
+        raise SchemaVersionError(f"Database schema is at version {current}, newer than this code ({HEAD})")
+    if not auto_upgrade:
+        raise SchemaVersionError(
+            f"Database schema is at version {current or 0}, expected {HEAD}; "
+            "run `python -m backend.migrations upgrade`"
+        )
+    return upgrade(engine)
+
+
+def main(argv: list[str]) -> None:
+    command = argv[0] if argv else "current"
+    if command == "upgrade":
+        print(f"schema version {upgrade(database.engine)} (head {HEAD})")
+    elif command == "current":
+        print(f"schema version {current_version(database.engine)} (head {HEAD})")
+    else:
+        raise SystemExit(f"unknown command {command!r}; expected 'current' or 'upgrade'")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main(sys.argv[1:])
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Float, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from .database import Base
 from datetime import datetime
@@ -23,12 +23,20 @@ class Desktop(Base):
     ip_address = Column(String)
     mac_address = Column(String, nullable=True)
     status = Column(String, default="offline") # offline, available, busy, maintenance
-    last_heartbeat = Column(DateTime, default=datetime.utcnow)
+    last_heartbeat = Column(DateTime, default=datetime.utcnow, index=True)
     
     sessions = relationship("Session", back_populates="desktop")
     health_logs = relationship("HealthLog", back_populates="desktop")
     pairings = relationship("DesktopPairing", back_populates="desktop")
 
+class DesktopChange(Base):
+    """One row per desktop create, delete or status change, written by triggers (see desktop_versions.py)."""
+    __tablename__ = "desktop_changes"
+
+    version = Column(Integer, primary_key=True)
+    desktop_id = Column(Integer)  # no foreign key: deletes are logged too
+    deleted = Column(Boolean, default=False)
+
 class Session(Base):
     __tablename__ = "sessions"
 
@@ -36,13 +44,27 @@ class Session(Base):
     student_id = Column(Integer, ForeignKey("students.id"))
     desktop_id = Column(Integer, ForeignKey("desktops.id"))
     start_time = Column(DateTime, default=datetime.utcnow)
-    end_time = Column(DateTime, nullable=True)
+    end_time = Column(DateTime, nullable=True, index=True)
     is_active = Column(Boolean, default=True)
     duration_minutes = Column(Integer, default=60)
     
     student = relationship("Student", back_populates="sessions")
     desktop = relationship("Desktop", back_populates="sessions")
 
+    __table_args__ = (
+        # a student's current session (/sessions/me, start checks)
+        Index("ix_sessions_student_active", "student_id", "is_active"),
+        # only the few open sessions, for the active list and per-desktop checks
+        Index(
+            "ix_sessions_active_desktop",
+            "desktop_id",
+            sqlite_where=is_active == True,
+            postgresql_where=is_active == True,
+        ),
+        # per-desktop history, newest first
+        Index("ix_sessions_desktop_start", "desktop_id", "start_time"),
+    )
+
 class HealthLog(Base):
     __tablename__ = "health_logs"
 
@@ -55,6 +77,100 @@ class HealthLog(Base):
     
     desktop = relationship("Desktop", back_populates="health_logs")
 
+    __table_args__ = (
+        Index("ix_health_logs_desktop_timestamp", "desktop_id", "timestamp"),
+    )
+
+
+class HealthBucket(Base):
+    """Rolled-up health samples for one desktop over one minute or one hour."""
+    __tablename__ = "health_buckets"
+
+    id = Column(Integer, primary_key=True, index=True)
+    desktop_id = Column(Integer, ForeignKey("desktops.id"))
+    resolution_seconds = Column(Integer)
+    bucket_start = Column(DateTime)
+    samples = Column(Integer, default=0)
+    connected = Column(Integer, default=0)
+    cpu_avg = Column(Float, default=0.0)
+    cpu_max = Column(Float, default=0.0)
+    ram_avg = Column(Float, default=0.0)
+    ram_max = Column(Float, default=0.0)
+
+    __table_args__ = (
+        UniqueConstraint("desktop_id", "resolution_seconds", "bucket_start", name="uq_health_buckets_bucket"),
+        # retention deletes by age per resolution
+        Index("ix_health_buckets_resolution_start", "resolution_seconds", "bucket_start"),
+    )
+
+
+class OccupancyHour(Base):
+    """Seconds a desktop was in use during one clock hour, folded from finished sessions."""
+    __tablename__ = "occupancy_hours"
+
+    id = Column(Integer, primary_key=True, index=True)
+    desktop_id = Column(Integer, ForeignKey("desktops.id"))
+    hour_start = Column(DateTime)
+    weekday = Column(Integer)  # 0 = Monday
+    hour_of_day = Column(Integer)
+    busy_seconds = Column(Float, default=0.0)
+    sessions_started = Column(Integer, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("desktop_id", "hour_start", name="uq_occupancy_hours_desktop_hour"),
+        Index("ix_occupancy_hours_hour_start", "hour_start"),
+    )
+
+
+class RollupWatermark(Base):
+    __tablename__ = "rollup_watermarks"
+
+    name = Column(String, primary_key=True)
+    position = Column(DateTime)
+
+
+class Reservation(Base):
+    """A student's place in a lab's waitlist, and the desktop held for them once offered."""
+    __tablename__ = "reservations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    student_id = Column(Integer, ForeignKey("students.id"))
+    lab = Column(String)  # desktop code prefix, e.g. "LIB" for LIB-001
+    priority = Column(Integer, default=100)  # lower is served first
+    status = Column(String, default="waiting")  # waiting, offered, fulfilled, expired, cancelled
+    desktop_id = Column(Integer, ForeignKey("desktops.id"), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    offered_at = Column(DateTime, nullable=True)
+    hold_expires_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # queue order within a lab
+        Index("ix_reservations_queue", "lab", "status", "priority", "created_at"),
+        # live holds, checked by every session start
+        Index("ix_reservations_desktop_status", "desktop_id", "status"),
+        # one open reservation per student
+        Index(
+            "uq_reservations_open_student",
+            "student_id",
+            unique=True,
+            sqlite_where=status.in_(("waiting", "offered")),
+            postgresql_where=status.in_(("waiting", "offered")),
+        ),
+    )
+
+
+class VerificationJobState(Base):
+    """Status of an ID verification job, readable by every API worker (see ocr_jobs.py)."""
+    __tablename__ = "verification_jobs"
+
+    id = Column(String, primary_key=True)  # uuid4 hex
+    student_id = Column(String)
+    status = Column(String, default="queued")  # queued, running, completed, failed
+    extracted_id = Column(String, nullable=True)
+    detail = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
 
 class DesktopPairing(Base):
     __tablename__ = "desktop_pairings"
@@ -0,0 +1,235 @@
+from datetime import datetime, timedelta
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import database, models
+
+logger = logging.getLogger(__name__)
+
+OCCUPANCY_ROLLUP_INTERVAL_SECONDS = float(os.getenv("OCCUPANCY_ROLLUP_INTERVAL_SECONDS", "300"))
+# end_time is stamped before the ending transaction commits; leave that much
+# room so a late commit is not skipped by the watermark
+OCCUPANCY_SETTLE_SECONDS = float(os.getenv("OCCUPANCY_SETTLE_SECONDS", "60"))
+WATERMARK_NAME = "occupancy_hours"
+EPOCH = datetime(1970, 1, 1)
+HOUR = timedelta(hours=1)
+
+
+def floor_hour(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def split_by_hour(start: datetime, end: datetime):
+    """Yield ``(hour_start, seconds)`` for each clock hour the interval touches."""
+    cursor = start
+    while cursor < end:
+        hour_start = floor_hour(cursor)
+        boundary = min(hour_start + HOUR, end)
+        yield hour_start, (boundary - cursor).total_seconds()
+        cursor = boundary
+
+
+class OccupancyRollup:
+    """Folds finished sessions into per-desktop hourly occupancy buckets."""
+
+    def __init__(self, session_factory, interval: float, settle: float):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.settle = timedelta(seconds=settle)
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.folded = 0
+        self.last_rollup_seconds = 0.0
+
+    def rollup(self, now: datetime | None = None) -> int:
+        until = (now or datetime.utcnow()) - self.settle
+        started = time.monotonic()
+        db = self.session_factory()
+        try:
+            watermark = db.get(models.RollupWatermark, WATERMARK_NAME)
+            if watermark is None:
+                watermark = models.RollupWatermark(name=WATERMARK_NAME, position=EPOCH)
+                db.add(watermark)
+            if watermark.position >= until:
+                return 0
+
+            sessions = db.query(
+                models.Session.desktop_id, models.Session.start_time, models.Session.end_time
+            ).filter(
+                models.Session.end_time >= watermark.position,
+                models.Session.end_time < until,
+                models.Session.is_active == False,
+            ).all()
+
+            # (desktop_id, hour_start) -> [busy_seconds, sessions_started]
+            buckets: dict[tuple, list] = {}
+            for desktop_id, start_time, end_time in sessions:
+                if desktop_id is None or start_time is None or end_time <= start_time:
+                    continue
+                for hour_start, seconds in split_by_hour(start_time, end_time):
+                    buckets.setdefault((desktop_id, hour_start), [0.0, 0])[0] += seconds
+                buckets[(desktop_id, floor_hour(start_time))][1] += 1
+
+            if buckets:
+                desktop_ids = {desktop_id for desktop_id, _ in buckets}
+                hours = [hour_start for _, hour_start in buckets]
+                existing = {
+                    (row.desktop_id, row.hour_start): row
+                    for row in db.query(models.OccupancyHour).filter(
+                        models.OccupancyHour.desktop_id.in_(desktop_ids),
+                        models.OccupancyHour.hour_start >= min(hours),
+                        models.OccupancyHour.hour_start <= max(hours),
+                    )
+                }
+                for (desktop_id, hour_start), (busy_seconds, started_count) in buckets.items():
+                    row = existing.get((desktop_id, hour_start))
+                    if row is None:
+                        db.add(models.OccupancyHour(
+                            desktop_id=desktop_id,
+                            hour_start=hour_start,
+                            weekday=hour_start.weekday(),
+                            hour_of_day=hour_start.hour,
+                            busy_seconds=busy_seconds,
+                            sessions_started=started_count,
+                        ))
+                    else:
+                        row.busy_seconds += busy_seconds
+                        row.sessions_started += started_count
+
+            watermark.position = until
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        self.folded += len(sessions)
+        self.last_rollup_seconds = time.monotonic() - started
+        return len(sessions)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="occupancy-rollup", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.rollup()
+            except Exception:
+                logger.exception("Occupancy rollup failed")
+            if self._stop.wait(self.interval):
+                return
+
+
+def hourly_occupancy(db: Session, start: datetime, end: datetime, desktop_id: int | None = None) -> list[dict]:
+    query = db.query(
+        models.OccupancyHour.hour_start,
+        func.sum(models.OccupancyHour.busy_seconds),
+        func.sum(models.OccupancyHour.sessions_started),
+    ).filter(
+        models.OccupancyHour.hour_start >= floor_hour(start),
+        models.OccupancyHour.hour_start < end,
+    )
+    if desktop_id is not None:
+        query = query.filter(models.OccupancyHour.desktop_id == desktop_id)
+    capacity = 3600 * (1 if desktop_id is not None else max(1, db.query(models.Desktop).count()))
+    return [
+        {
+            "hour_start": hour_start,
+            "busy_seconds": round(busy_seconds, 1),
+            "sessions_started": sessions_started,
+            "occupancy": round(busy_seconds / capacity, 4),
+        }
+        for hour_start, busy_seconds, sessions_started in query.group_by(
+            models.OccupancyHour.hour_start
+        ).order_by(models.OccupancyHour.hour_start)
+    ]
+
+
+def occupancy_heatmap(db: Session, start: datetime, end: datetime) -> list[dict]:
+    """Average occupancy per (weekday, hour of day) cell over the range."""
+    start = floor_hour(start)
+    totals = {
+        (weekday, hour_of_day): (busy_seconds, sessions_started)
+        for weekday, hour_of_day, busy_seconds, sessions_started in db.query(
+            models.OccupancyHour.weekday,
+            models.OccupancyHour.hour_of_day,
+            func.sum(models.OccupancyHour.busy_seconds),
+            func.sum(models.OccupancyHour.sessions_started),
+        ).filter(
+            models.OccupancyHour.hour_start >= start,
+            models.OccupancyHour.hour_start < end,
+        ).group_by(models.OccupancyHour.weekday, models.OccupancyHour.hour_of_day)
+    }
+
+    # how many times each weekday/hour cell occurs in the range
+    occurrences = dict.fromkeys(((weekday, hour) for weekday in range(7) for hour in range(24)), 0)
+    hours = int((end - start).total_seconds() // 3600) + (1 if (end - start) % HOUR else 0)
+    full_weeks, remainder = divmod(hours, 7 * 24)
+    for key in occurrences:
+        occurrences[key] = full_weeks
+    cursor = start + timedelta(weeks=full_weeks)
+    for _ in range(remainder):
+        occurrences[(cursor.weekday(), cursor.hour)] += 1
+        cursor += HOUR
+
+    desktops = max(1, db.query(models.Desktop).count())
+    cells = []
+    for (weekday, hour_of_day), count in occurrences.items():
+        busy_seconds, sessions_started = totals.get((weekday, hour_of_day), (0.0, 0))
+        cells.append({
+            "weekday": weekday,
+            "hour_of_day": hour_of_day,
+            "busy_seconds": round(busy_seconds, 1),
+            "sessions_started": sessions_started,
+            "occupancy": round(busy_seconds / (count * desktops * 3600), 4) if count else 0.0,
+        })
+    return cells
+
+
+def desktop_utilization(db: Session, start: datetime, end: datetime) -> list[dict]:
+    start = floor_hour(start)
+    span = (end - start).total_seconds()
+    totals = {
+        desktop_id: (busy_seconds, sessions_started)
+        for desktop_id, busy_seconds, sessions_started in db.query(
+            models.OccupancyHour.desktop_id,
+            func.sum(models.OccupancyHour.busy_seconds),
+            func.sum(models.OccupancyHour.sessions_started),
+        ).filter(
+            models.OccupancyHour.hour_start >= start,
+            models.OccupancyHour.hour_start < end,
+        ).group_by(models.OccupancyHour.desktop_id)
+    }
+    rows = []
+    for desktop_id, name in db.query(models.Desktop.id, models.Desktop.desktop_id).order_by(models.Desktop.id):
+        busy_seconds, sessions_started = totals.get(desktop_id, (0.0, 0))
+        rows.append({
+            "desktop_id": desktop_id,
+            "name": name,
+            "busy_seconds": round(busy_seconds, 1),
+            "sessions_started": sessions_started,
+            "utilization": round(busy_seconds / span, 4) if span > 0 else 0.0,
+        })
+    return rows
+
+
+occupancy_rollup = OccupancyRollup(
+    database.SessionLocal,
+    interval=OCCUPANCY_ROLLUP_INTERVAL_SECONDS,
+    settle=OCCUPANCY_SETTLE_SECONDS,
+)
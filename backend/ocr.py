@@ -0,0 +1,448 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from collections import Counter
+from dataclasses import dataclass, field
+from io import BytesIO
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+
+from PIL import Image, ImageChops, ImageOps, ImageFilter
+
+from .ocr_engine import EngineSpec, OcrConfig, resolve_engine_spec, thread_engine
+
+logger = logging.getLogger(__name__)
+
+OCR_WHITELIST = "UGRugr0123456789/"
+ID_SEARCH_PATTERN = re.compile(r"ugr/\d{4,6}/\d{2}")
+
+OCR_CONFIGS = [
+    OcrConfig("psm6", psm=6, whitelist=OCR_WHITELIST),
+    OcrConfig("psm7", psm=7, whitelist=OCR_WHITELIST),
+    OcrConfig("psm11", psm=11, whitelist=OCR_WHITELIST),
+    OcrConfig("psm12", psm=12, whitelist=OCR_WHITELIST),
+]
+
+# A single cropped line only needs the single-line page segmentation mode.
+ROI_OCR_CONFIGS = [
+    OcrConfig("psm7", psm=7, whitelist=OCR_WHITELIST),
+]
+OCR_ROI_FALLBACK = os.getenv("OCR_ROI_FALLBACK", "1") == "1"
+ROI_MAX_CANDIDATES = 6
+ROI_MIN_ROW_TRANSITIONS = 3
+ROI_MIN_COL_INK = 8
+ROI_MIN_LINE_HEIGHT = 8
+ROI_MAX_LINE_FRACTION = 0.2
+ROI_WORD_GAP = 0.6
+ROI_MIN_GLYPHS = 6
+ROI_MAX_GLYPHS = 16
+ROI_MIN_ASPECT = 3.0
+ROI_MAX_ASPECT = 16.0
+
+# Phone photos are normalised to this long side before any other processing.
+OCR_WORKING_MAX_SIDE = int(os.getenv("OCR_WORKING_MAX_SIDE", "1600"))
+OCR_UPSCALE_BELOW_SIDE = 1000
+OCR_USE_OSD = os.getenv("OCR_USE_OSD", "1") == "1"
+OSD_MIN_CONFIDENCE = 2.0
+ORIENTATION_PROBE_SIDE = 512
+ORIENTATION_PROFILE_RATIO = 1.3
+THRESHOLD_LUT = [0] * 160 + [255] * 96
+
+# Bump whenever preprocessing, ROI detection or the configs change in a way
+# that can change what an image reads as; cached results are keyed on it.
+OCR_PIPELINE_VERSION = 2
+
+# Number of worker processes used for OCR jobs. 0 runs every job inline in
+# the calling thread, which is handy for debugging and benchmarks.
+OCR_POOL_WORKERS = int(os.getenv("OCR_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+class OcrUnavailableError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class OcrAttempt:
+    variant: str
+    config: str
+    seconds: float
+    matched: bool
+    error: str | None = None
+
+
+@dataclass
+class OcrResult:
+    student_id: str | None
+    attempts: list[OcrAttempt] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def complete(self) -> bool:
+        # every attempt ran to the end; a miss is only final when none errored
+        return not any(attempt.error for attempt in self.attempts)
+
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+_engine_spec: EngineSpec | None = None
+_engine_resolved = False
+# (variant, config) -> number of times that job produced the ID. Jobs with the
+# best track record are submitted first so the early exit happens sooner.
+_job_hits: Counter = Counter()
+_job_hits_lock = threading.Lock()
+
+
+def get_engine_spec() -> EngineSpec | None:
+    global _engine_spec, _engine_resolved
+    with _pool_lock:
+        if not _engine_resolved:
+            _engine_spec = resolve_engine_spec()
+            _engine_resolved = True
+            logger.info("OCR engine: %s", _engine_spec.kind if _engine_spec else "unavailable")
+        return _engine_spec
+
+
+def pipeline_tag() -> str:
+    spec = get_engine_spec()
+    return ":".join(str(part) for part in (
+        f"v{OCR_PIPELINE_VERSION}",
+        spec.kind if spec else "none",
+        f"roi{int(OCR_ROI_FALLBACK)}",
+        f"osd{int(OCR_USE_OSD)}",
+        OCR_WORKING_MAX_SIDE,
+    ))
+
+
+def start() -> None:
+    """Resolve the OCR engine once and spawn the worker pool ahead of the first upload."""
+    spec = get_engine_spec()
+    if spec is None or OCR_POOL_WORKERS <= 0:
+        return
+    pool = _get_pool(spec)
+    for _ in range(OCR_POOL_WORKERS):
+        pool.submit(_warm_worker)
+
+
+def _init_worker(spec: EngineSpec) -> None:
+    thread_engine(spec)
+
+
+def _warm_worker() -> None:
+    pass
+
+
+def _get_pool(spec: EngineSpec) -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn avoids forking a parent that already runs server threads
+            _pool = ProcessPoolExecutor(
+                max_workers=OCR_POOL_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(spec,),
+            )
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _run_ocr_job(image: Image.Image, config: OcrConfig, spec: EngineSpec) -> tuple[str, float]:
+    engine = thread_engine(spec)
+    started = time.perf_counter()
+    text = engine.image_to_string(image, config)
+    return text, time.perf_counter() - started
+
+
+def match_student_id(text: str) -> str | None:
+    match = ID_SEARCH_PATTERN.search(normalize_ocr_text(text))
+    return match.group(0) if match else None
+
+
+def _ordered_jobs(variants: list[tuple[str, Image.Image]], configs: list[OcrConfig]) -> list[tuple[str, Image.Image, OcrConfig]]:
+    jobs = [
+        (variant_name, variant, config)
+        for variant_name, variant in variants
+        for config in configs
+    ]
+    with _job_hits_lock:
+        hits = dict(_job_hits)
+    # sorted() is stable, so jobs without history keep their natural order
+    return sorted(jobs, key=lambda job: -hits.get((job[0], job[2].name), 0))
+
+
+def _record_hit(variant_name: str, config_name: str) -> None:
+    with _job_hits_lock:
+        _job_hits[(variant_name, config_name)] += 1
+
+
+def job_hit_counts() -> dict[str, int]:
+    with _job_hits_lock:
+        return {f"{variant}:{config}": count for (variant, config), count in _job_hits.most_common()}
+
+
+def extract_student_id(image: Image.Image) -> OcrResult:
+    spec = get_engine_spec()
+    if spec is None:
+        raise OcrUnavailableError("OCR engine not available")
+
+    started = time.perf_counter()
+    variants = generate_image_variants(image, spec)
+    # Stage 1 only reads the line crops that look like an ID number; the
+    # full-card passes are kept as a fallback for cards the detector misses.
+    stages = [_ordered_jobs(generate_roi_variants(variants), ROI_OCR_CONFIGS)]
+    if OCR_ROI_FALLBACK or not stages[0]:
+        stages.append(_ordered_jobs(variants, OCR_CONFIGS))
+
+    result = OcrResult(student_id=None)
+    for jobs in stages:
+        if not jobs:
+            continue
+        stage = _run_jobs(jobs, spec)
+        result.attempts.extend(stage.attempts)
+        if stage.student_id:
+            result.student_id = stage.student_id
+            break
+    result.seconds = time.perf_counter() - started
+
+    if result.student_id:
+        winner = result.attempts[-1]
+        _record_hit(winner.variant, winner.config)
+    logger.debug(
+        "OCR finished in %.3fs after %d/%d attempts: %s",
+        result.seconds,
+        len(result.attempts),
+        sum(len(jobs) for jobs in stages),
+        ", ".join(f"{a.variant}:{a.config}={a.seconds:.3f}s" for a in result.attempts),
+    )
+    return result
+
+
+def _run_jobs(jobs, spec: EngineSpec) -> OcrResult:
+    if OCR_POOL_WORKERS > 0:
+        try:
+            return _run_jobs_in_pool(jobs, spec)
+        except BrokenProcessPool:
+            logger.warning("OCR process pool broke, falling back to inline OCR")
+            shutdown_pool()
+    return _run_jobs_inline(jobs, spec)
+
+
+def _run_jobs_inline(jobs, spec: EngineSpec) -> OcrResult:
+    result = OcrResult(student_id=None)
+    for variant_name, variant, config in jobs:
+        started = time.perf_counter()
+        try:
+            text, _ = _run_ocr_job(variant, config, spec)
+        except Exception as exc:
+            result.attempts.append(
+                OcrAttempt(variant_name, config.name, time.perf_counter() - started, False, str(exc))
+            )
+            continue
+        student_id = match_student_id(text)
+        result.attempts.append(
+            OcrAttempt(variant_name, config.name, time.perf_counter() - started, bool(student_id))
+        )
+        if student_id:
+            result.student_id = student_id
+            break
+    return result
+
+
+def _run_jobs_in_pool(jobs, spec: EngineSpec) -> OcrResult:
+    result = OcrResult(student_id=None)
+    pool = _get_pool(spec)
+    pending = {
+        pool.submit(_run_ocr_job, variant, config, spec): (variant_name, config.name)
+        for variant_name, variant, config in jobs
+    }
+    try:
+        while pending and not result.student_id:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                variant_name, config_name = pending.pop(future)
+                try:
+                    text, seconds = future.result()
+                except BrokenProcessPool:
+                    # let _run_jobs rebuild the pool and redo this batch inline
+                    raise
+                except Exception as exc:
+                    result.attempts.append(OcrAttempt(variant_name, config_name, 0.0, False, str(exc)))
+                    continue
+                student_id = match_student_id(text)
+                if student_id and not result.student_id:
+                    result.student_id = student_id
+                    # keep the winning attempt last so callers can find it
+                    result.attempts.append(OcrAttempt(variant_name, config_name, seconds, True))
+                    break
+                result.attempts.append(OcrAttempt(variant_name, config_name, seconds, False))
+    finally:
+        for future in pending:
+            future.cancel()
+    return result
+
+
+def load_id_image(contents: bytes) -> Image.Image:
+    image = Image.open(BytesIO(contents))
+    # JPEG decoders can downscale by 1/2, 1/4 or 1/8 while decoding, which
+    # avoids materialising a full 12MP frame just to shrink it afterwards.
+    image.draft("RGB", (OCR_WORKING_MAX_SIDE, OCR_WORKING_MAX_SIDE))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    return normalize_working_resolution(image)
+
+
+def normalize_working_resolution(image: Image.Image) -> Image.Image:
+    if max(image.size) <= OCR_WORKING_MAX_SIDE:
+        return image
+    image = image.copy()
+    image.thumbnail((OCR_WORKING_MAX_SIDE, OCR_WORKING_MAX_SIDE), Image.LANCZOS, reducing_gap=2.0)
+    return image
+
+
+def preprocess_id_image(image: Image.Image) -> Image.Image:
+    gray = ImageOps.grayscale(image)
+    gray = ImageOps.autocontrast(gray)
+    gray = gray.filter(ImageFilter.MedianFilter(size=3))
+    gray = gray.filter(ImageFilter.UnsharpMask(radius=2, percent=150, threshold=3))
+    # Small captures still benefit from upscaling; anything at working
+    # resolution already has enough pixels per glyph for tesseract.
+    if max(gray.size) < OCR_UPSCALE_BELOW_SIDE:
+        gray = gray.resize((gray.width * 2, gray.height * 2), Image.LANCZOS)
+    return gray.point(THRESHOLD_LUT, mode="1")
+
+
+def _profile_variance(values) -> float:
+    values = list(values)
+    mean = sum(values) / len(values)
+    return sum((value - mean) ** 2 for value in values) / len(values)
+
+
+def detect_orientation(image: Image.Image, spec: EngineSpec | None = None) -> list[int]:
+    """Return the rotations (PIL degrees, counter-clockwise) worth running OCR on."""
+    gray = ImageOps.grayscale(image)
+
+    if spec and OCR_USE_OSD:
+        try:
+            rotate, confidence = thread_engine(spec).image_to_osd(gray)
+            if confidence >= OSD_MIN_CONFIDENCE:
+                # tesseract reports the clockwise correction, PIL rotates counter-clockwise
+                return [(360 - rotate) % 360]
+        except Exception:
+            logger.debug("Orientation detection via OSD failed", exc_info=True)
+
+    small = gray.copy()
+    small.thumbnail((ORIENTATION_PROBE_SIDE, ORIENTATION_PROBE_SIDE), Image.BILINEAR)
+    # Text lines make the row profile of the edge map (mean per row) far
+    # bumpier than the column profile; edges keep large flat areas such as
+    # the photo from dominating. BOX resampling to a single column/row gives
+    # both means in C instead of walking pixels in Python.
+    edges = small.filter(ImageFilter.FIND_EDGES)
+    rows = _profile_variance(edges.resize((1, edges.height), Image.BOX).tobytes())
+    cols = _profile_variance(edges.resize((edges.width, 1), Image.BOX).tobytes())
+    if rows > cols * ORIENTATION_PROFILE_RATIO:
+        return [0, 180]
+    if cols > rows * ORIENTATION_PROFILE_RATIO:
+        return [90, 270]
+    return [0, 90, 180, 270]
+
+
+def generate_image_variants(image: Image.Image, spec: EngineSpec | None = None) -> list[tuple[str, Image.Image]]:
+    variants = []
+    for angle in detect_orientation(image, spec):
+        rotated = image.rotate(angle, expand=True) if angle else image
+        variants.append((f"rot{angle}", rotated))
+        variants.append((f"rot{angle}/prep", preprocess_id_image(rotated)))
+    return variants
+
+
+def _ink_runs(profile, min_ink: float, max_gap: int) -> list[tuple[int, int]]:
+    runs = []
+    start = None
+    last = None
+    for index, value in enumerate(profile):
+        if value < min_ink:
+            continue
+        if start is None:
+            start = index
+        elif index - last > max_gap + 1:
+            runs.append((start, last + 1))
+            start = index
+        last = index
+    if start is not None:
+        runs.append((start, last + 1))
+    return runs
+
+
+def find_id_regions(binary: Image.Image) -> list[tuple[int, int, int, int]]:
+    """Find boxes around single text lines shaped like ``ugr/NNNN/NN``.
+
+    Works on projection profiles: the row profile splits the card into text
+    lines, then each line's column profile splits it into glyphs and words.
+    A candidate word must have roughly the glyph count and aspect ratio of a
+    student ID.
+    """
+    ink = ImageOps.invert(binary.convert("L"))
+    width, height = ink.size
+    # Lines are found on horizontal ink/background transitions rather than on
+    # ink itself, so solid areas such as the photo do not swallow the text
+    # lines printed next to them.
+    transitions = ImageChops.difference(ink, ImageChops.offset(ink, 1, 0))
+    rows = transitions.resize((1, height), Image.BOX).tobytes()
+    boxes = []
+    for top, bottom in _ink_runs(rows, ROI_MIN_ROW_TRANSITIONS, max_gap=1):
+        line_height = bottom - top
+        if line_height < ROI_MIN_LINE_HEIGHT or line_height > height * ROI_MAX_LINE_FRACTION:
+            continue
+        line = ink.crop((0, top, width, bottom))
+        cols = line.resize((width, 1), Image.BOX).tobytes()
+        glyphs = _ink_runs(cols, ROI_MIN_COL_INK, max_gap=0)
+        words = []
+        for glyph in glyphs:
+            if words and glyph[0] - words[-1][-1][1] <= line_height * ROI_WORD_GAP:
+                words[-1].append(glyph)
+            else:
+                words.append([glyph])
+        for word in words:
+            left, right = word[0][0], word[-1][1]
+            aspect = (right - left) / line_height
+            if ROI_MIN_GLYPHS <= len(word) <= ROI_MAX_GLYPHS and ROI_MIN_ASPECT <= aspect <= ROI_MAX_ASPECT:
+                pad = max(4, line_height // 2)
+                boxes.append((
+                    max(0, left - pad),
+                    max(0, top - pad),
+                    min(width, right + pad),
+                    min(height, bottom + pad),
+                ))
+    return boxes[:ROI_MAX_CANDIDATES]
+
+
+def generate_roi_variants(variants: list[tuple[str, Image.Image]]) -> list[tuple[str, Image.Image]]:
+    crops = []
+    for variant_name, variant in variants:
+        if variant.mode != "1":
+            continue
+        for index, box in enumerate(find_id_regions(variant)):
+            crops.append((f"{variant_name}/roi{index}", variant.crop(box)))
+    return crops
+
+
+def normalize_ocr_text(text: str) -> str:
+    cleaned = text.lower()
+    cleaned = cleaned.replace(" ", "")
+    cleaned = cleaned.replace("\n", "")
+    cleaned = cleaned.replace("\r", "")
+    cleaned = cleaned.replace("-", "/")
+    cleaned = cleaned.replace("\\", "/")
+    cleaned = cleaned.replace("|", "")
+    return cleaned
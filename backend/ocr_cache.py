@@ -0,0 +1,140 @@
+from contextlib import contextmanager
+from pathlib import Path
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from sqlalchemy.engine import make_url
+
+from . import database
+from .cache import MISSING, TTLCache
+
+logger = logging.getLogger(__name__)
+
+OCR_CACHE_TTL_SECONDS = float(os.getenv("OCR_CACHE_TTL_SECONDS", "3600"))
+OCR_CACHE_MAX_ENTRIES = int(os.getenv("OCR_CACHE_MAX_ENTRIES", "512"))
+OCR_CACHE_DISK_MAX_ENTRIES = int(os.getenv("OCR_CACHE_DISK_MAX_ENTRIES", "10000"))
+# Unset keeps the disk tier next to a SQLite DATABASE_URL (memory only for a
+# server database); an empty string disables it.
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH")
+
+
+def default_cache_path(database_url: str) -> str | None:
+    url = make_url(database_url)
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return None
+    return str(Path(url.database).with_name("ocr_cache.db"))
+
+
+def image_digest(contents: bytes, pipeline: str = "") -> str:
+    # results from another OCR pipeline must not be reused
+    return hashlib.sha256(pipeline.encode() + b"\0" + contents).hexdigest()
+
+
+class OcrResultCache:
+    """Maps an image digest to the extracted student ID, or None when no ID was found."""
+
+    def __init__(self, path: str | None, ttl_seconds: float, max_entries: int, disk_max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.disk_max_entries = disk_max_entries
+        self.memory = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.disk_hits = 0
+        self._path = Path(path) if path else None
+        self._lock = threading.Lock()
+        # the file is created on first use, not when the module is imported
+        self._disk_ready = False
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self._path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _disk(self) -> bool:
+        with self._lock:
+            if self._path and not self._disk_ready:
+                self._init_disk()
+            return self._path is not None
+
+    def _init_disk(self) -> None:
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS ocr_results ("
+                    "digest TEXT PRIMARY KEY, student_id TEXT, "
+                    "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_ocr_results_accessed_at ON ocr_results (accessed_at)")
+        except sqlite3.Error:
+            logger.warning("OCR disk cache at %s is unavailable, using memory only", self._path, exc_info=True)
+            self._path = None
+        self._disk_ready = True
+
+    def get(self, digest: str):
+        value = self.memory.get(digest)
+        if value is not MISSING or not self._disk():
+            return value
+
+        now = time.time()
+        try:
+            with self._lock, self._connect() as conn:
+                row = conn.execute(
+                    "SELECT student_id, created_at FROM ocr_results WHERE digest = ?", (digest,)
+                ).fetchone()
+                if row is None:
+                    return MISSING
+                if row[1] + self.ttl_seconds <= now:
+                    conn.execute("DELETE FROM ocr_results WHERE digest = ?", (digest,))
+                    return MISSING
+                conn.execute("UPDATE ocr_results SET accessed_at = ? WHERE digest = ?", (now, digest))
+        except sqlite3.Error:
+            logger.warning("OCR disk cache read failed", exc_info=True)
+            return MISSING
+
+        self.disk_hits += 1
+        # only the remaining lifetime is carried over to the memory tier
+        self.memory.set(digest, row[0], ttl_seconds=row[1] + self.ttl_seconds - now)
+        return row[0]
+
+    def set(self, digest: str, student_id: str | None) -> None:
+        self.memory.set(digest, student_id)
+        if not self._disk():
+            return
+
+        now = time.time()
+        try:
+            with self._lock, self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO ocr_results (digest, student_id, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (digest, student_id, now, now),
+                )
+                conn.execute("DELETE FROM ocr_results WHERE created_at <= ?", (now - self.ttl_seconds,))
+                conn.execute(
+                    "DELETE FROM ocr_results WHERE digest IN ("
+                    "SELECT digest FROM ocr_results ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.disk_max_entries,),
+                )
+        except sqlite3.Error:
+            logger.warning("OCR disk cache write failed", exc_info=True)
+
+    def stats(self) -> dict:
+        return {
+            "memory": self.memory.stats(),
+            "disk_enabled": self._path is not None,
+            "disk_hits": self.disk_hits,
+        }
+
+
+ocr_cache = OcrResultCache(
+    path=default_cache_path(database.DATABASE_URL) if OCR_CACHE_PATH is None else OCR_CACHE_PATH,
+    ttl_seconds=OCR_CACHE_TTL_SECONDS,
+    max_entries=OCR_CACHE_MAX_ENTRIES,
+    disk_max_entries=OCR_CACHE_DISK_MAX_ENTRIES,
+)
@@ -0,0 +1,163 @@
+from dataclasses import dataclass
+import logging
+import os
+import shutil
+import threading
+
+import pytesseract
+from PIL import Image
+
+try:
+    import tesserocr
+except ImportError:  # optional, only used when the C API bindings are installed
+    tesserocr = None
+
+logger = logging.getLogger(__name__)
+
+# auto prefers the in-process tesserocr API and falls back to the tesseract CLI
+OCR_ENGINE = os.getenv("OCR_ENGINE", "auto")
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+
+
+@dataclass(frozen=True)
+class OcrConfig:
+    name: str
+    psm: int
+    whitelist: str
+    oem: int = 3
+
+    def as_args(self) -> str:
+        return f"--oem {self.oem} --psm {self.psm} -c tessedit_char_whitelist={self.whitelist}"
+
+
+@dataclass(frozen=True)
+class EngineSpec:
+    kind: str  # tesserocr or subprocess
+    tesseract_cmd: str | None = None
+
+
+class OcrEngine:
+    name = "base"
+
+    def image_to_string(self, image: Image.Image, config: OcrConfig) -> str:
+        raise NotImplementedError
+
+    def image_to_osd(self, image: Image.Image) -> tuple[int, float]:
+        """Return the clockwise rotation tesseract suggests and its confidence."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class SubprocessEngine(OcrEngine):
+    """One tesseract process per call through pytesseract, the original path."""
+
+    name = "subprocess"
+
+    def __init__(self, tesseract_cmd: str):
+        self.tesseract_cmd = tesseract_cmd
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+    def image_to_string(self, image: Image.Image, config: OcrConfig) -> str:
+        return pytesseract.image_to_string(image, lang=OCR_LANG, config=config.as_args())
+
+    def image_to_osd(self, image: Image.Image) -> tuple[int, float]:
+        osd = pytesseract.image_to_osd(image, output_type=pytesseract.Output.DICT)
+        return int(osd["rotate"]), float(osd.get("orientation_conf", 0))
+
+
+class TesserocrEngine(OcrEngine):
+    """Keeps a TessBaseAPI (and its loaded language data) alive between calls."""
+
+    name = "tesserocr"
+
+    def __init__(self):
+        self.api = tesserocr.PyTessBaseAPI(lang=OCR_LANG)
+        self._osd_api = None
+        self._whitelist = None
+
+    def image_to_string(self, image: Image.Image, config: OcrConfig) -> str:
+        if config.whitelist != self._whitelist:
+            self.api.SetVariable("tessedit_char_whitelist", config.whitelist)
+            self._whitelist = config.whitelist
+        self.api.SetPageSegMode(config.psm)
+        self.api.SetImage(image)
+        return self.api.GetUTF8Text()
+
+    def image_to_osd(self, image: Image.Image) -> tuple[int, float]:
+        if self._osd_api is None:
+            self._osd_api = tesserocr.PyTessBaseAPI(psm=tesserocr.PSM.OSD_ONLY, lang="osd")
+        self._osd_api.SetImage(image)
+        osd = self._osd_api.DetectOrientationScript()
+        if not osd:
+            raise RuntimeError("Orientation detection failed")
+        # tesserocr reports the current orientation, i.e. the counter-clockwise
+        # angle of the text; the CLI reports the clockwise correction instead.
+        return (360 - osd["orient_deg"]) % 360, float(osd["orient_conf"])
+
+    def close(self) -> None:
+        self.api.End()
+        if self._osd_api is not None:
+            self._osd_api.End()
+
+
+def resolve_tesseract_cmd() -> str | None:
+    env_cmd = os.getenv("TESSERACT_CMD")
+    if env_cmd:
+        return env_cmd
+
+    path_cmd = shutil.which("tesseract")
+    if path_cmd:
+        return path_cmd
+
+    if os.name != "nt":
+        return None
+
+    candidates = [
+        r"C:\Program Files\Tesseract-OCR\tesseract.exe",
+        r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
+    ]
+    for candidate in candidates:
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def resolve_engine_spec() -> EngineSpec | None:
+    if OCR_ENGINE in ("auto", "tesserocr") and tesserocr is not None:
+        try:
+            api = tesserocr.PyTessBaseAPI(lang=OCR_LANG)
+            api.End()
+            return EngineSpec(kind="tesserocr")
+        except Exception:
+            logger.warning("tesserocr is installed but could not load %s, using the tesseract CLI", OCR_LANG)
+    elif OCR_ENGINE == "tesserocr":
+        logger.warning("OCR_ENGINE=tesserocr but tesserocr is not installed, using the tesseract CLI")
+
+    tesseract_cmd = resolve_tesseract_cmd()
+    if tesseract_cmd:
+        return EngineSpec(kind="subprocess", tesseract_cmd=tesseract_cmd)
+    return None
+
+
+def create_engine(spec: EngineSpec) -> OcrEngine:
+    if spec.kind == "tesserocr":
+        return TesserocrEngine()
+    return SubprocessEngine(spec.tesseract_cmd)
+
+
+# Engines are not thread-safe, so every thread (and every pool process)
+# keeps its own warm instance.
+_local = threading.local()
+
+
+def thread_engine(spec: EngineSpec) -> OcrEngine:
+    engine = getattr(_local, "engine", None)
+    if engine is None or getattr(_local, "spec", None) != spec:
+        if engine is not None:
+            engine.close()
+        engine = create_engine(spec)
+        _local.engine = engine
+        _local.spec = spec
+    return engine
@@ -0,0 +1,223 @@
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+import logging
+import math
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Callable
+
+from sqlalchemy import delete, func, insert, select, update
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+OCR_QUEUE_WORKERS = int(os.getenv("OCR_QUEUE_WORKERS", "2"))
+OCR_QUEUE_MAX_PENDING = int(os.getenv("OCR_QUEUE_MAX_PENDING", "32"))
+OCR_JOB_TTL_SECONDS = float(os.getenv("OCR_JOB_TTL_SECONDS", "900"))
+JOB_FAILED_DETAIL = "ID verification failed"
+SHUTDOWN_DETAIL = "ID verification was interrupted, please try again"
+
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Verification queue is full")
+        self.retry_after = retry_after
+
+
+class VerificationError(Exception):
+    """Raised by the extract callable with a message that is safe to show clients."""
+
+
+@dataclass
+class VerificationJob:
+    id: str
+    student_id: str
+    status: str = "queued"  # queued, running, completed, failed
+    extracted_id: str | None = None
+    detail: str | None = None
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    finished_at: datetime | None = None
+    # resolved when the job finishes; async callers await it through asyncio.wrap_future
+    done: Future = field(default_factory=Future, repr=False)
+    contents: bytes | None = field(default=None, repr=False)
+
+    @property
+    def matches(self) -> bool:
+        return bool(self.extracted_id) and self.extracted_id.lower() == self.student_id.lower()
+
+
+class VerificationQueue:
+    """Runs ID verification jobs on a few worker threads.
+
+    Job state is written to ``verification_jobs`` so any API worker can
+    answer a poll or reuse a finished job; the image and the completion
+    future only exist in the process that accepted the job.
+    """
+
+    def __init__(
+        self,
+        session_factory,
+        extract: Callable[[bytes], str | None],
+        workers: int,
+        max_pending: int,
+        job_ttl: float,
+    ):
+        self.session_factory = session_factory
+        self.extract = extract
+        self.workers = max(1, workers)
+        self.job_ttl = job_ttl
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._jobs: dict[str, VerificationJob] = {}
+        self._jobs_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._avg_seconds = 5.0
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stopping.clear()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"ocr-job-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        self._stopping.set()
+        # fail what never started so its waiters and pollers get an answer
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                self._finish(job, "failed", SHUTDOWN_DETAIL)
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                # a submit raced the drain; workers see the flag after their job
+                break
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def submit(self, student_id: str, contents: bytes) -> VerificationJob:
+        self.start()
+        self._purge_expired()
+        job = VerificationJob(id=uuid.uuid4().hex, student_id=student_id, contents=contents)
+        table = models.VerificationJobState.__table__
+        # recorded before it is queued, so a worker never updates a missing row
+        self._write(insert(table).values(
+            id=job.id, student_id=job.student_id, status=job.status, created_at=job.created_at
+        ))
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._jobs_lock:
+                del self._jobs[job.id]
+            self._write(delete(table).where(table.c.id == job.id))
+            raise QueueFullError(self.retry_after())
+        return job
+
+    def get(self, job_id: str) -> VerificationJob | None:
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        # accepted by another API worker
+        table = models.VerificationJobState.__table__
+        db = self.session_factory()
+        try:
+            row = db.execute(select(table).where(table.c.id == job_id)).first()
+        finally:
+            db.close()
+        if row is None:
+            return None
+        job = VerificationJob(
+            id=row.id,
+            student_id=row.student_id,
+            status=row.status,
+            extracted_id=row.extracted_id,
+            detail=row.detail,
+            created_at=row.created_at,
+            finished_at=row.finished_at,
+        )
+        if job.finished_at is not None:
+            job.done.set_result(job.status)
+        return job
+
+    def retry_after(self) -> int:
+        waiting = self._queue.qsize() + 1
+        return max(1, math.ceil(waiting * self._avg_seconds / self.workers))
+
+    def _write(self, statement) -> None:
+        db = self.session_factory()
+        try:
+            db.execute(statement)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _purge_expired(self) -> None:
+        cutoff = datetime.utcnow() - timedelta(seconds=self.job_ttl)
+        with self._jobs_lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.finished_at is not None and job.finished_at < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        table = models.VerificationJobState.__table__
+        # unfinished rows this old belong to a worker that went away
+        self._write(delete(table).where(func.coalesce(table.c.finished_at, table.c.created_at) < cutoff))
+
+    def _finish(self, job: VerificationJob, status: str, detail: str | None = None) -> None:
+        job.status = status
+        job.detail = detail
+        job.contents = None
+        job.finished_at = datetime.utcnow()
+        table = models.VerificationJobState.__table__
+        try:
+            self._write(update(table).where(table.c.id == job.id).values(
+                status=job.status, extracted_id=job.extracted_id, detail=job.detail, finished_at=job.finished_at
+            ))
+        except Exception:
+            logger.exception("Could not record the result of verification job %s", job.id)
+        finally:
+            job.done.set_result(job.status)
+
+    def _work(self) -> None:
+        while not self._stopping.is_set():
+            job = self._queue.get()
+            if job is None:
+                return
+            job.status = "running"
+            table = models.VerificationJobState.__table__
+            started = time.perf_counter()
+            try:
+                self._write(update(table).where(table.c.id == job.id).values(status=job.status))
+                job.extracted_id = self.extract(job.contents)
+            except VerificationError as exc:
+                self._finish(job, "failed", str(exc))
+            except Exception:
+                logger.exception("Verification job %s failed", job.id)
+                self._finish(job, "failed", JOB_FAILED_DETAIL)
+            else:
+                if job.extracted_id:
+                    self._finish(job, "completed")
+                else:
+                    self._finish(job, "failed", "University ID not found in image")
+            finally:
+                elapsed = time.perf_counter() - started
+                self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * elapsed
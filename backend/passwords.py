@@ -0,0 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import threading
+
+from passlib.context import CryptContext
+
+# Scheme every existing account was hashed with before hashing was configurable
+LEGACY_SCHEME = "sha256_crypt"
+# First scheme hashes new passwords; the others are still accepted and are
+# upgraded on the next successful login. The legacy scheme is always accepted.
+PASSWORD_SCHEMES = [
+    scheme.strip() for scheme in os.getenv("PASSWORD_SCHEMES", LEGACY_SCHEME).split(",") if scheme.strip()
+]
+# Cost for the default scheme (rounds, or log2 rounds for bcrypt). Unset keeps
+# passlib's default; when set, hashes at any other cost are rehashed on login.
+PASSWORD_ROUNDS = os.getenv("PASSWORD_ROUNDS")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+# Verifications queued or running before logins are turned away with 503
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(PASSWORD_HASH_WORKERS * 8)))
+
+
+class HashingBusyError(Exception):
+    def __init__(self, retry_after: int = 1):
+        super().__init__("Password hashing is saturated")
+        self.retry_after = retry_after
+
+
+def build_context(schemes: list[str], rounds: int | None = None) -> CryptContext:
+    settings = {}
+    if rounds is not None:
+        default = schemes[0]
+        settings[f"{default}__default_rounds"] = rounds
+        settings[f"{default}__min_rounds"] = rounds
+        settings[f"{default}__max_rounds"] = rounds
+    if LEGACY_SCHEME not in schemes:
+        schemes = [*schemes, LEGACY_SCHEME]
+    return CryptContext(schemes=schemes, deprecated="auto", **settings)
+
+
+pwd_context = build_context(PASSWORD_SCHEMES, int(PASSWORD_ROUNDS) if PASSWORD_ROUNDS else None)
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(password: str, hashed_password: str | None) -> bool:
+    if not hashed_password:
+        return False
+    try:
+        return pwd_context.verify(password, hashed_password)
+    except ValueError:
+        # not a hash any configured scheme recognises
+        return False
+
+
+def verify_and_update(password: str, hashed_password: str | None) -> tuple[bool, str | None]:
+    """Return ``(valid, new_hash)``; ``new_hash`` is set when the stored hash is outdated."""
+    if not hashed_password:
+        return False, None
+    try:
+        return pwd_context.verify_and_update(password, hashed_password)
+    except ValueError:
+        return False, None
+
+
+class HashingExecutor:
+    """Runs password hashing off the event loop on a fixed number of threads."""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self._executor: ThreadPoolExecutor | None = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+            return self._executor
+
+    async def run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HashingBusyError()
+        try:
+            future = self._get_executor().submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return await asyncio.wrap_future(future)
+
+    def _release(self) -> None:
+        self.completed += 1
+        self._slots.release()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def metrics(self) -> dict:
+        return {
+            "schemes": PASSWORD_SCHEMES,
+            "rounds": int(PASSWORD_ROUNDS) if PASSWORD_ROUNDS else None,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+hashing_executor = HashingExecutor(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
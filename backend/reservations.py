@@ -0,0 +1,356 @@
+from datetime import datetime, timedelta
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import exists, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import crud, database, events, models
+
+logger = logging.getLogger(__name__)
+
+# How long a freed desktop is kept for the student at the head of the queue
+RESERVATION_HOLD_SECONDS = float(os.getenv("RESERVATION_HOLD_SECONDS", "180"))
+# Holds and offers made by other workers are only seen by the periodic pass
+RESERVATION_RESYNC_SECONDS = float(os.getenv("RESERVATION_RESYNC_SECONDS", "30"))
+RESERVATION_DEFAULT_PRIORITY = int(os.getenv("RESERVATION_DEFAULT_PRIORITY", "100"))
+OPEN_STATUSES = ("waiting", "offered")
+
+
+def lab_of(desktop_code: str) -> str:
+    # desktops are named <lab>-<number>, e.g. LIB-001
+    return desktop_code.rpartition("-")[0] or desktop_code
+
+
+def live_hold(desktop_id, now: datetime):
+    held = models.Reservation.__table__.alias("held")
+    return exists().where(
+        held.c.desktop_id == desktop_id,
+        held.c.status == "offered",
+        held.c.hold_expires_at > now,
+    )
+
+
+def offer_statement(desktop_id: int, lab: str, now: datetime, hold_seconds: float):
+    # pick the head of the lab's queue and hold the desktop for it in one
+    # statement, so concurrent passes cannot offer the same desktop twice
+    reservations = models.Reservation.__table__
+    desktops = models.Desktop.__table__
+    queued = reservations.alias("queued")
+    head = (
+        select(queued.c.id)
+        .where(queued.c.lab == lab, queued.c.status == "waiting")
+        .order_by(queued.c.priority, queued.c.created_at, queued.c.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    available = exists().where(desktops.c.id == desktop_id, desktops.c.status == "available")
+    return (
+        update(reservations)
+        .where(reservations.c.id == head, reservations.c.status == "waiting", available, ~live_hold(desktop_id, now))
+        .values(
+            status="offered",
+            desktop_id=desktop_id,
+            offered_at=now,
+            hold_expires_at=now + timedelta(seconds=hold_seconds),
+        )
+        .returning(reservations.c.id, reservations.c.student_id)
+    )
+
+
+def estimate_wait(
+    position: int, free_now: int, deadlines: list[datetime], now: datetime, default_minutes: float
+) -> float | None:
+    """Seconds until the student at ``position`` (1-based) can expect an offer.
+
+    Free desktops go to the first ``free_now`` students; after that each
+    student gets the next desktop whose active session reaches its
+    ``start_time + duration_minutes``, wrapping around with the average
+    session length once every current session has been used up.
+    """
+    slot = position - 1 - free_now
+    if slot < 0:
+        return 0.0
+    if not deadlines:
+        return None
+    ends = sorted(max(deadline, now) for deadline in deadlines)
+    rounds, index = divmod(slot, len(ends))
+    expected = ends[index] + timedelta(minutes=default_minutes * rounds)
+    return (expected - now).total_seconds()
+
+
+class ReservationQueue:
+    """Offers freed desktops to the head of each lab's waitlist and holds them briefly.
+
+    The queue itself lives in the reservations table, ordered by priority and
+    join time per lab; this only decides when to look at it again.
+    """
+
+    def __init__(self, session_factory, hold_seconds: float, resync_interval: float):
+        self.session_factory = session_factory
+        self.hold_seconds = hold_seconds
+        self.resync_interval = resync_interval
+        self._wakeup = threading.Condition()
+        self._pending = False
+        self._stopping = False
+        self._next_hold: datetime | None = None
+        self._thread: threading.Thread | None = None
+        self.passes = 0
+        self.offers = 0
+        self.expired_holds = 0
+        self.last_pass_seconds = 0.0
+
+    def kick(self, **_) -> None:
+        with self._wakeup:
+            self._pending = True
+            self._wakeup.notify()
+
+    def on_desktop_status(self, desktop_id: int, status: str, previous: str | None) -> None:
+        if status == "available":
+            self.kick()
+
+    def process(self, now: datetime | None = None) -> list[tuple[int, int]]:
+        now = now or datetime.utcnow()
+        started = time.monotonic()
+        reservations = models.Reservation.__table__
+        desktops = models.Desktop.__table__
+        db = self.session_factory()
+        try:
+            expired = db.execute(
+                update(reservations)
+                .where(reservations.c.status == "offered", reservations.c.hold_expires_at <= now)
+                .values(status="expired")
+                .returning(reservations.c.id)
+            ).scalars().all()
+            labs = set(db.scalars(
+                select(reservations.c.lab).where(reservations.c.status == "waiting").distinct()
+            ).all())
+            offered = []
+            if labs:
+                free = db.execute(
+                    select(desktops.c.id, desktops.c.desktop_id)
+                    .where(desktops.c.status == "available", ~live_hold(desktops.c.id, now))
+                    .order_by(desktops.c.id)
+                ).all()
+                for desktop_id, code in free:
+                    lab = lab_of(code)
+                    if lab not in labs:
+                        continue
+                    row = db.execute(offer_statement(desktop_id, lab, now, self.hold_seconds)).first()
+                    if row is None:
+                        labs.discard(lab)
+                    else:
+                        offered.append((row.id, desktop_id))
+            next_hold = db.scalar(
+                select(func.min(reservations.c.hold_expires_at)).where(reservations.c.status == "offered")
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        with self._wakeup:
+            self._next_hold = next_hold
+        self.passes += 1
+        self.offers += len(offered)
+        self.expired_holds += len(expired)
+        self.last_pass_seconds = time.monotonic() - started
+        return offered
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._pending = True
+        self._thread = threading.Thread(target=self._run, name="reservation-queue", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify()
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    def _run(self) -> None:
+        next_resync = time.monotonic()
+        while True:
+            with self._wakeup:
+                if self._stopping:
+                    return
+                timeout = next_resync - time.monotonic()
+                if self._next_hold is not None:
+                    timeout = min(timeout, (self._next_hold - datetime.utcnow()).total_seconds())
+                if not self._pending and timeout > 0:
+                    self._wakeup.wait(timeout)
+                if self._stopping:
+                    return
+                self._pending = False
+            try:
+                next_resync = time.monotonic() + self.resync_interval
+                self.process()
+            except Exception:
+                logger.exception("Reservation pass failed")
+                with self._wakeup:
+                    self._wakeup.wait(1)
+
+    def metrics(self) -> dict:
+        with self._wakeup:
+            next_hold = self._next_hold
+        return {
+            "passes": self.passes,
+            "offers": self.offers,
+            "expired_holds": self.expired_holds,
+            "next_hold_expiry": next_hold,
+            "hold_seconds": self.hold_seconds,
+            "last_pass_seconds": round(self.last_pass_seconds, 4),
+        }
+
+
+reservation_queue = ReservationQueue(
+    database.SessionLocal,
+    hold_seconds=RESERVATION_HOLD_SECONDS,
+    resync_interval=RESERVATION_RESYNC_SECONDS,
+)
+events.subscribe(events.DESKTOP_STATUS, reservation_queue.on_desktop_status)
+events.subscribe(events.DESKTOP_CREATED, reservation_queue.kick)
+# a student who starts elsewhere gives up the desktop held for them
+events.subscribe(events.SESSION_STARTED, reservation_queue.kick)
+
+
+# Queries for the reservation endpoints
+async def lab_desktops(db: AsyncSession, lab: str):
+    escaped = lab.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    rows = await db.scalars(
+        select(models.Desktop).where(models.Desktop.desktop_id.like(f"{escaped}-%", escape="\\"))
+    )
+    return [desktop for desktop in rows.all() if lab_of(desktop.desktop_id) == lab]
+
+async def get_open_reservation(db: AsyncSession, student_id: int):
+    return await db.scalar(
+        select(models.Reservation).where(
+            models.Reservation.student_id == student_id,
+            models.Reservation.status.in_(OPEN_STATUSES),
+        ).limit(1)
+    )
+
+async def get_queue(db: AsyncSession, lab: str | None = None):
+    query = select(models.Reservation).where(models.Reservation.status.in_(OPEN_STATUSES))
+    if lab:
+        query = query.where(models.Reservation.lab == lab)
+    result = await db.scalars(query.order_by(
+        models.Reservation.lab,
+        models.Reservation.status.desc(),  # offered before waiting
+        models.Reservation.priority,
+        models.Reservation.created_at,
+        models.Reservation.id,
+    ))
+    return result.all()
+
+async def join_queue(db: AsyncSession, student_id: int, lab: str, priority: int = RESERVATION_DEFAULT_PRIORITY):
+    reservation = models.Reservation(
+        student_id=student_id, lab=lab, priority=priority, status="waiting", created_at=datetime.utcnow()
+    )
+    db.add(reservation)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # already queued, possibly by a concurrent request
+        await db.rollback()
+        return await get_open_reservation(db, student_id)
+    reservation_queue.kick()
+    return reservation
+
+async def cancel_reservation(db: AsyncSession, reservation_id: int) -> bool:
+    reservations = models.Reservation.__table__
+    cancelled = await db.scalar(
+        update(reservations)
+        .where(reservations.c.id == reservation_id, reservations.c.status.in_(OPEN_STATUSES))
+        .values(status="cancelled")
+        .returning(reservations.c.id)
+    )
+    await db.commit()
+    if cancelled is not None:
+        # a released hold goes to the next student
+        reservation_queue.kick()
+    return cancelled is not None
+
+async def set_priority(db: AsyncSession, reservation_id: int, priority: int):
+    reservation = await db.get(models.Reservation, reservation_id)
+    if reservation:
+        reservation.priority = priority
+        await db.commit()
+        reservation_queue.kick()
+    return reservation
+
+async def queue_status(db: AsyncSession, reservation: models.Reservation, now: datetime | None = None) -> dict:
+    now = now or datetime.utcnow()
+    status = {
+        "id": reservation.id,
+        "lab": reservation.lab,
+        "status": reservation.status,
+        "priority": reservation.priority,
+        "created_at": reservation.created_at,
+        "desktop_id": reservation.desktop_id,
+        "hold_expires_at": reservation.hold_expires_at,
+        "position": None,
+        "estimated_wait_seconds": None,
+        "estimated_available_at": None,
+    }
+    if reservation.status == "offered":
+        status["estimated_wait_seconds"] = 0.0
+        status["estimated_available_at"] = now
+        return status
+
+    queue = models.Reservation
+    ahead = await db.scalar(
+        select(func.count(queue.id)).where(
+            queue.lab == reservation.lab,
+            queue.status == "waiting",
+            (queue.priority < reservation.priority)
+            | ((queue.priority == reservation.priority) & (queue.created_at < reservation.created_at))
+            | (
+                (queue.priority == reservation.priority)
+                & (queue.created_at == reservation.created_at)
+                & (queue.id < reservation.id)
+            ),
+        )
+    )
+    position = ahead + 1
+
+    desktops = await lab_desktops(db, reservation.lab)
+    desktop_ids = [desktop.id for desktop in desktops]
+    held = set()
+    sessions = []
+    if desktop_ids:
+        held = set((await db.scalars(
+            select(queue.desktop_id).where(
+                queue.desktop_id.in_(desktop_ids), queue.status == "offered", queue.hold_expires_at > now
+            )
+        )).all())
+        sessions = (await db.scalars(
+            select(models.Session).where(
+                models.Session.desktop_id.in_(desktop_ids), models.Session.is_active == True
+            )
+        )).all()
+    free_now = sum(1 for desktop in desktops if desktop.status == "available" and desktop.id not in held)
+    durations = [session.duration_minutes or 60 for session in sessions]
+    wait = estimate_wait(
+        position,
+        free_now,
+        [crud.session_deadline(session) for session in sessions if session.start_time is not None],
+        now,
+        sum(durations) / len(durations) if durations else 60,
+    )
+    status["position"] = position
+    if wait is not None:
+        status["estimated_wait_seconds"] = round(wait, 1)
+        status["estimated_available_at"] = now + timedelta(seconds=wait)
+    return status
@@ -40,6 +40,12 @@ class Desktop(DesktopBase):
     class Config:
         from_attributes = True
 
+class DesktopChanges(BaseModel):
+    version: str
+    full: bool
+    changed: List[Desktop]
+    deleted: List[int]
+
 # Session Schemas
 class SessionBase(BaseModel):
     student_id: int
@@ -70,6 +76,58 @@ class HealthLog(HealthLogCreate):
     class Config:
         from_attributes = True
 
+class HealthPoint(BaseModel):
+    timestamp: datetime
+    samples: int
+    connected_ratio: float
+    cpu_avg: Optional[float]
+    cpu_max: Optional[float]
+    ram_avg: Optional[float]
+    ram_max: Optional[float]
+
+class HealthHistory(BaseModel):
+    desktop_id: int
+    resolution_seconds: int
+    start: datetime
+    end: datetime
+    points: List[HealthPoint]
+
+class OccupancyPoint(BaseModel):
+    hour_start: datetime
+    busy_seconds: float
+    sessions_started: int
+    occupancy: float
+
+class OccupancyHistory(BaseModel):
+    start: datetime
+    end: datetime
+    desktop_id: Optional[int] = None
+    points: List[OccupancyPoint]
+
+class HeatmapCell(BaseModel):
+    weekday: int
+    hour_of_day: int
+    busy_seconds: float
+    sessions_started: int
+    occupancy: float
+
+class OccupancyHeatmap(BaseModel):
+    start: datetime
+    end: datetime
+    cells: List[HeatmapCell]
+
+class DesktopUtilization(BaseModel):
+    desktop_id: int
+    name: Optional[str]
+    busy_seconds: float
+    sessions_started: int
+    utilization: float
+
+class UtilizationReport(BaseModel):
+    start: datetime
+    end: datetime
+    desktops: List[DesktopUtilization]
+
 # Desktop Pairing Schemas
 class DesktopPairingCreate(BaseModel):
     device_uuid: str
@@ -83,3 +141,44 @@ class DesktopPairing(BaseModel):
     paired_at: datetime
     class Config:
         from_attributes = True
+
+# ID Verification Schemas
+class VerificationJob(BaseModel):
+    job_id: str
+    status: str
+    student_id: str
+    extracted_id: Optional[str] = None
+    matches: Optional[bool] = None
+    detail: Optional[str] = None
+
+# Reservation Schemas
+class ReservationCreate(BaseModel):
+    lab: str
+
+class ReservationUpdate(BaseModel):
+    priority: int
+
+class Reservation(BaseModel):
+    id: int
+    student_id: int
+    lab: str
+    priority: int
+    status: str
+    desktop_id: Optional[int]
+    created_at: datetime
+    offered_at: Optional[datetime]
+    hold_expires_at: Optional[datetime]
+    class Config:
+        from_attributes = True
+
+class ReservationStatus(BaseModel):
+    id: int
+    lab: str
+    status: str
+    priority: int
+    created_at: datetime
+    position: Optional[int]  # 1-based among waiting students, None once offered
+    desktop_id: Optional[int]  # the desktop held for the student
+    hold_expires_at: Optional[datetime]
+    estimated_wait_seconds: Optional[float]
+    estimated_available_at: Optional[datetime]
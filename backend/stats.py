@@ -0,0 +1,116 @@
+from datetime import datetime
+import os
+import threading
+import time
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import async_crud, events
+
+# Upper bound on how old a served snapshot may be; events keep it current in
+# between, the periodic rebuild corrects anything they missed.
+STATS_MAX_AGE_SECONDS = float(os.getenv("STATS_MAX_AGE_SECONDS", "30"))
+
+
+class StatsSnapshot:
+    """Desktop and session counters for /analytics/stats, updated from events."""
+
+    def __init__(self, max_age: float):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._desktops: dict[str, int] = {}
+        self._sessions: dict[str, int] = {}
+        self._built_at: float | None = None
+        self._as_of: datetime | None = None
+        self.rebuilds = 0
+        self.served = 0
+
+    async def rebuild_async(self, db: AsyncSession) -> dict:
+        return self._store(await async_crud.get_desktop_stats(db), await async_crud.get_session_totals(db))
+
+    def _store(self, desktops: dict, sessions: dict) -> dict:
+        with self._lock:
+            self._desktops = desktops
+            self._sessions = sessions
+            self._built_at = time.monotonic()
+            self._as_of = datetime.utcnow()
+            self.rebuilds += 1
+            return self._view()
+
+    def invalidate(self, **_) -> None:
+        with self._lock:
+            self._built_at = None
+
+    async def get_async(self, db: AsyncSession) -> dict:
+        cached = self._fresh_view()
+        return cached if cached is not None else await self.rebuild_async(db)
+
+    def _fresh_view(self) -> dict | None:
+        with self._lock:
+            if self._built_at is None or time.monotonic() - self._built_at >= self.max_age:
+                return None
+            self.served += 1
+            return self._view()
+
+    def _view(self) -> dict:
+        return {
+            "desktops": dict(self._desktops),
+            "sessions": dict(self._sessions),
+            "as_of": self._as_of,
+        }
+
+    def _adjust(self, counters: dict, key: str, delta: int) -> None:
+        counters[key] = max(0, counters.get(key, 0) + delta)
+
+    def on_desktop_status(self, desktop_id: int, status: str, previous: str | None) -> None:
+        if previous == status:
+            return
+        with self._lock:
+            if self._built_at is None:
+                return
+            if previous is not None:
+                self._adjust(self._desktops, previous, -1)
+            self._adjust(self._desktops, status, 1)
+            self._as_of = datetime.utcnow()
+
+    def on_desktop_created(self, desktop) -> None:
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._adjust(self._desktops, desktop.status or "offline", 1)
+            self._adjust(self._desktops, "total", 1)
+            self._as_of = datetime.utcnow()
+
+    def on_session_started(self, session) -> None:
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._adjust(self._sessions, "total", 1)
+            self._adjust(self._sessions, "active", 1)
+            self._as_of = datetime.utcnow()
+
+    def on_session_ended(self, session_id: int, desktop_id: int | None = None) -> None:
+        with self._lock:
+            if self._built_at is None:
+                return
+            self._adjust(self._sessions, "active", -1)
+            self._as_of = datetime.utcnow()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            age = time.monotonic() - self._built_at if self._built_at is not None else None
+        return {
+            "rebuilds": self.rebuilds,
+            "served_from_snapshot": self.served,
+            "age_seconds": round(age, 3) if age is not None else None,
+            "max_age_seconds": self.max_age,
+        }
+
+
+stats_snapshot = StatsSnapshot(STATS_MAX_AGE_SECONDS)
+events.subscribe(events.DESKTOP_STATUS, stats_snapshot.on_desktop_status)
+events.subscribe(events.DESKTOP_CREATED, stats_snapshot.on_desktop_created)
+# the deleted desktop's status is not in the event, so rebuild on next read
+events.subscribe(events.DESKTOP_DELETED, stats_snapshot.invalidate)
+events.subscribe(events.SESSION_STARTED, stats_snapshot.on_session_started)
+events.subscribe(events.SESSION_ENDED, stats_snapshot.on_session_ended)
@@ -0,0 +1,296 @@
+from collections import deque
+from datetime import datetime, timedelta
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from . import database, models
+
+logger = logging.getLogger(__name__)
+
+TELEMETRY_FLUSH_INTERVAL_SECONDS = float(os.getenv("TELEMETRY_FLUSH_INTERVAL_SECONDS", "5"))
+TELEMETRY_ROLLUP_INTERVAL_SECONDS = float(os.getenv("TELEMETRY_ROLLUP_INTERVAL_SECONDS", "60"))
+TELEMETRY_MAX_PENDING = int(os.getenv("TELEMETRY_MAX_PENDING", "50000"))
+RAW_RETENTION = timedelta(hours=float(os.getenv("TELEMETRY_RAW_RETENTION_HOURS", "24")))
+
+MINUTE = 60
+HOUR = 3600
+# resolution in seconds -> retention of its buckets
+RESOLUTIONS = {
+    MINUTE: timedelta(days=float(os.getenv("TELEMETRY_MINUTE_RETENTION_DAYS", "14"))),
+    HOUR: timedelta(days=float(os.getenv("TELEMETRY_HOUR_RETENTION_DAYS", "365"))),
+}
+WATERMARK_NAME = "health_buckets"
+EPOCH = datetime(1970, 1, 1)
+
+
+def _floor(moment: datetime, seconds: int) -> datetime:
+    offset = int((moment - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=offset - offset % seconds)
+
+
+class TelemetryStore:
+    """Buffers health samples, bulk-inserts them and rolls them up into per-minute and per-hour buckets."""
+
+    def __init__(self, session_factory, flush_interval: float, rollup_interval: float):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.rollup_interval = rollup_interval
+        self._pending: deque[dict] = deque(maxlen=TELEMETRY_MAX_PENDING)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.dropped = 0
+        self.inserted = 0
+        self.rolled_up = 0
+        self.last_rollup_seconds = 0.0
+
+    def record(self, sample: dict) -> None:
+        sample = dict(sample, timestamp=datetime.utcnow())
+        with self._lock:
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+            # a full deque drops its oldest sample
+            self._pending.append(sample)
+
+    def flush(self) -> int:
+        with self._lock:
+            batch, self._pending = list(self._pending), deque(maxlen=TELEMETRY_MAX_PENDING)
+        if not batch:
+            return 0
+        db = self.session_factory()
+        try:
+            db.execute(insert(models.HealthLog.__table__), batch)
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                # put the batch back ahead of newer samples, still within the cap
+                requeued = deque(batch, maxlen=TELEMETRY_MAX_PENDING)
+                requeued.extend(self._pending)
+                self.dropped += len(batch) + len(self._pending) - len(requeued)
+                self._pending = requeued
+            raise
+        finally:
+            db.close()
+        self.inserted += len(batch)
+        return len(batch)
+
+    def rollup(self, until: datetime) -> int:
+        """Fold raw samples older than ``until`` (floored to the minute) into the series."""
+        until = _floor(until, MINUTE)
+        started = time.monotonic()
+        db = self.session_factory()
+        try:
+            watermark = db.get(models.RollupWatermark, WATERMARK_NAME)
+            if watermark is None:
+                watermark = models.RollupWatermark(name=WATERMARK_NAME, position=EPOCH)
+                db.add(watermark)
+            if watermark.position >= until:
+                return 0
+
+            samples = db.query(
+                models.HealthLog.desktop_id,
+                models.HealthLog.timestamp,
+                models.HealthLog.cpu_usage,
+                models.HealthLog.ram_usage,
+                models.HealthLog.network_status,
+            ).filter(
+                models.HealthLog.timestamp >= watermark.position,
+                models.HealthLog.timestamp < until,
+            ).all()
+
+            # (desktop_id, resolution, bucket_start) -> [n, connected, cpu_sum, cpu_max, ram_sum, ram_max]
+            buckets: dict[tuple, list] = {}
+            for desktop_id, timestamp, cpu, ram, network_status in samples:
+                cpu = cpu or 0.0
+                ram = ram or 0.0
+                for resolution in RESOLUTIONS:
+                    acc = buckets.setdefault(
+                        (desktop_id, resolution, _floor(timestamp, resolution)), [0, 0, 0.0, 0.0, 0.0, 0.0]
+                    )
+                    acc[0] += 1
+                    acc[1] += network_status == "connected"
+                    acc[2] += cpu
+                    acc[3] = max(acc[3], cpu)
+                    acc[4] += ram
+                    acc[5] = max(acc[5], ram)
+
+            for resolution in RESOLUTIONS:
+                self._merge(db, resolution, {
+                    (desktop_id, bucket_start): acc
+                    for (desktop_id, bucket_resolution, bucket_start), acc in buckets.items()
+                    if bucket_resolution == resolution
+                })
+
+            watermark.position = until
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        self.rolled_up += len(samples)
+        self.last_rollup_seconds = time.monotonic() - started
+        return len(samples)
+
+    def _merge(self, db: Session, resolution: int, buckets: dict[tuple, list]) -> None:
+        if not buckets:
+            return
+        starts = [bucket_start for _, bucket_start in buckets]
+        existing = {
+            (row.desktop_id, row.bucket_start): row
+            for row in db.query(models.HealthBucket).filter(
+                models.HealthBucket.desktop_id.in_({desktop_id for desktop_id, _ in buckets}),
+                models.HealthBucket.resolution_seconds == resolution,
+                models.HealthBucket.bucket_start >= min(starts),
+                models.HealthBucket.bucket_start <= max(starts),
+            )
+        }
+        for (desktop_id, bucket_start), (n, connected, cpu_sum, cpu_max, ram_sum, ram_max) in buckets.items():
+            row = existing.get((desktop_id, bucket_start))
+            if row is None:
+                db.add(models.HealthBucket(
+                    desktop_id=desktop_id,
+                    resolution_seconds=resolution,
+                    bucket_start=bucket_start,
+                    samples=n,
+                    connected=connected,
+                    cpu_avg=cpu_sum / n,
+                    cpu_max=cpu_max,
+                    ram_avg=ram_sum / n,
+                    ram_max=ram_max,
+                ))
+                continue
+            total = row.samples + n
+            row.cpu_avg = (row.cpu_avg * row.samples + cpu_sum) / total
+            row.ram_avg = (row.ram_avg * row.samples + ram_sum) / total
+            row.cpu_max = max(row.cpu_max, cpu_max)
+            row.ram_max = max(row.ram_max, ram_max)
+            row.connected += connected
+            row.samples = total
+
+    def enforce_retention(self, now: datetime) -> None:
+        db = self.session_factory()
+        try:
+            watermark = db.get(models.RollupWatermark, WATERMARK_NAME)
+            # never drop raw samples that have not been rolled up yet
+            raw_cutoff = now - RAW_RETENTION
+            if watermark is not None:
+                raw_cutoff = min(raw_cutoff, watermark.position)
+            else:
+                raw_cutoff = EPOCH
+            db.query(models.HealthLog).filter(models.HealthLog.timestamp < raw_cutoff).delete(
+                synchronize_session=False
+            )
+            for resolution, retention in RESOLUTIONS.items():
+                db.query(models.HealthBucket).filter(
+                    models.HealthBucket.resolution_seconds == resolution,
+                    models.HealthBucket.bucket_start < now - retention,
+                ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=self.flush_interval + 5)
+            self._thread = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Final telemetry flush failed")
+
+    def _run(self) -> None:
+        next_rollup = time.monotonic() + self.rollup_interval
+        while not self._stop.wait(self.flush_interval):
+            try:
+                # everything recorded before this point is inserted by the flush below
+                flushed_until = datetime.utcnow()
+                self.flush()
+                if time.monotonic() >= next_rollup:
+                    next_rollup = time.monotonic() + self.rollup_interval
+                    self.rollup(flushed_until)
+                    self.enforce_retention(flushed_until)
+            except Exception:
+                logger.exception("Telemetry maintenance failed")
+
+    def metrics(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "pending": pending,
+            "dropped": self.dropped,
+            "inserted": self.inserted,
+            "rolled_up": self.rolled_up,
+            "last_rollup_seconds": round(self.last_rollup_seconds, 4),
+        }
+
+
+def pick_resolution(start: datetime, end: datetime) -> int:
+    span = end - start
+    if span <= timedelta(hours=2):
+        return 0
+    if span <= timedelta(days=3):
+        return MINUTE
+    return HOUR
+
+
+def query_history(db: Session, desktop_id: int, start: datetime, end: datetime, resolution: int) -> list[dict]:
+    if resolution == 0:
+        rows = db.query(models.HealthLog).filter(
+            models.HealthLog.desktop_id == desktop_id,
+            models.HealthLog.timestamp >= start,
+            models.HealthLog.timestamp < end,
+        ).order_by(models.HealthLog.timestamp).all()
+        return [
+            {
+                "timestamp": row.timestamp,
+                "samples": 1,
+                "connected_ratio": 1.0 if row.network_status == "connected" else 0.0,
+                "cpu_avg": row.cpu_usage,
+                "cpu_max": row.cpu_usage,
+                "ram_avg": row.ram_usage,
+                "ram_max": row.ram_usage,
+            }
+            for row in rows
+        ]
+
+    rows = db.query(models.HealthBucket).filter(
+        models.HealthBucket.desktop_id == desktop_id,
+        models.HealthBucket.resolution_seconds == resolution,
+        models.HealthBucket.bucket_start >= _floor(start, resolution),
+        models.HealthBucket.bucket_start < end,
+    ).order_by(models.HealthBucket.bucket_start).all()
+    return [
+        {
+            "timestamp": row.bucket_start,
+            "samples": row.samples,
+            "connected_ratio": round(row.connected / row.samples, 3),
+            "cpu_avg": round(row.cpu_avg, 2),
+            "cpu_max": round(row.cpu_max, 2),
+            "ram_avg": round(row.ram_avg, 2),
+            "ram_max": round(row.ram_max, 2),
+        }
+        for row in rows
+        if row.samples
+    ]
+
+
+telemetry_store = TelemetryStore(
+    database.SessionLocal,
+    flush_interval=TELEMETRY_FLUSH_INTERVAL_SECONDS,
+    rollup_interval=TELEMETRY_ROLLUP_INTERVAL_SECONDS,
+)
@@ -0,0 +1,219 @@
+"""HTTP load test for the heartbeat and dashboard polling endpoints.
+
+Seeds a throwaway database, starts uvicorn on it (or targets --url), then has
+many concurrent clients mix agent heartbeats with the calls an open dashboard
+makes: /desktops/ (with If-None-Match), /me and /sessions/me. Reports
+throughput, latency percentiles per endpoint, error counts and the server's
+peak thread count, which should stay flat as --concurrency grows.
+
+    python benchmarks/bench_api_load.py --concurrency 200 --duration 20
+    python benchmarks/bench_api_load.py --url http://localhost:8000 --students 0
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "loadtest-password"
+# relative weight of each request kind
+MIX = {"heartbeat": 5, "desktops": 3, "me": 1, "session": 1}
+
+
+def seed(workdir: str, desktops: int, students: int) -> None:
+    # the app keeps its SQLite file relative to the working directory
+    script = f"""
+import sys
+sys.path.insert(0, {ROOT!r})
+from backend import crud, database, models, schemas
+models.Base.metadata.create_all(bind=database.engine)
+db = database.SessionLocal()
+for index in range({desktops}):
+    db.add(models.Desktop(desktop_id=f"LOAD-{{index:04d}}", ip_address="10.0.0.1", status="available"))
+db.commit()
+for index in range({students}):
+    crud.create_student(db, schemas.StudentCreate(
+        student_id=f"ugr/{{1000 + index}}/15", name="Load", email=f"load{{index}}@test", password={PASSWORD!r}))
+db.close()
+"""
+    subprocess.run([sys.executable, "-c", script], cwd=workdir, check=True)
+
+
+def start_server(workdir: str, port: int, workers: int) -> subprocess.Popen:
+    env = dict(os.environ, PYTHONPATH=ROOT, OCR_POOL_WORKERS="0")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning"],
+        cwd=workdir,
+        env=env,
+    )
+
+
+def thread_count(pid: int) -> int | None:
+    try:
+        with open(f"/proc/{pid}/status") as handle:
+            for line in handle:
+                if line.startswith("Threads:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise SystemExit("server did not become ready")
+
+
+async def login(client: httpx.AsyncClient, students: int) -> list[str]:
+    tokens = []
+    for index in range(students):
+        response = await client.post("/token", data={"username": f"load{index}@test", "password": PASSWORD})
+        response.raise_for_status()
+        tokens.append(response.json()["access_token"])
+    return tokens
+
+
+async def run_load(url: str, concurrency: int, duration: float, desktops: int, students: int, server_pid: int | None):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        await wait_ready(client)
+        tokens = await login(client, students)
+        # without accounts only the unauthenticated endpoints are exercised
+        kinds = [
+            kind for kind, weight in MIX.items() if tokens or kind in ("heartbeat", "desktops") for _ in range(weight)
+        ]
+        latencies = defaultdict(list)
+        statuses = defaultdict(lambda: defaultdict(int))
+        errors = defaultdict(int)
+        peak_threads = thread_count(server_pid) if server_pid else None
+        stop_at = time.monotonic() + duration
+
+        async def client_loop(seed: int) -> None:
+            rng = random.Random(seed)
+            etag = None
+            while time.monotonic() < stop_at:
+                kind = rng.choice(kinds)
+                headers = {}
+                started = time.perf_counter()
+                try:
+                    if kind == "heartbeat":
+                        response = await client.post("/agent/heartbeat", json={
+                            "desktop_id": rng.randint(1, max(1, desktops)),
+                            "cpu_usage": rng.uniform(0, 100),
+                            "ram_usage": rng.uniform(0, 100),
+                            "network_status": "connected",
+                        })
+                    elif kind == "desktops":
+                        if etag:
+                            headers["If-None-Match"] = etag
+                        response = await client.get("/desktops/", headers=headers)
+                        etag = response.headers.get("etag", etag)
+                    else:
+                        headers["Authorization"] = f"Bearer {rng.choice(tokens)}"
+                        response = await client.get("/me" if kind == "me" else "/sessions/me", headers=headers)
+                except httpx.HTTPError as exc:
+                    errors[f"{kind}:{type(exc).__name__}"] += 1
+                    continue
+                latencies[kind].append(time.perf_counter() - started)
+                statuses[kind][response.status_code] += 1
+
+        async def sample_threads() -> None:
+            nonlocal peak_threads
+            while time.monotonic() < stop_at:
+                count = thread_count(server_pid)
+                if count is not None:
+                    peak_threads = max(peak_threads or 0, count)
+                await asyncio.sleep(0.5)
+
+        started = time.monotonic()
+        tasks = [client_loop(index) for index in range(concurrency)]
+        if server_pid:
+            tasks.append(sample_threads())
+        await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - started
+
+    total = sum(len(values) for values in latencies.values())
+    return {
+        "concurrency": concurrency,
+        "duration_seconds": round(elapsed, 1),
+        "requests": total,
+        "requests_per_second": round(total / elapsed, 1),
+        "errors": dict(errors),
+        "server_peak_threads": peak_threads,
+        "endpoints": {
+            kind: {
+                "requests": len(values),
+                "p50_ms": round(percentile(values, 0.5) * 1000, 1),
+                "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 1),
+                "statuses": dict(statuses[kind]),
+            }
+            for kind, values in sorted(latencies.items())
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="target a running server instead of starting one")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--server-workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--desktops", type=int, default=200)
+    parser.add_argument("--students", type=int, default=20, help="accounts seeded and logged in; 0 skips /me polling")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    args = parser.parse_args()
+
+    server = None
+    workdir = None
+    try:
+        if args.url:
+            url = args.url
+        else:
+            workdir = tempfile.TemporaryDirectory(prefix="sdpms-load-")
+            seed(workdir.name, args.desktops, args.students)
+            server = start_server(workdir.name, args.port, args.server_workers)
+            url = f"http://127.0.0.1:{args.port}"
+        report = asyncio.run(run_load(
+            url, args.concurrency, args.duration, args.desktops, args.students, server.pid if server else None
+        ))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        if workdir is not None:
+            workdir.cleanup()
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.json:
+        with open(args.json, "w") as handle:
+            handle.write(text)
+
+
+if __name__ == "__main__":
+    main()
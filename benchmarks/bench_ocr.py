@@ -0,0 +1,228 @@
+"""Offline speed and accuracy benchmark for the student ID OCR pipeline.
+
+Generates synthetic ID cards with a known ``ugr/NNNN/NN`` label, runs them
+through the same path the verification jobs use (ocr.load_id_image followed by
+ocr.extract_student_id, bypassing the result cache) and reports latency, CPU
+time, memory and hit rate, overall and per variant / psm config.
+
+    python benchmarks/bench_ocr.py --count 40
+    python benchmarks/bench_ocr.py --workers 4 --json bench_output.txt
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+CARD_WIDTHS = (640, 1280, 4032)
+ROTATIONS = (0, 90, 180, 270)
+BLURS = (0.0, 1.5)
+NOISE_SIGMAS = (0, 25)
+
+
+def make_label(rng: random.Random) -> str:
+    digits = rng.choice((4, 5, 6))
+    return f"UGR/{rng.randrange(10 ** (digits - 1), 10 ** digits)}/{rng.randrange(10, 100)}"
+
+
+def make_card(label: str, width: int, rotation: int, blur: float, noise: float, rng: random.Random) -> bytes:
+    height = int(width * 0.63)
+    unit = width / 100
+    card = Image.new("RGB", (width, height), (236, 240, 245))
+    draw = ImageDraw.Draw(card)
+    draw.rectangle((0, 0, width, int(unit * 12)), fill=(20, 60, 120))
+    draw.rectangle((int(unit * 4), int(unit * 18), int(unit * 30), int(unit * 56)), fill=(150, 150, 150))
+    header = ImageFont.load_default(size=max(10, int(unit * 5)))
+    body = ImageFont.load_default(size=max(10, int(unit * 4.5)))
+    draw.text((int(unit * 4), int(unit * 3)), "ADDIS ABABA UNIVERSITY", fill="white", font=header)
+    lines = [
+        f"Name: {rng.choice(['Abebe Kebede', 'Sara Tesfaye', 'Hana Girma', 'Yonas Alemu'])}",
+        f"ID No: {label}",
+        f"Dept: {rng.choice(['Software Eng.', 'Civil Eng.', 'Medicine', 'Law'])}",
+    ]
+    for index, line in enumerate(lines):
+        draw.text((int(unit * 35), int(unit * (20 + index * 10))), line, fill=(10, 10, 10), font=body)
+
+    if blur:
+        card = card.filter(ImageFilter.GaussianBlur(blur * width / 1280))
+    if noise:
+        grain = Image.effect_noise(card.size, noise).convert("RGB")
+        card = Image.blend(card, grain, 0.15)
+    # a few degrees of skew on top of the right-angle rotation
+    card = card.rotate(rotation + rng.uniform(-3, 3), expand=True, fillcolor=(90, 90, 90))
+
+    buffer = io.BytesIO()
+    card.save(buffer, "JPEG", quality=88)
+    return buffer.getvalue()
+
+
+def build_cases(count: int, seed: int) -> list[dict]:
+    rng = random.Random(seed)
+    cases = []
+    for index in range(count):
+        case = {
+            "label": make_label(rng),
+            "width": CARD_WIDTHS[index % len(CARD_WIDTHS)],
+            "rotation": ROTATIONS[(index // len(CARD_WIDTHS)) % len(ROTATIONS)],
+            "blur": rng.choice(BLURS),
+            "noise": rng.choice(NOISE_SIGMAS),
+        }
+        case["image"] = make_card(
+            case["label"], case["width"], case["rotation"], case["blur"], case["noise"], rng
+        )
+        cases.append(case)
+    return cases
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def variant_kind(name: str) -> str:
+    # rot90/prep/roi3 -> prep/roi; rot0 -> raw
+    parts = name.split("/")[1:]
+    return "/".join(part.rstrip("0123456789") for part in parts) or "raw"
+
+
+def live_children_cpu_seconds() -> float | None:
+    # RUSAGE_CHILDREN only counts children that have exited and been reaped,
+    # so the pool workers (and the tesseract processes they reap) are read
+    # from /proc while they are still running; None where there is no /proc
+    total = 0
+    for child in multiprocessing.active_children():
+        try:
+            with open(f"/proc/{child.pid}/stat") as handle:
+                fields = handle.read().rpartition(")")[2].split()
+        except FileNotFoundError:
+            if not os.path.isdir("/proc/self"):
+                return None
+            continue  # exited since; its time moves to RUSAGE_CHILDREN once reaped
+        # utime, stime, cutime, cstime (fields 14-17 of stat, counted after the name)
+        total += sum(int(value) for value in fields[11:15])
+    return total / os.sysconf("SC_CLK_TCK")
+
+
+def cpu_seconds() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime + (live_children_cpu_seconds() or 0.0)
+
+
+def run(cases: list[dict]) -> dict:
+    from backend import ocr
+
+    if ocr.get_engine_spec() is None:
+        raise SystemExit("No OCR engine available: install tesseract or set TESSERACT_CMD")
+    ocr.start()
+
+    latencies = []
+    cpu_times = []
+    python_peaks = []
+    hits = 0
+    by_variant = defaultdict(lambda: {"attempts": 0, "seconds": [], "matches": 0})
+    by_config = defaultdict(lambda: {"attempts": 0, "seconds": [], "matches": 0})
+    by_condition = defaultdict(lambda: {"cases": 0, "hits": 0})
+
+    for case in cases:
+        tracemalloc.start()
+        cpu_before = cpu_seconds()
+        started = time.perf_counter()
+        image = ocr.load_id_image(case["image"])
+        result = ocr.extract_student_id(image)
+        latencies.append(time.perf_counter() - started)
+        cpu_times.append(cpu_seconds() - cpu_before)
+        python_peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        hit = (result.student_id or "").lower() == case["label"].lower()
+        hits += hit
+        for condition in (
+            f"width={case['width']}",
+            f"rotation={case['rotation']}",
+            f"blur={case['blur']}",
+            f"noise={case['noise']}",
+        ):
+            by_condition[condition]["cases"] += 1
+            by_condition[condition]["hits"] += hit
+        for attempt in result.attempts:
+            for bucket in (by_variant[variant_kind(attempt.variant)], by_config[attempt.config]):
+                bucket["attempts"] += 1
+                bucket["seconds"].append(attempt.seconds)
+                bucket["matches"] += attempt.matched
+
+    ocr.shutdown_pool()
+
+    def summarize(buckets):
+        return {
+            key: {
+                "attempts": bucket["attempts"],
+                "matches": bucket["matches"],
+                "p50_ms": round(percentile(bucket["seconds"], 0.5) * 1000, 1),
+                "p95_ms": round(percentile(bucket["seconds"], 0.95) * 1000, 1),
+            }
+            for key, bucket in sorted(buckets.items())
+        }
+
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {
+        "engine": ocr.get_engine_spec().kind,
+        "pool_workers": ocr.OCR_POOL_WORKERS,
+        "cases": len(cases),
+        "hit_rate": round(hits / len(cases), 3) if cases else 0.0,
+        "latency_p50_ms": round(percentile(latencies, 0.5) * 1000, 1),
+        "latency_p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "latency_mean_ms": round(statistics.fmean(latencies) * 1000, 1) if latencies else 0.0,
+        "cpu_p50_ms": round(percentile(cpu_times, 0.5) * 1000, 1),
+        "cpu_p95_ms": round(percentile(cpu_times, 0.95) * 1000, 1),
+        # without /proc, time spent in still-running pool workers is missing
+        "cpu_includes_live_workers": ocr.OCR_POOL_WORKERS <= 0 or live_children_cpu_seconds() is not None,
+        "python_peak_mb_p95": round(percentile(python_peaks, 0.95) / 2**20, 1),
+        # ru_maxrss is in KiB on Linux
+        "max_rss_mb": round(own / 1024, 1),
+        "max_child_rss_mb": round(children / 1024, 1),
+        "by_condition": {
+            key: round(value["hits"] / value["cases"], 3) for key, value in sorted(by_condition.items())
+        },
+        "by_variant": summarize(by_variant),
+        "by_config": summarize(by_config),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=24, help="number of synthetic cards")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--workers", type=int, default=0, help="OCR pool workers; 0 runs inline")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    args = parser.parse_args()
+
+    # must be set before backend.ocr reads its configuration
+    os.environ["OCR_POOL_WORKERS"] = str(args.workers)
+    cases = build_cases(args.count, args.seed)
+    report = run(cases)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.json:
+        with open(args.json, "w") as handle:
+            handle.write(text)
+
+
+if __name__ == "__main__":
+    main()
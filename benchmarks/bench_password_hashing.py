@@ -0,0 +1,102 @@
+"""Login throughput benchmark for the password hashing settings.
+
+For each scheme and cost it hashes one password and then times verification,
+first on a single thread and then on the same executor /token uses, and
+reports logins per second overall and per core. Pick the highest cost whose
+per-core rate still covers the opening-time login rush.
+
+    python benchmarks/bench_password_hashing.py
+    python benchmarks/bench_password_hashing.py --scheme sha256_crypt --rounds 20000 80000 535000
+    python benchmarks/bench_password_hashing.py --scheme bcrypt --rounds 10 12 --json bench_hashing.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from backend.passwords import HashingExecutor, build_context
+
+DEFAULT_ROUNDS = {
+    "sha256_crypt": (20000, 80000, 200000, 535000),
+    "sha512_crypt": (20000, 80000, 200000, 656000),
+    "pbkdf2_sha256": (29000, 100000, 300000),
+    "bcrypt": (10, 11, 12),
+}
+PASSWORD = "correct horse battery staple"
+
+
+def cpu_count() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def measure(scheme: str, rounds: int, samples: int, workers: int) -> dict:
+    context = build_context([scheme], rounds)
+    started = time.perf_counter()
+    hashed = context.hash(PASSWORD)
+    hash_seconds = time.perf_counter() - started
+
+    single = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.verify(PASSWORD, hashed)
+        single.append(time.perf_counter() - started)
+
+    executor = HashingExecutor(workers, max_pending=samples)
+
+    async def burst() -> float:
+        started = time.perf_counter()
+        await asyncio.gather(*(executor.run(context.verify, PASSWORD, hashed) for _ in range(samples)))
+        return time.perf_counter() - started
+
+    burst_seconds = asyncio.run(burst())
+    executor.shutdown()
+
+    cores = cpu_count()
+    concurrent_rate = samples / burst_seconds
+    return {
+        "scheme": scheme,
+        "rounds": rounds,
+        "hash_ms": round(hash_seconds * 1000, 1),
+        "verify_p50_ms": round(statistics.median(single) * 1000, 1),
+        "verify_max_ms": round(max(single) * 1000, 1),
+        "logins_per_second_single_thread": round(1 / statistics.median(single), 1),
+        "logins_per_second_executor": round(concurrent_rate, 1),
+        "logins_per_second_per_core": round(concurrent_rate / min(cores, workers), 1),
+        "executor_workers": workers,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scheme", action="append", help="scheme to test (repeatable); default sha256_crypt")
+    parser.add_argument("--rounds", type=int, nargs="+", help="costs to test; default depends on the scheme")
+    parser.add_argument("--samples", type=int, default=20, help="verifications per setting")
+    parser.add_argument("--workers", type=int, default=cpu_count(), help="executor threads")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    args = parser.parse_args()
+
+    report = {"cores": cpu_count(), "results": []}
+    for scheme in args.scheme or ["sha256_crypt"]:
+        for rounds in args.rounds or DEFAULT_ROUNDS.get(scheme, (None,)):
+            try:
+                report["results"].append(measure(scheme, rounds, args.samples, args.workers))
+            except Exception as exc:  # e.g. a missing or incompatible backend
+                report["results"].append({"scheme": scheme, "rounds": rounds, "error": str(exc)})
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.json:
+        with open(args.json, "w") as handle:
+            handle.write(text)
+
+
+if __name__ == "__main__":
+    main()
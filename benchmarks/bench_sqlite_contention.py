@@ -0,0 +1,168 @@
+"""SQLite contention benchmark for the database settings.
+
+Runs the same mixed workload against a fresh database file once per settings
+profile: writer threads doing heartbeat-style desktop UPDATEs and session
+start/end transactions, and reader threads listing desktops. Reports
+operations per second, "database is locked" errors and latency for each
+profile.
+
+Profiles: "driver-default" (no PRAGMAs, the pre-tuning behaviour), "tuned"
+(SqliteSettings defaults) and "env" (whatever SQLITE_* / DB_* variables are set).
+
+    python benchmarks/bench_sqlite_contention.py
+    python benchmarks/bench_sqlite_contention.py --writers 16 --readers 16 --duration 10
+    SQLITE_SYNCHRONOUS=FULL python benchmarks/bench_sqlite_contention.py --profile env
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from backend import models
+from backend.database import SqliteSettings, create_sqlite_engine
+
+PROFILES = {
+    "driver-default": lambda: SqliteSettings(
+        journal_mode=None, synchronous=None, busy_timeout_ms=None, mmap_size=None, cache_size=None
+    ),
+    "tuned": SqliteSettings,
+    "env": SqliteSettings.from_env,
+}
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def prepare(path: str, desktops: int, settings: SqliteSettings):
+    engine = create_sqlite_engine(f"sqlite:///{path}", settings)
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    with Session() as db:
+        db.add_all(
+            models.Desktop(desktop_id=f"BENCH-{index:04d}", ip_address="10.0.0.1", status="available")
+            for index in range(desktops)
+        )
+        db.commit()
+    return engine, Session
+
+
+def run_profile(name: str, settings: SqliteSettings, args) -> dict:
+    with tempfile.TemporaryDirectory(prefix="sdpms-sqlite-") as workdir:
+        engine, Session = prepare(os.path.join(workdir, "bench.db"), args.desktops, settings)
+        latencies = defaultdict(list)
+        counts = defaultdict(int)
+        locked = defaultdict(int)
+        lock = threading.Lock()
+        stop_at = time.monotonic() + args.duration
+        desktops = models.Desktop.__table__
+
+        def heartbeat(db, rng):
+            db.execute(
+                update(desktops)
+                .where(desktops.c.id == rng.randint(1, args.desktops))
+                .values(last_heartbeat=datetime.utcnow())
+            )
+            db.commit()
+
+        def session_cycle(db, rng):
+            desktop_id = rng.randint(1, args.desktops)
+            session = models.Session(student_id=1, desktop_id=desktop_id, start_time=datetime.utcnow(), is_active=True)
+            db.add(session)
+            db.execute(update(desktops).where(desktops.c.id == desktop_id).values(status="busy"))
+            db.commit()
+            session.is_active = False
+            session.end_time = datetime.utcnow()
+            db.execute(update(desktops).where(desktops.c.id == desktop_id).values(status="available"))
+            db.commit()
+
+        def list_desktops(db, rng):
+            db.execute(select(models.Desktop)).scalars().all()
+            db.rollback()
+
+        def worker(kind, operations, seed):
+            rng = random.Random(seed)
+            with Session() as db:
+                while time.monotonic() < stop_at:
+                    operation = rng.choice(operations)
+                    started = time.perf_counter()
+                    try:
+                        operation(db, rng)
+                    except OperationalError as exc:
+                        db.rollback()
+                        with lock:
+                            locked[kind] += "locked" in str(exc)
+                        continue
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies[kind].append(elapsed)
+                        counts[kind] += 1
+
+        threads = [
+            threading.Thread(target=worker, args=("write", (heartbeat, heartbeat, heartbeat, session_cycle), index))
+            for index in range(args.writers)
+        ] + [
+            threading.Thread(target=worker, args=("read", (list_desktops,), 1000 + index))
+            for index in range(args.readers)
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+        engine.dispose()
+
+    return {
+        "profile": name,
+        "settings": settings.__dict__,
+        "ops_per_second": round(sum(counts.values()) / elapsed, 1),
+        "by_kind": {
+            kind: {
+                "ops": counts[kind],
+                "ops_per_second": round(counts[kind] / elapsed, 1),
+                "locked_errors": locked[kind],
+                "p50_ms": round(percentile(latencies[kind], 0.5) * 1000, 2),
+                "p95_ms": round(percentile(latencies[kind], 0.95) * 1000, 2),
+            }
+            for kind in ("write", "read")
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profile", action="append", choices=sorted(PROFILES), help="default: driver-default and tuned")
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--desktops", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    args = parser.parse_args()
+
+    report = [run_profile(name, PROFILES[name](), args) for name in args.profile or ["driver-default", "tuned"]]
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.json:
+        with open(args.json, "w") as handle:
+            handle.write(text)
+
+
+if __name__ == "__main__":
+    main()
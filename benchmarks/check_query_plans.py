@@ -0,0 +1,162 @@
+"""Query-plan regression check for the session hot paths.
+
+Builds a SQLite database through the migrations, fills it with a semester's
+worth of finished sessions and a few open ones, runs ANALYZE, and then calls
+the real crud, async_crud and liveness code while recording the SQL it sends. Each
+recorded SELECT and UPDATE goes through EXPLAIN QUERY PLAN. The check fails (exit 1)
+when any of them reads the sessions or desktops table with a full scan
+instead of an index.
+
+    python benchmarks/check_query_plans.py
+    python benchmarks/check_query_plans.py --sessions 200000 --json plans.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import event, insert, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from backend import async_crud, crud, migrations, models
+from backend.database import SqliteSettings, create_async_db_engine, create_db_engine
+from backend.liveness import LivenessSweeper
+
+# tables that grow with use and must never be scanned whole on a hot path
+WATCHED_TABLES = ("sessions", "desktops")
+
+
+def seed(engine, desktops: int, students: int, sessions: int, active: int) -> None:
+    rng = random.Random(7)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(models.Desktop.__table__), [
+            {"desktop_id": f"PLAN-{index:04d}", "ip_address": "10.0.0.1", "status": "available",
+             "last_heartbeat": now - timedelta(seconds=rng.randint(0, 600))}
+            for index in range(desktops)
+        ])
+        conn.execute(insert(models.Student.__table__), [
+            {"student_id": f"ugr/{10000 + index}/15", "name": "Plan", "email": f"plan{index}@test",
+             "hashed_password": "x", "is_admin": False}
+            for index in range(students)
+        ])
+        rows = []
+        for index in range(sessions):
+            start = now - timedelta(minutes=rng.randint(90, 60 * 24 * 120))
+            rows.append({"student_id": rng.randint(1, students), "desktop_id": rng.randint(1, desktops),
+                         "start_time": start, "end_time": start + timedelta(minutes=60),
+                         "is_active": False, "duration_minutes": 60})
+        for index in range(active):
+            rows.append({"student_id": index + 1, "desktop_id": index % desktops + 1,
+                         "start_time": now - timedelta(minutes=5), "end_time": None,
+                         "is_active": True, "duration_minutes": 60})
+        conn.execute(insert(models.Session.__table__), rows)
+        conn.execute(text("ANALYZE"))
+
+
+def record_statements(sync_engine, calls: list) -> None:
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE")) and calls:
+            calls[-1]["statements"].append((statement, parameters))
+
+
+def hot_paths(Session, desktop_id: int, student_id: int):
+    yield "crud.get_active_session_by_student", lambda db: crud.get_active_session_by_student(db, student_id)
+    yield "crud.get_active_sessions", crud.get_active_sessions
+    yield "crud.get_desktop_sessions", lambda db: crud.get_desktop_sessions(db, desktop_id)
+    yield "liveness sweep", lambda db: LivenessSweeper(Session, 30, 180).sweep()
+
+
+def async_hot_paths(desktop_id: int, student_id: int):
+    yield "async_crud.get_active_session_by_student", lambda db: async_crud.get_active_session_by_student(db, student_id)
+    yield "async_crud.get_active_sessions", async_crud.get_active_sessions
+
+
+def explain(engine, statement: str, parameters) -> list[str]:
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    return [row[-1] for row in rows]
+
+
+def full_scans(plan: list[str]) -> list[str]:
+    # "SCAN sessions USING INDEX ..." walks an index (a partial one holds only
+    # open sessions); a bare "SCAN sessions" reads every row
+    return [
+        line for line in plan
+        if any(line == f"SCAN {table}" or line.startswith(f"SCAN {table} ") and "INDEX" not in line
+               for table in WATCHED_TABLES)
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--desktops", type=int, default=300)
+    parser.add_argument("--students", type=int, default=5000)
+    parser.add_argument("--sessions", type=int, default=100000, help="finished sessions to seed")
+    parser.add_argument("--active", type=int, default=150, help="open sessions to seed")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    args = parser.parse_args()
+
+    calls: list[dict] = []
+    with tempfile.TemporaryDirectory(prefix="sdpms-plans-") as workdir:
+        url = f"sqlite:///{os.path.join(workdir, 'plans.db')}"
+        engine = create_db_engine(url, SqliteSettings())
+        migrations.upgrade(engine)
+        seed(engine, args.desktops, args.students, args.sessions, args.active)
+        record_statements(engine, calls)
+        Session = sessionmaker(bind=engine, autoflush=False)
+        desktop_id, student_id = 1, 1
+
+        for name, call in hot_paths(Session, desktop_id, student_id):
+            calls.append({"name": name, "statements": []})
+            with Session() as db:
+                call(db)
+
+        async_engine = create_async_db_engine(f"sqlite+aiosqlite:///{os.path.join(workdir, 'plans.db')}",
+                                              SqliteSettings())
+        record_statements(async_engine.sync_engine, calls)
+        AsyncSession = async_sessionmaker(async_engine, expire_on_commit=False)
+
+        async def run_async():
+            for name, call in async_hot_paths(desktop_id, student_id):
+                calls.append({"name": name, "statements": []})
+                async with AsyncSession() as db:
+                    await call(db)
+            await async_engine.dispose()
+
+        asyncio.run(run_async())
+
+        report = []
+        for entry in calls:
+            for statement, parameters in entry["statements"]:
+                plan = explain(engine, statement, parameters)
+                report.append({
+                    "query": entry["name"],
+                    "sql": " ".join(statement.split()),
+                    "plan": plan,
+                    "full_scans": full_scans(plan),
+                })
+        engine.dispose()
+
+    failures = [item for item in report if item["full_scans"]]
+    for item in report:
+        marker = "FULL SCAN" if item["full_scans"] else "ok"
+        print(f"{marker:9} {item['query']}: {' | '.join(item['plan'])}")
+    if args.json:
+        with open(args.json, "w") as handle:
+            handle.write(json.dumps(report, indent=2))
+    if failures:
+        raise SystemExit(f"{len(failures)} hot query plan(s) fall back to a full scan")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""Concurrency stress test for session start.
+
+Many students race to start sessions on a handful of desktops, round after
+round, through crud.start_session (threads) and async_crud.start_session
+(asyncio tasks) against a throwaway SQLite database. After every round it
+checks that no desktop has more than one active session and that every
+successful start left its desktop busy. Each mode then replays a stale end:
+A starts and ends, B starts on the same desktop, A ends its old session
+again, and C must still be refused. The process exits non-zero on any
+double-booking.
+
+--naive runs the same load through the old read-then-write sequence for
+comparison; it is expected to double-book.
+
+    python benchmarks/stress_session_start.py
+    python benchmarks/stress_session_start.py --workers 64 --desktops 4 --rounds 50
+    python benchmarks/stress_session_start.py --naive
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from backend import async_crud, crud, migrations, models, schemas
+from backend.database import SqliteSettings, create_async_db_engine, create_db_engine
+
+
+def naive_start(db, session: schemas.SessionCreate):
+    # the pre-claim sequence: read the status, then write in a separate step
+    desktop = db.get(models.Desktop, session.desktop_id)
+    if desktop is None or desktop.status != "available":
+        return None
+    time.sleep(0.001)
+    db.add(models.Session(**session.model_dump(), start_time=datetime.utcnow(), is_active=True))
+    desktop.status = "busy"
+    db.commit()
+    return desktop
+
+
+def reset(engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(update(models.Session.__table__).values(is_active=False, end_time=datetime.utcnow()))
+        conn.execute(update(models.Desktop.__table__).values(status="available"))
+
+
+def verify(engine) -> dict:
+    sessions = models.Session.__table__
+    desktops = models.Desktop.__table__
+    with engine.connect() as conn:
+        per_desktop = dict(conn.execute(
+            select(sessions.c.desktop_id, func.count())
+            .where(sessions.c.is_active == True)
+            .group_by(sessions.c.desktop_id)
+        ).all())
+        busy = set(conn.scalars(select(desktops.c.id).where(desktops.c.status == "busy")).all())
+    return {
+        "double_booked": sorted(desktop_id for desktop_id, count in per_desktop.items() if count > 1),
+        "busy_without_session": sorted(busy - set(per_desktop)),
+        "session_on_free_desktop": sorted(set(per_desktop) - busy),
+        "active_sessions": sum(per_desktop.values()),
+    }
+
+
+def run_threads(Session, workers: int, desktops: int, student_base: int, naive: bool, rng) -> tuple[int, int]:
+    barrier = threading.Barrier(workers)
+    results = []
+    lock = threading.Lock()
+
+    def worker(index: int) -> None:
+        request = schemas.SessionCreate(
+            student_id=student_base + index, desktop_id=rng.randint(1, desktops), duration_minutes=60
+        )
+        with Session() as db:
+            barrier.wait()
+            try:
+                started = (naive_start if naive else crud.start_session)(db, request)
+            except OperationalError:
+                db.rollback()
+                started = None
+        with lock:
+            results.append(started is not None)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(results), len(results) - sum(results)
+
+
+async def run_tasks(AsyncSession, workers: int, desktops: int, student_base: int, rng) -> tuple[int, int]:
+    gate = asyncio.Event()
+
+    async def worker(index: int) -> bool:
+        request = schemas.SessionCreate(
+            student_id=student_base + index, desktop_id=rng.randint(1, desktops), duration_minutes=60
+        )
+        async with AsyncSession() as db:
+            await gate.wait()
+            try:
+                return await async_crud.start_session(db, request) is not None
+            except OperationalError:
+                await db.rollback()
+                return False
+
+    tasks = [asyncio.create_task(worker(index)) for index in range(workers)]
+    await asyncio.sleep(0)
+    gate.set()
+    results = await asyncio.gather(*tasks)
+    return sum(results), len(results) - sum(results)
+
+
+def request(student_id: int) -> schemas.SessionCreate:
+    return schemas.SessionCreate(student_id=student_id, desktop_id=1, duration_minutes=60)
+
+
+def stale_end_sequence(Session) -> dict:
+    with Session() as db:
+        first = crud.start_session(db, request(900001))
+        crud.end_session(db, first.id)
+        second = crud.start_session(db, request(900002))
+        crud.end_session(db, first.id)
+        third = crud.start_session(db, request(900003))
+    return {"second_started": second is not None, "third_started": third is not None}
+
+
+async def stale_end_sequence_async(AsyncSession) -> dict:
+    async with AsyncSession() as db:
+        first = await async_crud.start_session(db, request(900001))
+        await async_crud.end_session(db, first.id)
+        second = await async_crud.start_session(db, request(900002))
+        await async_crud.end_session(db, first.id)
+        third = await async_crud.start_session(db, request(900003))
+    return {"second_started": second is not None, "third_started": third is not None}
+
+
+def record_stale_end(totals: dict, engine, outcome: dict) -> None:
+    check = verify(engine)
+    totals["stale_end"] = outcome
+    if not outcome["second_started"] or outcome["third_started"] or check["double_booked"] \
+            or check["busy_without_session"] or check["session_on_free_desktop"]:
+        totals["violations"].append({"round": "stale-end", **outcome, **check})
+
+
+def record_round(totals: dict, engine, round_index: int, started: int, rejected: int) -> None:
+    check = verify(engine)
+    totals["started"] += started
+    totals["rejected"] += rejected
+    if check["active_sessions"] != started:
+        check["started_mismatch"] = {"started": started, "active": check["active_sessions"]}
+    if check["double_booked"] or check["busy_without_session"] or check["session_on_free_desktop"] \
+            or "started_mismatch" in check:
+        totals["violations"].append({"round": round_index, **check})
+
+
+async def run_async_rounds(engine, path: str, args, rng) -> dict:
+    # one event loop for every round: the async pool is bound to it
+    async_engine = create_async_db_engine(f"sqlite+aiosqlite:///{path}", SqliteSettings())
+    AsyncSession = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    totals = {"started": 0, "rejected": 0, "violations": []}
+    try:
+        for round_index in range(args.rounds):
+            reset(engine)
+            started, rejected = await run_tasks(
+                AsyncSession, args.workers, args.desktops, round_index * args.workers + 1, rng
+            )
+            record_round(totals, engine, round_index, started, rejected)
+        reset(engine)
+        record_stale_end(totals, engine, await stale_end_sequence_async(AsyncSession))
+    finally:
+        await async_engine.dispose()
+    return totals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=32, help="concurrent starts per round")
+    parser.add_argument("--desktops", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=20, help="rounds per mode")
+    parser.add_argument("--naive", action="store_true", help="use the old read-then-write start")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    report = {"workers": args.workers, "desktops": args.desktops, "rounds": args.rounds, "modes": {}}
+    with tempfile.TemporaryDirectory(prefix="sdpms-start-") as workdir:
+        path = os.path.join(workdir, "stress.db")
+        engine = create_db_engine(f"sqlite:///{path}", SqliteSettings())
+        migrations.upgrade(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(models.Desktop.__table__), [
+                {"desktop_id": f"RACE-{index:03d}", "ip_address": "10.0.0.1", "status": "available"}
+                for index in range(args.desktops)
+            ])
+        Session = sessionmaker(bind=engine, autoflush=False)
+
+        for mode in ["naive"] if args.naive else ["crud", "async_crud"]:
+            if mode == "async_crud":
+                report["modes"][mode] = asyncio.run(run_async_rounds(engine, path, args, rng))
+                continue
+            totals = {"started": 0, "rejected": 0, "violations": []}
+            for round_index in range(args.rounds):
+                reset(engine)
+                started, rejected = run_threads(
+                    Session, args.workers, args.desktops, round_index * args.workers + 1, mode == "naive", rng
+                )
+                record_round(totals, engine, round_index, started, rejected)
+            if mode == "crud":
+                reset(engine)
+                record_stale_end(totals, engine, stale_end_sequence(Session))
+            report["modes"][mode] = totals
+        engine.dispose()
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.json:
+        with open(args.json, "w") as handle:
+            handle.write(text)
+    if any(totals["violations"] for totals in report["modes"].values()):
+        raise SystemExit("double-booking detected")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import api from './api';
+
+// Applies one delta from /desktops/stream to a desktops array
+export function applyDesktopDelta(desktops, delta) {
+  switch (delta.type) {
+    case 'status':
+      return desktops.map((d) =>
+        d.id === delta.desktop_id ? { ...d, status: delta.status } : d
+      );
+    case 'created':
+      return [...desktops.filter((d) => d.id !== delta.desktop.id), delta.desktop];
+    case 'deleted':
+      return desktops.filter((d) => d.id !== delta.desktop_id);
+    default:
+      return desktops;
+  }
+}
+
+// Opens the desktop event stream. EventSource reconnects on its own and the
+// server starts every connection with a full snapshot. Returns a close function.
+export function subscribeDesktops({ onSnapshot, onDelta }) {
+  const source = new EventSource(`${api.defaults.baseURL}/desktops/stream`);
+  source.addEventListener('snapshot', (event) => {
+    onSnapshot(JSON.parse(event.data).desktops);
+  });
+  source.addEventListener('delta', (event) => {
+    onDelta(JSON.parse(event.data));
+  });
+  return () => source.close();
+}
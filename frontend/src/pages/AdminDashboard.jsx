@@ -1,6 +1,7 @@
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { useNavigate, Link } from "react-router-dom";
 import api from "../api";
+import { applyDesktopDelta, subscribeDesktops } from "../desktopFeed";
 import {
   ComputerDesktopIcon,
   ChartBarIcon,
@@ -26,17 +27,43 @@ export default function AdminDashboard() {
     status: "available",
   });
   const navigate = useNavigate();
+  const refreshTimer = useRef(null);
 
   useEffect(() => {
     fetchData();
+    const unsubscribe = subscribeDesktops({
+      onSnapshot: setDesktops,
+      onDelta: (delta) => {
+        setDesktops((current) => applyDesktopDelta(current, delta));
+        // coalesce bursts of changes into one stats/sessions refresh
+        clearTimeout(refreshTimer.current);
+        refreshTimer.current = setTimeout(fetchActivity, 2000);
+      },
+    });
+    return () => {
+      clearTimeout(refreshTimer.current);
+      unsubscribe();
+    };
   }, []);
 
+  const fetchActivity = async () => {
+    try {
+      const [statsRes, sessionsRes] = await Promise.all([
+        api.get("/analytics/stats"),
+        api.get("/sessions/active"),
+      ]);
+      setStats(statsRes.data);
+      setActiveSessions(sessionsRes.data);
+    } catch (err) {
+      console.error("Failed to refresh activity", err);
+    }
+  };
+
   const fetchData = async () => {
     try {
-      const [userRes, statsRes, desktopsRes, sessionsRes] = await Promise.all([
+      const [userRes, statsRes, sessionsRes] = await Promise.all([
         api.get("/me"),
         api.get("/analytics/stats"),
-        api.get("/desktops/"),
         api.get("/sessions/active"),
       ]);
 
@@ -47,7 +74,6 @@ export default function AdminDashboard() {
       }
 
       setStats(statsRes.data);
-      setDesktops(desktopsRes.data);
       setActiveSessions(sessionsRes.data);
     } catch (err) {
       console.error("Failed to fetch data", err);
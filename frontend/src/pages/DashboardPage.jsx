@@ -1,6 +1,7 @@
 import { useEffect, useState, useCallback } from "react";
 import { useNavigate, Link } from "react-router-dom";
 import api from "../api";
+import { applyDesktopDelta, subscribeDesktops } from "../desktopFeed";
 import {
   ComputerDesktopIcon,
   SignalIcon,
@@ -10,6 +11,14 @@ import {
 } from "@heroicons/react/24/outline";
 import clsx from "clsx";
 
+// Desktops are named <lab>-<number>; the waitlist is per lab
+const labOf = (code) => {
+  const cut = code.lastIndexOf("-");
+  return cut > 0 ? code.slice(0, cut) : code;
+};
+
+const RESERVATION_POLL_MS = 15000;
+
 export default function DashboardPage() {
   const [desktops, setDesktops] = useState([]);
   const [user, setUser] = useState(null);
@@ -17,25 +26,24 @@ export default function DashboardPage() {
   const [loading, setLoading] = useState(true);
   const [startingSession, setStartingSession] = useState(null);
   const [sessionDuration, setSessionDuration] = useState(60);
+  const [reservation, setReservation] = useState(null);
   const navigate = useNavigate();
   const pairedDesktopId = localStorage.getItem("paired_desktop_id");
 
+  const fetchSession = useCallback(async () => {
+    try {
+      const sessionRes = await api.get("/sessions/me");
+      setActiveSession(sessionRes.data);
+    } catch {
+      setActiveSession(null);
+    }
+  }, []);
+
   const fetchData = useCallback(async () => {
     try {
-      const [desktopsRes, userRes] = await Promise.all([
-        api.get("/desktops/"),
-        api.get("/me"),
-      ]);
-      setDesktops(desktopsRes.data);
+      const userRes = await api.get("/me");
       setUser(userRes.data);
-
-      // Check for active session
-      try {
-        const sessionRes = await api.get("/sessions/me");
-        setActiveSession(sessionRes.data);
-      } catch {
-        setActiveSession(null);
-      }
+      await fetchSession();
     } catch (error) {
       console.error("Failed to fetch data", error);
       if (error.response?.status === 401) {
@@ -45,7 +53,7 @@ export default function DashboardPage() {
     } finally {
       setLoading(false);
     }
-  }, [navigate]);
+  }, [fetchSession, navigate]);
 
   useEffect(() => {
     if (!pairedDesktopId) {
@@ -53,10 +61,60 @@ export default function DashboardPage() {
       return;
     }
     fetchData();
-    const interval = setInterval(fetchData, 10000); // Poll every 10 seconds
-    return () => clearInterval(interval);
+    // Desktop availability is pushed by the server instead of polled
+    return subscribeDesktops({
+      onSnapshot: setDesktops,
+      onDelta: (delta) => setDesktops((current) => applyDesktopDelta(current, delta)),
+    });
   }, [fetchData, navigate, pairedDesktopId]);
 
+  // The own session can only change when its desktop does
+  const activeDesktopId = activeSession?.desktop_id;
+  const activeDesktopStatus = desktops.find((d) => d.id === activeDesktopId)?.status;
+  useEffect(() => {
+    if (activeDesktopId && activeDesktopStatus && activeDesktopStatus !== "busy") {
+      fetchSession();
+    }
+  }, [activeDesktopId, activeDesktopStatus, fetchSession]);
+
+  const fetchReservation = useCallback(async () => {
+    try {
+      const res = await api.get("/reservations/me");
+      setReservation(res.data);
+    } catch {
+      setReservation(null);
+    }
+  }, []);
+
+  useEffect(() => {
+    fetchReservation();
+  }, [fetchReservation]);
+
+  // Only the own queue entry is polled, and only while there is one
+  const queued = reservation !== null;
+  useEffect(() => {
+    if (!queued) return;
+    const timer = setInterval(fetchReservation, RESERVATION_POLL_MS);
+    return () => clearInterval(timer);
+  }, [queued, fetchReservation]);
+
+  const handleJoinQueue = async (lab) => {
+    try {
+      const res = await api.post("/reservations", { lab });
+      setReservation(res.data);
+    } catch (error) {
+      alert(error.response?.data?.detail || "Failed to join the queue");
+    }
+  };
+
+  const handleLeaveQueue = async () => {
+    try {
+      await api.delete("/reservations/me");
+    } finally {
+      setReservation(null);
+    }
+  };
+
   const handleStartSession = async (desktopId) => {
     setStartingSession(desktopId);
     try {
@@ -120,6 +178,11 @@ export default function DashboardPage() {
   const offlineCount = visibleDesktops.filter(
     (desktop) => desktop.status === "offline",
   ).length;
+  const lab = pairedDesktopId ? labOf(pairedDesktopId) : null;
+  const heldDesktop =
+    reservation?.status === "offered"
+      ? desktops.find((d) => d.id === reservation.desktop_id)
+      : null;
 
   return (
     <div className="min-h-screen bg-gray-900 text-white">
@@ -199,6 +262,44 @@ export default function DashboardPage() {
             </div>
           </div>
 
+          {reservation ? (
+            <div className="mb-6 flex items-center justify-between rounded-xl border border-amber-500/30 bg-amber-500/10 px-4 py-3 text-sm text-amber-200">
+              {reservation.status === "offered" ? (
+                <span>
+                  {heldDesktop?.desktop_id || `Desktop #${reservation.desktop_id}`}{" "}
+                  is held for you until{" "}
+                  {new Date(reservation.hold_expires_at).toLocaleTimeString()}
+                </span>
+              ) : (
+                <span>
+                  Position {reservation.position} in the {reservation.lab} queue
+                  {reservation.estimated_wait_seconds != null &&
+                    ` · about ${Math.ceil(reservation.estimated_wait_seconds / 60)} min`}
+                </span>
+              )}
+              <button
+                onClick={handleLeaveQueue}
+                className="text-amber-300 hover:text-white transition-colors"
+              >
+                Leave queue
+              </button>
+            </div>
+          ) : (
+            lab &&
+            visibleDesktops.length > 0 &&
+            availableCount === 0 && (
+              <div className="mb-6 flex items-center justify-between rounded-xl border border-gray-700 bg-gray-800 px-4 py-3 text-sm text-gray-300">
+                <span>No desktop free right now.</span>
+                <button
+                  onClick={() => handleJoinQueue(lab)}
+                  className="rounded-lg bg-blue-600 px-3 py-1.5 font-semibold text-white hover:bg-blue-500 transition-colors"
+                >
+                  Join the {lab} queue
+                </button>
+              </div>
+            )
+          )}
+
           <div className="grid grid-cols-1 gap-6 sm:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4">
             {visibleDesktops.length > 0 ? (
               visibleDesktops.map((desktop) => (
@@ -22,6 +22,7 @@ export default function RegisterPage() {
   const videoRef = useRef(null);
   const canvasRef = useRef(null);
   const idVerifiedRef = useRef(false);
+  const verificationJobRef = useRef(null);
   const navigate = useNavigate();
 
   const handleChange = (e) => {
@@ -54,7 +55,11 @@ export default function RegisterPage() {
       payload.append("name", formData.name.trim());
       payload.append("email", formData.email.trim());
       payload.append("password", formData.password);
-      payload.append("id_image", idFile);
+      if (verificationJobRef.current) {
+        payload.append("verification_job_id", verificationJobRef.current);
+      } else {
+        payload.append("id_image", idFile);
+      }
 
       await api.post("/students/", payload, {
         headers: { "Content-Type": "multipart/form-data" },
@@ -80,11 +85,22 @@ export default function RegisterPage() {
     await submitRegistration();
   };
 
+  const waitForVerification = async (jobId) => {
+    for (;;) {
+      const response = await api.get(`/students/verify-id/${jobId}`);
+      if (["completed", "failed"].includes(response.data.status)) {
+        return response.data;
+      }
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+    }
+  };
+
   const handleCheckId = async () => {
     setError("");
     setIdCheckMessage("");
     setIdCheckSuccess(false);
     idVerifiedRef.current = false;
+    verificationJobRef.current = null;
 
     if (!idFile) {
       setError("Please upload or capture your university ID");
@@ -105,12 +121,18 @@ export default function RegisterPage() {
       const response = await api.post("/students/verify-id", payload, {
         headers: { "Content-Type": "multipart/form-data" },
       });
+      const job = await waitForVerification(response.data.job_id);
+      if (job.status === "failed") {
+        setIdCheckMessage(job.detail || "ID check failed");
+        return;
+      }
 
-      const matches = !!response.data?.matches;
-      const extractedId = response.data?.extracted_id;
+      const matches = !!job.matches;
+      const extractedId = job.extracted_id;
       if (matches) {
         setIdCheckSuccess(true);
         idVerifiedRef.current = true;
+        verificationJobRef.current = job.job_id;
         setIdCheckMessage("ID verified. You can continue registration.");
         if (extractedId) {
           setFormData((prev) => ({
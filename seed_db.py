@@ -5,10 +5,10 @@ os.chdir(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, '.')
 
 from backend.database import SessionLocal, engine
-from backend import models, crud, schemas
+from backend import models, crud, migrations, schemas
 
-# Create tables
-models.Base.metadata.create_all(bind=engine)
+# Create or upgrade tables
+migrations.upgrade(engine)
 
 db = SessionLocal()
 
@@ -40,14 +40,12 @@ try:
     if not existing:
         manager = crud.create_student(db, manager_data)
         # Set as admin
-        manager.is_admin = True
-        db.commit()
+        manager = crud.set_student_admin(db, manager.id, True)
         print(f"Created manager: {manager.name} ({manager.email}) - ADMIN")
     else:
         print(f"Manager already exists: {existing.email}")
         # Ensure is_admin is True
-        existing.is_admin = True
-        db.commit()
+        crud.set_student_admin(db, existing.id, True)
         print(f"Updated {existing.email} to admin")
     
     # Create some desktops